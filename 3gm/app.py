@@ -8,6 +8,9 @@ from flask import request
 from flask import redirect
 from flask import Markup
 from flask import url_for
+from flask import make_response
+from flask import Response
+from flask import stream_with_context
 from flask_restful import Resource, Api, output_json
 
 # General Imports
@@ -20,7 +23,6 @@ import gensim.models as g
 import logging
 import pprint
 import copy
-import difflib
 logger = logging.getLogger()
 logger.disabled = True
 
@@ -29,10 +31,84 @@ sys.path.insert(0, './')
 
 from codifier import *
 import helpers
+import exporters
 autocomplete_laws = sorted(list(codifier.keys()))
 autocomplete_topics = codifier.topic_keys()
 autocomplete_ = autocomplete_laws + autocomplete_topics
 
+# Prefix index for autocompletion ranked by PageRank
+import autocomplete as autocompletion
+autocomplete_index = autocompletion.AutocompleteIndex(autocomplete_, codifier.ranks)
+MAX_AUTOCOMPLETE_RESULTS = 10
+
+# Cache of rendered laws, invalidated when new versions are written
+import render_cache
+rendered = render_cache.RenderCache()
+codifier.add_version_hook(rendered.invalidate)
+
+# Cache of diffs between versions of laws
+import law_diff
+diff_cache = render_cache.RenderCache(render_cache.DEFAULT_MAX_BYTES // 4)
+codifier.add_version_hook(diff_cache.invalidate)
+
+# Materialized index pages
+import indexes
+index_cache = indexes.IndexCache(codifier.db, {
+    indexes.LEGAL_INDEX: lambda: indexes.build_legal_index(autocomplete_laws),
+    indexes.FULL_INDEX: lambda: indexes.build_full_index(codifier.db)
+})
+
+# Full-text search index, built by the search stage of the build
+import search
+import law_cache
+import threading
+search_index = search.SearchIndex.load()
+search_index_lock = threading.Lock()
+MAX_SEARCH_RESULTS = 100
+
+def get_search_index():
+    global search_index
+    if search_index is None:
+        # Fallback when the search stage has not run, built only once
+        with search_index_lock:
+            if search_index is None:
+                logging.warning('No search index at {}, building it'.format(search.SEARCH_INDEX_PATH))
+                search_index = search.build_search_index(law_cache.iter_laws(codifier.db))
+    return search_index
+
+def update_search_index(identifier):
+    if search_index is not None:
+        search_index.update(codifier.laws[identifier])
+
+codifier.add_version_hook(update_search_index)
+
+# Summaries of the laws listed by the label and history pages
+import summaries
+summary_lookup = summaries.SummaryLookup(codifier.db)
+
+# Laws of a label are served in pages of at most this size
+import topic_index
+MAX_LABEL_PAGE_SIZE = 500
+
+# Doc2vec embeddings of the laws for similar statutes, loaded on first use
+import os
+import embeddings
+EMBEDDINGS_PATH = '../models/embeddings'
+embedding_store = None
+MAX_SIMILAR_STATUTES = 10
+
+def get_embedding_store():
+    global embedding_store
+    if embedding_store is None and os.path.exists(EMBEDDINGS_PATH + '.npy'):
+        embedding_store = embeddings.EmbeddingStore.load(EMBEDDINGS_PATH)
+    return embedding_store
+
+def similar_statutes(identifier):
+    store = get_embedding_store()
+    if store is None or identifier not in store:
+        return []
+    return store.similar(identifier, MAX_SIMILAR_STATUTES)
+
 # NLP Related packages
 import spacy
 import el_small
@@ -85,9 +161,7 @@ class TopicResource(Resource):
     def get(self, statute_type, identifier, year):
         global codifier
         _id = get_id(statute_type, identifier, year)
-        topics = list(codifier.db.topics.find({
-            'statutes': _id
-        }))
+        topics = codifier.get_topics(_id)
         return json.dumps(topics, ensure_ascii=False)
 
 class LinkResource(Resource):
@@ -101,12 +175,49 @@ class SyntaxResource(Resource):
     def get(self, s):
         return syntax.ActionTreeGenerator.generate_action_tree_from_string(s)
 
+class SearchResource(Resource):
+    def get(self, q):
+        results = get_search_index().search(q)[:MAX_SEARCH_RESULTS]
+        return [r._asdict() for r in results]
+
+class LabelResource(Resource):
+    def get(self, label, sorting='rank'):
+        global codifier
+        limit = min(request.args.get('limit', topic_index.DEFAULT_PAGE_SIZE, type=int),
+            MAX_LABEL_PAGE_SIZE)
+        try:
+            refs, cursor, total = codifier.topic_index.page(
+                label, sorting, request.args.get('cursor'), max(1, limit))
+        except (KeyError, ValueError):
+            return {'message': 'Invalid cursor or sorting'}, 400
+        summaries = summary_lookup.get_many(refs)
+        return {
+            'label': label,
+            'sorting': sorting,
+            'total': total,
+            'next_cursor': cursor,
+            'statutes': [{'identifier': x, 'summary': summaries.get(x, '')} for x in refs]
+        }
+
+class CacheStatsResource(Resource):
+    def get(self):
+        global codifier
+        result = {'rendered': rendered.stats()}
+        try:
+            result['laws'] = codifier.laws.stats()
+        except AttributeError:
+            result['laws'] = {'laws': len(codifier.laws)}
+        return result
+
 # Endpoints
 api.add_resource(LawResource, '/get_law/<string:statute_type>/<string:identifier>/<string:year>')
 api.add_resource(HistoryResource, '/get_history/<string:statute_type>/<string:identifier>/<string:year>')
 api.add_resource(LinkResource, '/get_link/<string:statute_type>/<string:identifier>/<string:year>')
 api.add_resource(TopicResource, '/get_topic/<string:statute_type>/<string:identifier>/<string:year>')
 api.add_resource(SyntaxResource, '/get_syntax/<string:s>')
+api.add_resource(SearchResource, '/get_search/<string:q>')
+api.add_resource(CacheStatsResource, '/get_cache_stats')
+api.add_resource(LabelResource, '/get_label/<string:label>', '/get_label/<string:label>/<string:sorting>')
 
 # Application Routes
 @app.route('/syntax', defaults={'js': 'plain'})
@@ -147,12 +258,49 @@ def codification():
 @app.route('/autocomplete', methods=['GET'])
 def autocomplete():
     """Autocomplete in searchbar"""
-    global autocomplete_
-    search = request.args.get('q')
-    match = list(filter(lambda x: x.startswith(search), autocomplete_))
+    global autocomplete_index
+    search = request.args.get('q', '')
+    k = request.args.get('k', MAX_AUTOCOMPLETE_RESULTS, type=int)
+    match = autocomplete_index.complete(search, k=min(k, MAX_AUTOCOMPLETE_RESULTS))
     return jsonify(matching_results=match)
 
 
+@app.route('/search', methods=['GET'])
+def search_phrase():
+    """Search for a phrase in all laws. A query ending
+    with * matches its last word as a prefix"""
+    global codifier
+    query = request.args.get('q', '')
+    results = get_search_index().search(query)
+    total = len(results)
+    results = results[:MAX_SEARCH_RESULTS]
+    paragraphs = []
+    for r in results:
+        try:
+            text = codifier.laws[r.identifier].get_paragraph(r.article, r.paragraph)
+        except KeyError:
+            text = ''
+        paragraphs.append((r, text))
+    return render_template('search.html', query=query, paragraphs=paragraphs, total=total)
+
+
+@app.route('/export_law/<export_type>', methods=['GET'])
+def export_law(export_type):
+    """Stream a law in one of exporters.EXPORT_TYPES"""
+    global codifier
+    identifier = request.args.get('identifier', '')
+    try:
+        law = codifier.laws[identifier]
+        chunks = exporters.iter_law(law, export_type)
+    except BaseException as e:
+        err = str(e)
+        return render_template('error.html', **locals())
+
+    return Response(
+        stream_with_context(chunks),
+        mimetype=exporters.MIMETYPES[export_type] + '; charset=utf-8')
+
+
 @app.route('/codify_law', methods=['POST', 'GET'])
 def codify_law(identifier=None):
     """Displays the current version of the law"""
@@ -172,24 +320,22 @@ def codify_law(identifier=None):
 
     try:
         law = codifier.laws[data['law']]
-        corpus = codifier.get_law(data['law'], export_type='markdown')
+        corpus = render_law(law, 'markdown')
         is_empty = is_empty_statute(corpus)
-        corpus = render_links(corpus)
-        content = Markup(markdown.markdown(corpus))
+        content = Markup(render_law(law, 'html'))
     except BaseException as e:
         err = str(e)
         return render_template('error.html', **locals())
 
-    articles = sorted(law.sentences.keys())
+    articles = sorted(law.get_articles())
 
     try:
-        topics = list(codifier.db.topics.find({
-            'statutes': data['law']
-        }))[0]
-
+        topics = codifier.get_topics(data['law'])[0]
     except IndexError:
         topics = None
 
+    similar = similar_statutes(data['law'])
+
     try:
         rank_txt = str(codifier.ranking[ data['law'] ]) + 'ος'
     except:
@@ -214,7 +360,7 @@ def amendment(identifier=None):
     # amendments
     amendments = []
 
-    articles = sorted(law.sentences.keys())
+    articles = sorted(law.get_articles())
 
     for article in articles:
         for paragraph in law.get_paragraphs(article):
@@ -243,8 +389,6 @@ def links(identifier=None):
         identifier = request.args.get('identifier')
         data = {'law': identifier}
 
-    corpus = codifier.get_law(data['law'], export_type='markdown')
-    corpus = render_links(corpus)
     try:
         law = codifier.laws[data['law']]
     except KeyError:
@@ -259,8 +403,7 @@ def links(identifier=None):
     refs = set([])
     for t, r in links:
         refs |= {r[1]}
-    refs = list(refs)
-    helpers.quicksort(refs, helpers.compare_statutes)
+    refs = sorted(refs, key=helpers.statute_key)
 
     return render_template('links.html', **locals())
 
@@ -271,77 +414,63 @@ def history():
     identifier = request.args.get('identifier')
     history, links = codifier.get_history(identifier)
 
+    amendee_summaries = summary_lookup.get_many(x.amendee for x in history)
+
     # Get as markdown
     for x in history:
-        x.content = x.export_law('markdown')
+        x.content = render_law(x, 'markdown')
         x.is_empty = is_empty_statute(x.content)
-        for y in codifier.db.summaries.find({'_id' : x.amendee}):
-            x.summary = y['summary']
+        if not x.is_empty:
+            x.html = render_law(x, 'html')
+        if x.amendee in amendee_summaries:
+            x.summary = amendee_summaries[x.amendee]
 
     return render_template('history.html', **locals())
 
 
+def render_index_page(name, template):
+    """Serve a materialized index page from the in-process cache.
+    The page is rendered once and answered with 304 Not Modified
+    when the client already holds the current ETag"""
+    global index_cache
+    page = index_cache.get(name)
+    if page.html is None:
+        page.html = render_template(template, **page.index)
+
+    response = make_response(page.html)
+    response.set_etag(page.etag)
+    return response.make_conditional(request)
+
+
 @app.route('/legal_index')
 def legal_index():
     """Displays the index containing only statutes"""
-    global autocomplete_laws
-    indexed_list = autocomplete_laws
-    helpers.quicksort(indexed_list, helpers.compare_statutes)
-
-    current = None
-    toc = []
-    for law in indexed_list:
-        if current == None or helpers.compare_year(law) != current:
-            current = helpers.compare_year(law)
-            toc.append((current, law))
-
-    return render_template('index.html', indexed_list=indexed_list, toc=toc)
+    return render_index_page(indexes.LEGAL_INDEX, 'index.html')
 
 
 @app.route('/full_index')
 def full_index():
     """Displays full linking index"""
-    global codifier
-    full_index = list(codifier.db.links.find())
-    helpers.quicksort(full_index, lambda x, y: helpers.compare_statutes(x['_id'], y['_id']))
-
-    current = None
-    toc = []
-    for law in full_index:
-        if current == None or helpers.compare_year(law['_id']) != current:
-            current = helpers.compare_year(law['_id'])
-            toc.append((current, law['_id']))
-
-    return render_template('full_index.html', full_index=full_index, toc=toc)
+    return render_index_page(indexes.FULL_INDEX, 'full_index.html')
 
 
 @app.route('/label/<label>/<sorting>')
 def label(label, sorting='rank'):
-    """Label search results"""
-    topics = codifier.db.topics.find({
-        'keywords': label
-    })
+    """Label search results, a page at a time"""
+    cursor = request.args.get('cursor')
+    try:
+        postings = codifier.topic_index.statutes_with_keyword(label, sorting)
+        start = postings.offset(cursor) + 1
+    except KeyError:
+        # The cursor is not in the postings any more, start over
+        return redirect(url_for('label', label=label, sorting=sorting))
+    except ValueError:
+        return redirect(url_for('label', label=label, sorting='rank'))
 
-    refs = []
-    for t in topics:
-        refs.extend(t['statutes'])
-    refs = list(set(refs))
+    refs, next_cursor = postings.page(cursor)
+    total = len(postings)
 
-    if sorting == 'rank':
-        def _rank(x):
-            try:
-                return -codifier.ranks[x]
-            except:
-                return 0
-        refs.sort(key=lambda x: _rank(x))
-    elif sorting == 'chronological':
-        helpers.quicksort(refs, helpers.compare_statutes)
-        refs = list(reversed(refs))
-
-    summaries = {}
-    for identifier in refs:
-        for x in codifier.db.summaries.find({'_id' : identifier}):
-            summaries[identifier] = x['summary']
+    summaries = summary_lookup.get_many(refs)
 
     return render_template('label.html', **locals())
 
@@ -364,13 +493,29 @@ def diff():
             initial=data['initial']))
 
     global codifier
-    differ = difflib.Differ()
 
     # Parse args
     identifier = request.args.get('identifier')
     final = request.args.get('final')
     initial = request.args.get('initial')
-    history, links = codifier.get_history(identifier)
+
+    def render():
+        versions, amendees = codifier.get_versions(identifier, {initial, final})
+        for amendee in [initial, final]:
+            if amendee not in versions:
+                raise KeyError('Δεν βρέθηκε η έκδοση {} του {}'.format(amendee, identifier))
+        return '\n'.join(law_diff.diff_laws(versions[initial], versions[final])), amendees
+
+    # The history is only read on a miss. Entries are keyed by the
+    # revision of the stored history, so a rebuild by another process
+    # is picked up as well
+    try:
+        revision = codifier.db.get_fs_revision(identifier)
+        diffs, amendees = diff_cache.get(identifier, revision, (initial, final), render)
+    except BaseException as e:
+        err = str(e)
+        return render_template('error.html', **locals())
+    diffs = diffs.splitlines()
 
     initial_gg_link = gg_link(initial)
     final_gg_link = gg_link(final)
@@ -378,22 +523,9 @@ def diff():
     initial_archive_link = archive_link(initial)
     final_archive_link = archive_link(final)
 
-    # Get as markdown
-    for x in history:
-        if x.amendee == final:
-            try:
-                final_text = x.export_law('issue').splitlines()
-            except:
-                final_text = ['']
-        elif x.amendee == initial:
-            try:
-                initial_text = x.export_law('issue').splitlines()
-            except:
-                initial_text = ['']
-
-    diffs = differ.compare(initial_text, final_text)
-
-    return render_template('diff.html', **locals())
+    return Response(
+        stream_with_context(stream_template('diff.html', **locals())),
+        mimetype='text/html; charset=utf-8')
 
 @app.route('/help')
 def help():
@@ -458,29 +590,43 @@ def render_badges_from_tree(tree):
     return render_badges(tags)
 
 
-@app.template_filter('render_links')
-def render_links(content):
-    search_results = []
-    for entity in entities.LegalEntities.entities:
-        tmp = [(x.group(), x.span()[1]) for x in re.finditer(entity, content)]
-        search_results.extend(tmp)
-    hyperlinks = [to_hyperlink(l[0]) for l in search_results]
-    splitted = helpers.split_index(content, [l[1] for l in search_results])
+def render_law(law, export_type='html'):
+    """Return a law as markdown or as HTML with hyperlinks
+    through the cache of rendered laws
+    :params law : LawParser object
+    :params export_type : markdown or html
+    """
+    global rendered
+    corpus = rendered.get(law.identifier, law.version_index, 'markdown',
+        lambda: law.export_law('markdown'))
+    if export_type == 'markdown':
+        return corpus
 
-    i = 0
-    for x, y in zip(search_results, hyperlinks):
-        splitted[i] = splitted[i].replace(x[0], y)
-        i += 1
+    return rendered.get(law.identifier, law.version_index, 'html',
+        lambda: markdown.markdown(render_links(corpus)))
+
+
+def stream_template(template_name, **context):
+    """Render a template in chunks, for use with stream_with_context"""
+    app.update_template_context(context)
+    stream = app.jinja_env.get_template(template_name).stream(context)
+    stream.enable_buffering(16)
+    return stream
 
-    return ''.join(splitted)
+
+# Links to statutes, precomputed for the statutes of the codifier
+import linkify
+linkifier = linkify.Linkifier(lambda l: url_for('codify_law', identifier=l))
+with app.test_request_context():
+    linkifier.precompute(autocomplete_laws)
+
+@app.template_filter('render_links')
+def render_links(content, link_type='markdown'):
+    return linkifier.render(content, link_type)
 
 # Template filters
 def to_hyperlink(l, link_type='markdown'):
-    u = url_for('codify_law', identifier=l)
-    if link_type == 'html':
-        return '''<a href="{1}">{0}</a>'''.format(l, u)
-    elif link_type == 'markdown':
-        return '[{0}]({1})'.format(l, u)
+    return linkifier.link(l, link_type)
 
 
 @app.template_filter('render_md')
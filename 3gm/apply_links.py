@@ -28,8 +28,9 @@ def apply_links(identifier, rollback=True):
         except:
             print('No applied links found')
 
-    # Get information from codifier object
-    law = codifier.codifier.laws[identifier]
+    # Get information from codifier object, the law is modified in place
+    # and kept in memory until apply_all_links stores it
+    law = codifier.codifier.pin_law(identifier)
     links = codifier.codifier.links[identifier]
     links.sort()
 
@@ -113,7 +114,7 @@ def apply_all_links(identifiers=None):
     if identifiers == None:
         identifiers = list(codifier.codifier.laws.keys())
 
-    helpers.quicksort(identifiers, helpers.compare_statutes)
+    identifiers = sorted(identifiers, key=helpers.statute_key)
 
     # initialize stats
     detection_accurracy = []
@@ -150,11 +151,23 @@ def apply_all_links(identifiers=None):
                 '_id' : identifier,
                 'versions' : [final_serializable['versions'][-1]]
             }
+            stored = False
             try:
                 codifier.codifier.db.laws.save(latest)
+                stored = True
             except:
                 print('MongoDB Error in storing current version')
 
+            # Notify caches holding the previous version
+            try:
+                codifier.codifier.laws[identifier].version_index = \
+                    int(latest['versions'][0]['_version'])
+            except KeyError:
+                pass
+            if stored:
+                codifier.codifier.unpin_law(identifier)
+            codifier.codifier.commit_version(identifier)
+
             # Store versioning history to fs
             try:
                 codifier.codifier.db.save_json_to_fs(identifier, final_serializable)
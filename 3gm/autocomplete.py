@@ -0,0 +1,80 @@
+'''
+    Autocomplete index for the search bar.
+    Keys (statutes, links and topic keywords) are normalized, i.e.
+    lowercased with accents removed, and kept in a sorted array so that
+    the completions of a prefix are a contiguous range found by bisection.
+    Completions are ranked by PageRank.
+'''
+
+import bisect
+import re
+import unicodedata
+import numpy as np
+
+# Blocks of combining diacritical marks
+COMBINING_REGEX = re.compile('[\u0300-\u036f\u1ab0-\u1aff\u1dc0-\u1dff\u20d0-\u20ff\ufe20-\ufe2f]')
+
+
+def normalize(s):
+    """Lowercase a string and strip accents and diaeresis,
+    e.g. 'Νόμος' and 'νομος' both become 'νομοσ'"""
+    s = COMBINING_REGEX.sub('', unicodedata.normalize('NFD', s.lower()))
+    return ' '.join(s.replace('ς', 'σ').split())
+
+
+class AutocompleteIndex:
+    """Prefix index over a sorted array of normalized keys"""
+
+    # Upper bound for all characters following a prefix
+    sentinel = '\U0010ffff'
+
+    def __init__(self, keys, ranks=None):
+        """Build the index
+        :params keys : Iterable of strings to be completed
+        :params ranks : Dict from key to score (e.g. codifier.ranks)
+        """
+        if ranks is None:
+            ranks = {}
+
+        entries = sorted((normalize(k), k) for k in set(keys))
+        self.normalized = [n for n, k in entries]
+        self.keys = [k for n, k in entries]
+        self.ranks = np.array([ranks.get(k, 0.0) for k in self.keys],
+                              dtype=np.float64)
+
+        # Position of each key when ordered by rank (highest first) with
+        # ties in alphabetical order. Priorities are unique so the top-k
+        # of any range is well defined.
+        n = len(self.keys)
+        order = np.lexsort((np.arange(n), -self.ranks))
+        self.priority = np.empty(n, dtype=np.int64)
+        self.priority[order] = np.arange(n)
+
+    def __len__(self):
+        """Returns the number of keys"""
+        return len(self.keys)
+
+    def prefix_range(self, prefix):
+        """Return the [lo, hi) range of keys starting with prefix"""
+        q = normalize(prefix)
+        lo = bisect.bisect_left(self.normalized, q)
+        hi = bisect.bisect_left(self.normalized, q + self.sentinel, lo)
+        return lo, hi
+
+    def complete(self, prefix, k=10):
+        """Return the top-k keys starting with prefix by rank
+        :params prefix : The text typed so far
+        :params k : Maximum number of results
+        """
+        lo, hi = self.prefix_range(prefix)
+        if hi - lo <= 0 or k <= 0:
+            return []
+
+        priority = self.priority[lo:hi]
+        if hi - lo > k:
+            top = np.argpartition(priority, k - 1)[:k]
+        else:
+            top = np.arange(hi - lo)
+
+        top = top[np.argsort(priority[top])]
+        return [self.keys[lo + i] for i in top.tolist()]
@@ -0,0 +1,937 @@
+#!/usr/bin/env python3
+# Benchmarks for performance critical parts of the codifier
+# usage: benchmarks.py [benchmark [argument ...]]
+# Running without arguments runs every benchmark
+
+import sys
+import time
+import random
+import collections
+
+
+def timeit(fn, *args, repeat=3, **kwargs):
+    """Return the best wall time of fn over repeat runs and its result"""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def report(name, baseline, candidate):
+    """Print timings of a baseline and a candidate implementation"""
+    speedup = baseline / candidate if candidate > 0 else float('inf')
+    print('{:<40} baseline {:>9.4f}s  new {:>9.4f}s  speedup {:>7.1f}x'.format(
+        name, baseline, candidate, speedup))
+
+
+def random_graph(n, m, seed=0):
+    """Random undirected graph as an adjacency dict of sets"""
+    rng = random.Random(seed)
+    graph = collections.defaultdict(set)
+    for _ in range(m):
+        u, v = rng.randrange(n), rng.randrange(n)
+        graph[u] |= {v}
+        graph[v] |= {u}
+    for u in range(n):
+        graph[u]
+    return graph
+
+
+def bench_connected_components(sizes=((10 ** 4, 10 ** 4), (10 ** 5, 10 ** 5), (10 ** 6, 10 ** 6))):
+    """Connected components: helpers (BFS) against graph_utils (union-find)"""
+    import helpers
+    import graph_utils
+
+    for n, m in sizes:
+        graph = random_graph(n, m)
+        t_old, old = timeit(helpers.connected_components, graph, repeat=1)
+        t_new, new = timeit(graph_utils.connected_components, graph, repeat=1)
+        assert sorted(map(sorted, old)) == sorted(map(sorted, new))
+        report('connected_components n={} m={}'.format(n, m), t_old, t_new)
+
+        t_old, old = timeit(helpers.get_edges, graph, repeat=1)
+        t_new, new = timeit(graph_utils.get_edges, graph, repeat=1)
+        assert set(old) == set(new)
+        report('get_edges n={} m={}'.format(n, m), t_old, t_new)
+
+        t_arr, (vertices, edges) = timeit(graph_utils.edge_array, graph, repeat=1)
+        t_lbl, _ = timeit(graph_utils.label_components, edges, len(vertices), repeat=1)
+        print('{:<40} edge_array {:.4f}s  label_components {:.4f}s'.format(
+            '', t_arr, t_lbl))
+
+
+def random_identifiers(n, seed=0):
+    """Random statute identifiers in the forms found in the link index"""
+    rng = random.Random(seed)
+    types = ['ν.', 'ν.', 'ν.', 'π.δ.', 'ν.δ.']
+    result = []
+    for _ in range(n):
+        year = rng.randrange(1950, 2019)
+        if rng.random() < 0.02:
+            result.append('πράξη νομοθετικού περιεχομένου {}.{}.{}'.format(
+                rng.randrange(1, 29), rng.randrange(1, 13), year))
+        else:
+            result.append('{} {}/{}'.format(
+                rng.choice(types), rng.randrange(1, 4600), year))
+    return result
+
+
+def bench_sort_statutes(n=30000):
+    """Sorting the link index: helpers.quicksort against sorted with statute_key"""
+    import helpers
+
+    def _quicksort(links):
+        links = list(links)
+        helpers.quicksort(links, lambda x, y: helpers.compare_statutes(x['_id'], y['_id']))
+        return links
+
+    def _sorted(links):
+        return sorted(links, key=lambda x: helpers.statute_key(x['_id']))
+
+    # Acts by date cannot be compared by compare_statutes
+    ids = [x for x in random_identifiers(n) if '/' in x]
+    links = [{'_id': x, 'links_to': []} for x in ids]
+
+    t_old, old = timeit(_quicksort, links)
+    helpers.statute_key.cache_clear()
+    helpers.StatuteId.parse.cache_clear()
+    t_new, new = timeit(_sorted, links, repeat=1)
+    # compare_statutes does not order different non-law types consistently
+    assert [helpers.statute_key(x['_id'])[:2] for x in old] == \
+        [helpers.statute_key(x['_id'])[:2] for x in new]
+    report('sort link index n={} (cold cache)'.format(len(links)), t_old, t_new)
+
+    t_new, new = timeit(_sorted, links)
+    report('sort link index n={} (warm cache)'.format(len(links)), t_old, t_new)
+
+    # Already sorted input is the worst case of the recursive quicksort
+    try:
+        t_old, _ = timeit(_quicksort, new, repeat=1)
+    except RecursionError:
+        t_old = float('nan')
+        print('quicksort on sorted input: RecursionError')
+    t_new, _ = timeit(_sorted, new)
+    report('sort sorted link index n={}'.format(len(links)), t_old, t_new)
+
+
+def bench_autocomplete(n=40000, sessions=200, qps=50):
+    """Autocomplete: filter with startswith against the prefix index.
+    Every typing session issues a request per keystroke."""
+    import autocomplete
+
+    rng = random.Random(0)
+    alphabet = 'αβγδεζηθικλμνξοπρστυφχψω'
+    keys = random_identifiers(n) + [
+        ''.join(rng.choice(alphabet) for _ in range(rng.randrange(4, 12)))
+        for _ in range(n // 10)]
+    ranks = {k: rng.random() for k in keys if rng.random() < 0.5}
+
+    start = time.perf_counter()
+    index = autocomplete.AutocompleteIndex(keys, ranks)
+    print('{:<40} build {:.4f}s for {} keys'.format('', time.perf_counter() - start, len(index)))
+
+    queries = []
+    for _ in range(sessions):
+        key = rng.choice(keys)
+        queries.extend(key[:i] for i in range(1, len(key) + 1))
+
+    def _latencies(fn):
+        latencies = []
+        for q in queries:
+            start = time.perf_counter()
+            fn(q)
+            latencies.append(time.perf_counter() - start)
+        latencies.sort()
+        return latencies
+
+    old = _latencies(lambda q: list(filter(lambda x: x.startswith(q), keys)))
+    new = _latencies(lambda q: index.complete(q, k=10))
+
+    for name, latencies in [('filter', old), ('index', new)]:
+        p50 = latencies[len(latencies) // 2]
+        p99 = latencies[int(len(latencies) * 0.99)]
+        print('{:<40} {} queries p50 {:.3f}ms p99 {:.3f}ms, {:.1f}% of a core at {} qps'.format(
+            name, len(latencies), 1000 * p50, 1000 * p99,
+            100 * qps * sum(latencies) / len(latencies), qps))
+    report('autocomplete n={}'.format(len(keys)), sum(old), sum(new))
+
+
+def synthetic_law(identifier='ν. 1000/2000', articles=300, paragraphs=5, periods=4, seed=0,
+                  words=None):
+    """A LawParser with random text for benchmarking"""
+    import pparser as parser
+
+    rng = random.Random(seed)
+    if words is None:
+        words = ['διάταξη', 'άρθρο', 'νόμος', 'υπουργός', 'απόφαση', 'ισχύ',
+                 'παράγραφος', 'ρύθμιση', 'δημόσιο', 'προθεσμία', 'σύμβαση']
+    law = parser.LawParser(identifier)
+    for a in range(1, articles + 1):
+        law.sentences[str(a)] = {
+            str(p): [' '.join(rng.choice(words) for _ in range(rng.randrange(8, 30)))
+                     for _ in range(periods)]
+            for p in range(1, paragraphs + 1)}
+        law.titles[str(a)] = ' '.join(rng.choice(words) for _ in range(5))
+    return law
+
+
+def synthetic_trees(law, n, seed=0):
+    """Random amendment trees applicable to law"""
+    rng = random.Random(seed)
+    trees = []
+    for i in range(n):
+        article = str(rng.randrange(1, len(law.sentences) + 1))
+        paragraph = str(rng.randrange(1, 6))
+        kind = i % 3
+        if kind == 0:
+            trees.append({'root': {'action': 'αντικαθίσταται'},
+                          'what': {'context': 'εδάφιο', 'content': 'νέο εδάφιο {}'.format(i)},
+                          'article': {'_id': article}, 'paragraph': {'_id': paragraph},
+                          'period': {'_id': '1'}})
+        elif kind == 1:
+            trees.append({'root': {'action': 'προστίθεται'},
+                          'what': {'context': 'εδάφιο', 'content': 'προστιθέμενο εδάφιο {}'.format(i)},
+                          'article': {'_id': article}, 'paragraph': {'_id': paragraph},
+                          'period': {'_id': 'end'}})
+        else:
+            trees.append({'root': {'action': 'αντικαθίσταται'},
+                          'what': {'context': 'παράγραφος',
+                                   'content': '{}. Νέα παράγραφος {}. Δεύτερο εδάφιο'.format(paragraph, i)},
+                          'article': {'_id': article}, 'paragraph': {'_id': paragraph}})
+    return trees
+
+
+def bench_apply_amendments(n=2000, per_version=10):
+    """Applying amendments to a heavily amended law the way apply_links does:
+    serializing after every mutation against serializing at version boundaries"""
+    import copy
+
+    def _apply(serialize_each):
+        law = synthetic_law()
+        law.autoincrement_version = serialize_each
+        versions = []
+        for i, tree in enumerate(synthetic_trees(law, n)):
+            law.query_from_tree(tree)
+            if serialize_each:
+                law.serialize()
+            if (i + 1) % per_version == 0:
+                versions.append(copy.deepcopy(law.serialize()))
+        return versions
+
+    t_old, old = timeit(_apply, True)
+    t_new, new = timeit(_apply, False)
+    assert [v['articles'] for v in old] == [v['articles'] for v in new]
+    report('apply {} amendments'.format(n), t_old, t_new)
+
+
+def bench_law_memory(snapshot=None, n=50):
+    """Memory held by loaded laws: dict of lists against CompactSentences.
+    With snapshot (a mongoexport of the laws collection, one document per
+    line) every law of the corpus is loaded as the codifier would load it,
+    else n synthetic laws stand in for the corpus"""
+    import gc
+    import tracemalloc
+    import law_cache
+
+    def _load(compact):
+        laws = []
+        if snapshot is not None:
+            # The documents are parsed inside the measurement and dropped,
+            # as when the codifier reads them from the database
+            loader = law_cache.SnapshotLawLoader.from_file(snapshot)
+            for identifier in loader.ids():
+                law = loader.load(identifier)
+                if compact:
+                    law.compact()
+                laws.append(law)
+            return laws
+
+        for i in range(int(n)):
+            law = synthetic_law('ν. {}/2000'.format(i + 1), articles=60, seed=i)
+            law = law.from_serialized(law.serialize())[0]
+            if compact:
+                law.compact()
+            laws.append(law)
+        return laws
+
+    sizes = {}
+    for compact in [False, True]:
+        gc.collect()
+        tracemalloc.start()
+        laws = _load(compact)
+        gc.collect()
+        sizes[compact] = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        if compact:
+            t_new, new = timeit(lambda: [x.export_law('markdown') for x in laws])
+        else:
+            t_old, old = timeit(lambda: [x.export_law('markdown') for x in laws])
+        del laws
+
+    assert old == new
+    if snapshot is not None:
+        name = '{} laws of {}'.format(len(old), snapshot)
+    else:
+        name = '{} synthetic laws'.format(n)
+    print('{:<40} dict {:.1f}MiB  compact {:.1f}MiB  ratio {:.1f}x'.format(
+        name, sizes[False] / 2 ** 20, sizes[True] / 2 ** 20,
+        sizes[False] / sizes[True]))
+    report('export to markdown', t_old, t_new)
+
+
+def bench_lazy_laws(n=200, requests=1000, cache_size=32):
+    """Loading every law on startup against loading laws on first access,
+    with requests for laws drawn from a Zipf-like distribution"""
+    import law_cache
+
+    documents = []
+    for i in range(n):
+        law = synthetic_law('ν. {}/2000'.format(i + 1), articles=30, seed=i)
+        version = law.serialize()
+        version['_version'] = 0
+        documents.append({'_id': law.identifier, 'versions': [version]})
+    loader = law_cache.SnapshotLawLoader(documents)
+
+    rng = random.Random(0)
+    weights = [1 / (i + 1) for i in range(n)]
+    queries = rng.choices(loader.ids(), weights=weights, k=requests)
+
+    def _eager():
+        laws = {}
+        for identifier in loader.ids():
+            laws[identifier] = loader.load(identifier).compact()
+        return laws
+
+    def _serve(laws):
+        return [laws[q].get_paragraph('1', '1') for q in queries]
+
+    t_old, eager = timeit(_eager, repeat=1)
+    t_new, lazy = timeit(law_cache.LazyLaws, loader, cache_size=cache_size, repeat=1)
+    report('startup with {} laws'.format(n), t_old, t_new)
+
+    t_old, old = timeit(_serve, eager, repeat=1)
+    t_new, new = timeit(_serve, lazy, repeat=1)
+    assert old == new
+    report('{} requests'.format(requests), t_old, t_new)
+
+    stats = lazy.stats()
+    print('{:<40} eager {:.1f}MiB  lazy {:.1f}MiB  hit rate {:.1%}'.format(
+        'text in memory', sum(law_cache.law_size(x) for x in eager.values()) / 2 ** 20,
+        stats['bytes'] / 2 ** 20, stats['hit_rate']))
+
+
+def phrase_amendments(filename=None, n=2000, seed=0):
+    """(old phrase, new phrase) pairs from the output of
+    LawCodifier.export_phrase_links, or synthetic ones"""
+    import phrase_fun
+
+    if filename:
+        with open(filename) as f:
+            lines = f.read().splitlines()
+    else:
+        rng = random.Random(seed)
+        words = ['διάταξη', 'άρθρο', 'νόμος', 'υπουργός', 'απόφαση', 'ισχύ',
+                 'παράγραφος', 'ρύθμιση', 'δημόσιο', 'προθεσμία', 'σύμβαση']
+        lines = ['Στην παρ. 1 η φράση «{}» αντικαθίσταται από τη φράση «{}»'.format(
+            ' '.join(rng.choice(words) for _ in range(rng.randrange(1, 5))),
+            ' '.join(rng.choice(words) for _ in range(rng.randrange(1, 5))))
+            for _ in range(n)]
+
+    pairs = []
+    for line in lines:
+        old_phrase = phrase_fun.detect_phrase_content(' ' + line)
+        new_phrase = phrase_fun.detect_phr_replacement(line)
+        if old_phrase:
+            pairs.append((old_phrase, new_phrase))
+    return pairs
+
+
+def bench_phrase_edits(filename=None, periods=40):
+    """Phrase replacements on a paragraph: join, re.sub and re-split
+    against PeriodIndex. Pass the output of export_phrase_links
+    as argument to use real amendments."""
+    import re
+    import tokenizer
+    import phrase_fun
+
+    def _old(s, old_phrase, new_phrase):
+        # Former implementation, with the phrase escaped so that it runs
+        joined = '. '.join(s)
+        joined = re.sub(re.escape(old_phrase), new_phrase.replace('\\', '\\\\'), joined)
+        return tokenizer.tokenizer.split(joined, False, '. ')
+
+    pairs = phrase_amendments(filename)
+    law = synthetic_law(articles=len(pairs), paragraphs=1, periods=periods)
+
+    # Every paragraph contains the phrase it is amended with
+    paragraphs = []
+    for (old_phrase, new_phrase), article in zip(pairs, law.get_articles_sorted()):
+        s = list(law.sentences[article]['1'])
+        s[len(s) // 2] += ' ' + old_phrase
+        paragraphs.append((s, old_phrase, new_phrase))
+
+    def _apply(fn):
+        return [fn(s, o, n) for s, o, n in paragraphs]
+
+    t_old, old = timeit(_apply, _old)
+    t_new, new = timeit(_apply, phrase_fun.replace_phrase)
+    mismatches = sum(a != b for a, b in zip(old, new))
+    print('{:<40} {:.0f} -> {:.0f} edits/s, {} results differ'.format(
+        '', len(pairs) / t_old, len(pairs) / t_new, mismatches))
+    report('{} phrase edits'.format(len(pairs)), t_old, t_new)
+
+
+def bench_search(n=50, queries=20):
+    """Phrase search: scanning every exported law against the search index"""
+    import search
+    from autocomplete import normalize
+
+    rng = random.Random(0)
+    alphabet = 'αβγδεζηθικλμνξοπρστυφχψωάέήίόύώ'
+    words = [''.join(rng.choice(alphabet) for _ in range(rng.randrange(3, 12)))
+             for _ in range(5000)]
+
+    laws = {}
+    for i in range(n):
+        law = synthetic_law('ν. {}/2000'.format(i + 1), articles=50, seed=i, words=words)
+        laws[law.identifier] = law
+
+    start = time.perf_counter()
+    index = search.build_search_index(laws)
+    print('{:<40} build {:.4f}s for {} laws'.format('', time.perf_counter() - start, n))
+
+    phrases = []
+    for _ in range(queries):
+        law = laws[rng.choice(list(laws))]
+        words = law.get_paragraph(str(rng.randrange(1, 51)), '1').split()
+        k = rng.randrange(len(words) - 3)
+        phrases.append(' '.join(words[k:k + 3]))
+
+    def _scan():
+        return [sorted(x for x, law in laws.items()
+                       if normalize(q) in normalize(law.export_law('str')))
+                for q in phrases]
+
+    def _index():
+        return [sorted(index.laws_containing(q)) for q in phrases]
+
+    t_old, old = timeit(_scan, repeat=1)
+    t_new, new = timeit(_index)
+    # The scan also matches across paragraph boundaries
+    assert all(set(b) <= set(a) for a, b in zip(old, new))
+    report('{} phrase queries over {} laws'.format(queries, n), t_old, t_new)
+
+
+def bench_linkify(articles=(300, 1000), mentions=0.2):
+    """Hyperlinks in rendered laws: one finditer per statute pattern with
+    split_index and str.replace against the single-pass Linkifier"""
+    import re
+    import entities
+    import helpers
+    import linkify
+
+    from flask import Flask, url_for
+
+    app = Flask(__name__)
+    app.add_url_rule('/codify_law', 'codify_law', lambda: '')
+
+    def _url(l):
+        return url_for('codify_law', identifier=l)
+
+    def _old(content):
+        # Former app.render_links
+        search_results = []
+        for entity in entities.LegalEntities.entities:
+            tmp = [(x.group(), x.span()[1]) for x in re.finditer(entity, content)]
+            search_results.extend(tmp)
+        hyperlinks = ['[{0}]({1})'.format(l[0], _url(l[0])) for l in search_results]
+        splitted = helpers.split_index(content, [l[1] for l in search_results])
+
+        i = 0
+        for x, y in zip(search_results, hyperlinks):
+            splitted[i] = splitted[i].replace(x[0], y)
+            i += 1
+
+        return ''.join(splitted)
+
+    rng = random.Random(0)
+    # split_index expects sorted matches, so only laws are mentioned
+    statutes = [x for x in random_identifiers(2000) if x.startswith('ν. ') and len(x) == 12]
+    for n in articles:
+        law = synthetic_law(articles=n)
+        for paragraphs in law.sentences.values():
+            for periods in paragraphs.values():
+                for i in range(len(periods)):
+                    if rng.random() < mentions:
+                        periods[i] += ' του ' + rng.choice(statutes)
+        content = law.export_law('markdown')
+
+        linkifier = linkify.Linkifier(_url)
+        with app.test_request_context():
+            t_old, old = timeit(_old, content)
+            t_new, new = timeit(lambda: linkify.Linkifier(_url).render(content))
+            t_warm, _ = timeit(linkifier.render, content)
+        assert old == new
+        report('linkify {} articles ({} KiB)'.format(n, len(content) // 1024), t_old, t_new)
+        report('linkify {} articles, memoized links'.format(n), t_old, t_warm)
+
+
+def bench_export_corpus(n=50, articles=300):
+    """Exporting the corpus in str format: building every law with
+    repeated string concatenation against streaming it to the file"""
+    import os
+    import tempfile
+    import tracemalloc
+    import exporters
+
+    def _concatenate(law, export_type):
+        # Former LawParser.export_law for str and markdown
+        if export_type == 'str':
+            result = ''
+            for article in law.get_articles_sorted():
+                result = result + 'Άρθρο {} '.format(article)
+                for i, paragraph in enumerate(law.get_paragraphs(article)):
+                    result = result + '{}'.format(paragraph)
+        else:
+            result = '# {}\n'.format(law.identifier)
+            for article in law.get_articles_sorted():
+                result = result + '### Άρθρο {} \n'.format(article)
+                try:
+                    result = result + '#### {}\n'.format(law.titles[article])
+                except:
+                    pass
+                for i, paragraph in enumerate(law.get_paragraphs(article)):
+                    result = result + ' {}. {}\n'.format(i, paragraph)
+        return result
+
+    laws = {}
+    for i in range(n):
+        law = synthetic_law('ν. {}/2000'.format(i + 1), articles=articles, seed=i)
+        laws[law.identifier] = law
+
+    outfile = os.path.join(tempfile.mkdtemp(), 'corpus.txt')
+
+    def _old(export_type):
+        with open(outfile, 'w+') as f:
+            for law in laws.values():
+                f.write(_concatenate(law, export_type) + '\n')
+
+    def _new(export_type):
+        with open(outfile, 'w+') as f:
+            exporters.export_corpus(laws, f, export_type)
+
+    def _peak(fn, export_type):
+        tracemalloc.start()
+        fn(export_type)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return peak / 2 ** 20
+
+    for export_type in ['str', 'markdown']:
+        t_old, _ = timeit(_old, export_type)
+        with open(outfile) as f:
+            old = f.read()
+        t_new, _ = timeit(_new, export_type)
+        with open(outfile) as f:
+            new = f.read()
+        assert old == new
+        report('export {} laws as {} ({} MiB)'.format(
+            n, export_type, len(new) // 2 ** 20), t_old, t_new)
+        print('{:<40} peak memory {:.2f}MiB -> {:.2f}MiB'.format(
+            '', _peak(_old, export_type), _peak(_new, export_type)))
+    os.remove(outfile)
+
+
+def bench_sentence_corpus(n=40, articles=300):
+    """Word2vec input: a list of every period of the codex against
+    sentence shards exported in parallel and streamed from disk"""
+    import multiprocessing
+    import shutil
+    import tempfile
+    import tracemalloc
+    import corpus
+
+    laws = {}
+    for i in range(n):
+        law = synthetic_law('ν. {}/2000'.format(i + 1), articles=articles, seed=i)
+        laws[law.identifier] = law.compact()
+
+    def _list():
+        # Former train_word2vec, with tokenized periods
+        all_sentences = []
+        for law in laws.values():
+            for article in law.sentences.keys():
+                for par in law.sentences[article]:
+                    for per in law.sentences[article][par]:
+                        all_sentences.append(corpus.tokenize(per))
+        return sum(len(x) for x in all_sentences)
+
+    def _shards(processes):
+        directory = tempfile.mkdtemp()
+        try:
+            paths = corpus.export_shards(laws, directory, processes=processes)
+            return sum(len(x) for x in corpus.SentenceCorpus(paths))
+        finally:
+            shutil.rmtree(directory)
+
+    def _peak(fn, *args):
+        tracemalloc.start()
+        fn(*args)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return peak / 2 ** 20
+
+    # The list thaws the compacted laws, so it runs last
+    processes = max(1, multiprocessing.cpu_count() - 1)
+    t_new, new = timeit(_shards, processes, repeat=1)
+    m_new = _peak(_shards, 1)
+    t_old, old = timeit(_list, repeat=1)
+    m_old = _peak(_list)
+    assert old == new
+    report('{} words, {} processes'.format(new, processes), t_old, t_new)
+    print('{:<40} peak memory {:.1f}MiB -> {:.2f}MiB'.format('', m_old, m_new))
+
+
+def bench_doc2vec(n=400, articles=30, epochs=2):
+    """Doc2vec training input: TaggedDocuments materialized in a list
+    against a streamed TaggedCorpus and corpus_file mode"""
+    import os
+    import shutil
+    import tempfile
+    import tracemalloc
+    import corpus
+    import train_doc2vec
+
+    directory = tempfile.mkdtemp()
+    laws = {}
+    for i in range(n):
+        law = synthetic_law('ν. {}/2000'.format(i + 1), articles=articles, seed=i)
+        laws[law.identifier] = law
+    paths = corpus.export_shards(laws, directory, corpus.DOCUMENTS, processes=1)
+    corpus_file = os.path.join(directory, 'corpus.txt')
+    labels_file = os.path.join(directory, 'labels.txt')
+    corpus.merge_shards(paths, corpus_file, labels_file)
+
+    def _list():
+        # Former train_doc2vec.py
+        from gensim.models.doc2vec import TaggedDocument
+        with open(labels_file, 'r') as f:
+            labels = f.read().splitlines()
+        with open(corpus_file, 'r') as f:
+            docs = f.read().splitlines()
+        return [TaggedDocument(words=corpus.clean(doc), tags=[label])
+                for label, doc in zip(labels, docs)]
+
+    def _peak(fn):
+        tracemalloc.start()
+        for _ in fn():
+            pass
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return peak / 2 ** 20
+
+    streamed = corpus.TaggedCorpus(corpus_file, labels_file, tokenize=True)
+    mapped = corpus.TaggedCorpus(corpus_file, labels_file, tokenize=True, use_mmap=True)
+    assert _list() == list(streamed) == list(mapped)
+    print('{:<40} list {:.1f}MiB  streamed {:.2f}MiB  mmap {:.2f}MiB'.format(
+        'peak memory of the corpus', _peak(_list), _peak(lambda: streamed), _peak(lambda: mapped)))
+
+    params = {'size': 50, 'iter': epochs, 'min_count': 2}
+    model = os.path.join(directory, 'model.bin')
+    t_list, _ = timeit(lambda: train_doc2vec.g.Doc2Vec(
+        _list(), **train_doc2vec.doc2vec_params(**params)), repeat=1)
+    t_stream, _ = timeit(train_doc2vec.train, corpus_file, model, labels_file,
+                         tokenize=True, repeat=1, **params)
+    t_file, _ = timeit(train_doc2vec.train, corpus_file, model, labels_file,
+                       tokenize=True, corpus_file=True, repeat=1, **params)
+    report('doc2vec streamed, {} workers'.format(train_doc2vec.worker_count), t_list, t_stream)
+    report('doc2vec corpus_file, {} workers'.format(train_doc2vec.worker_count), t_list, t_file)
+    shutil.rmtree(directory)
+
+
+def bench_similar_statutes(n=50000, dimension=100, queries=200, scanned=3, k=10):
+    """Similar statutes: scanning the pickled dict of label_embeddings.py
+    against batched top k over the EmbeddingStore and its LSH index.
+    Timings are per query; the scan runs on the first `scanned` queries."""
+    import math
+    import numpy as np
+    import embeddings
+
+    n, queries, scanned = int(n), int(queries), int(scanned)
+    rng = np.random.RandomState(0)
+    # Clustered vectors, as laws on the same subject are
+    centers = rng.standard_normal((n // 50, dimension))
+    vectors = centers[rng.randint(len(centers), size=n)] + 0.5 * rng.standard_normal((n, dimension))
+    ids = ['ν. {}/2000'.format(i + 1) for i in range(n)]
+    legacy = {}
+    for label, vector in zip(ids, vectors):
+        legacy[label] = tuple(float(x) for x in vector)
+        legacy[legacy[label]] = label
+    store = embeddings.EmbeddingStore.from_dict(legacy)
+    targets = ids[:queries]
+
+    def _scan():
+        results = []
+        for target in targets[:scanned]:
+            u = legacy[target]
+            nu = math.sqrt(sum(x * x for x in u))
+            scores = []
+            for label, v in legacy.items():
+                if isinstance(label, str) and label != target:
+                    nv = math.sqrt(sum(x * x for x in v))
+                    scores.append((sum(x * y for x, y in zip(u, v)) / (nu * nv), label))
+            scores.sort(reverse=True)
+            results.append([label for score, label in scores[:k]])
+        return results
+
+    def _store(approximate=False):
+        return [[x.id for x in neighbours]
+                for neighbours in store.similar(targets, k, approximate)]
+
+    t_old, old = timeit(_scan, repeat=1)
+    t_new, new = timeit(_store)
+    assert all(set(a) == set(b) for a, b in zip(old, new))
+    t_old, t_new = t_old / scanned, t_new / queries
+    report('top {} over {} laws, per query'.format(k, n), t_old, t_new)
+
+    start = time.perf_counter()
+    store.build_index()
+    print('{:<40} LSH build {:.4f}s'.format('', time.perf_counter() - start))
+    t_lsh, approximate = timeit(_store, True)
+    recall = sum(len(set(a) & set(b)) for a, b in zip(new, approximate)) / (k * queries)
+    report('LSH top {} (recall {:.2f}), per query'.format(k, recall), t_new, t_lsh / queries)
+
+
+def bench_infer_doc2vec(n=200, inferred=40, epochs=1000, min_epochs=200):
+    """Doc2vec inference: the former script (model loaded in memory,
+    all documents read and inferred, then pickled) against chunks
+    inferred by workers sharing the memory mapped model and written
+    to an embedding store as they arrive, with all epochs and with
+    the convergence check"""
+    import os
+    import pickle
+    import shutil
+    import tempfile
+    import gensim.models as g
+    import numpy as np
+    import corpus
+    import embeddings
+    import train_doc2vec
+    import infer_doc2vec
+
+    n, inferred, epochs, min_epochs = int(n), int(inferred), int(epochs), int(min_epochs)
+    directory = tempfile.mkdtemp()
+    laws = {}
+    for i in range(n):
+        law = synthetic_law('ν. {}/2000'.format(i + 1), articles=10, seed=i)
+        laws[law.identifier] = law
+    paths = corpus.export_shards(laws, directory, corpus.DOCUMENTS, processes=1)
+    corpus_file = os.path.join(directory, 'corpus.txt')
+    labels_file = os.path.join(directory, 'labels.txt')
+    corpus.merge_shards(paths, corpus_file, labels_file)
+    model = os.path.join(directory, 'model.bin')
+    train_doc2vec.train(corpus_file, model, labels_file, size=50, iter=5, min_count=2)
+
+    docs_file = os.path.join(directory, 'docs.txt')
+    with open(model + '.corpus') as f, open(docs_file, 'w') as out:
+        out.writelines(line for _, line in zip(range(inferred), f))
+
+    def _script():
+        m = g.Doc2Vec.load(model)
+        docs = [x.strip().split() for x in open(docs_file)]
+        vectors = [infer_doc2vec.infer_vector(m, d, epochs) for d in docs]
+        pickle.dump(vectors, open(os.path.join(directory, 'embeddings.pickle'), 'wb'))
+        return embeddings.normalize_rows(np.array(vectors, dtype=np.float32))
+
+    def _infer(tol):
+        output = os.path.join(directory, 'embeddings')
+        infer_doc2vec.infer(model, docs_file, output, epochs=epochs, min_epochs=min_epochs, tol=tol)
+        return embeddings.EmbeddingStore.load(output, mmap=False).vectors
+
+    t_old, old = timeit(_script, repeat=1)
+    for tol in [0, 0.02]:
+        t_new, new = timeit(_infer, tol, repeat=1)
+        similarity = np.mean(np.sum(old * new, axis=1))
+        report('{} documents, {} epochs, tolerance {}, cosine {:.3f}'.format(
+            inferred, epochs, tol, similarity), t_old, t_new)
+    shutil.rmtree(directory)
+
+
+def bench_process_topics(n=20000, topics=100, features=1000, no_top_words=100):
+    """Topic extraction: an argsort per topic against argpartition
+    over the whole H and W matrices"""
+    import math
+    import numpy as np
+    import topic_models
+
+    rng = np.random.RandomState(0)
+    H = rng.gamma(0.5, size=(topics, features))
+    W = rng.dirichlet(np.ones(topics) * 0.1, size=n)
+    feature_names = ['w{}'.format(i) for i in range(features)]
+    indices = {i: 'ν. {}/2000'.format(i + 1) for i in range(n)}
+    no_top_data_samples = math.ceil(n / topics)
+
+    def _loop():
+        # Former process_topics without printing and saving
+        graph = {}
+        documents = {}
+        for topic_idx, topic in enumerate(H):
+            keywords = [feature_names[i] for i in topic.argsort()[:-no_top_words - 1:-1]]
+            top_doc_indices = np.argsort(W[:, topic_idx])[::-1][0:no_top_data_samples]
+            similar = []
+            for doc_index in top_doc_indices:
+                similar.append(indices[doc_index])
+                graph[doc_index] = list(filter(lambda x: x != doc_index, top_doc_indices))
+            documents[topic_idx] = {'_id': topic_idx, 'keywords': keywords, 'statutes': similar}
+        return documents
+
+    def _vectorized():
+        documents = topic_models.topic_documents(
+            H, W, feature_names, indices, no_top_words, no_top_data_samples)
+        top = topic_models.top_documents(W, no_top_data_samples)
+        topic_models.topic_memberships(top, n)
+        return documents
+
+    t_old, old = timeit(_loop)
+    t_new, new = timeit(_vectorized)
+    assert old == new
+    report('{} topics over {} laws'.format(topics, n), t_old, t_new)
+
+
+def bench_summary_lookup(n=40000, refs=500, latency=0.0005):
+    """Summaries of a label page: one query per statute against a
+    single $in query and the in-memory map. Every query waits latency
+    seconds to stand in for a round trip to MongoDB"""
+    import summaries
+
+    class _Summaries:
+        def __init__(self):
+            self.documents = {'ν. {}/2000'.format(i): 'Περίληψη {}'.format(i) for i in range(n)}
+
+        def find(self, query, projection=None):
+            time.sleep(latency)
+            ids = query['_id']['$in'] if isinstance(query.get('_id'), dict) else \
+                [query['_id']] if '_id' in query else list(self.documents)
+            return [{'_id': x, 'summary': self.documents[x]} for x in ids if x in self.documents]
+
+    class _Database:
+        summaries = _Summaries()
+
+    db = _Database()
+    identifiers = random.Random(0).sample(list(db.summaries.documents), refs)
+
+    def _per_statute():
+        result = {}
+        for identifier in identifiers:
+            for x in db.summaries.find({'_id': identifier}):
+                result[identifier] = x['summary']
+        return result
+
+    batched = summaries.SummaryLookup(db, in_memory=False)
+    in_memory = summaries.SummaryLookup(db)
+    in_memory.load()
+
+    t_old, old = timeit(_per_statute)
+    t_batch, batch = timeit(batched.get_many, identifiers)
+    t_map, mapped = timeit(in_memory.get_many, identifiers)
+    assert old == batch == mapped
+    report('{} summaries, $in query'.format(refs), t_old, t_batch)
+    report('{} summaries, in-memory map'.format(refs), t_old, t_map)
+
+
+def bench_label_pages(n=40000, topics=100, per_topic=2000, requests=100):
+    """Label pages: collecting and sorting the statutes of every topic
+    with the keyword per request against a page of cached postings"""
+    import helpers
+    import topic_index
+
+    rng = random.Random(0)
+    identifiers = random_identifiers(n)
+    ranks = {x: rng.random() for x in identifiers}
+    documents = [{'_id': i, 'keywords': ['φόρος' if i % 2 else 'σχολείο'],
+                  'statutes': rng.sample(identifiers, per_topic)} for i in range(topics)]
+    index = topic_index.TopicIndex(documents, ranks)
+
+    def _sort_all():
+        for _ in range(requests):
+            refs = list({x for t in documents if 'φόρος' in t['keywords'] for x in t['statutes']})
+            refs.sort(key=helpers.statute_key, reverse=True)
+            refs.sort(key=lambda x: -ranks.get(x, 0))
+        return refs[:topic_index.DEFAULT_PAGE_SIZE]
+
+    def _paged():
+        for _ in range(requests):
+            refs, cursor, total = index.page('φόρος')
+        return refs
+
+    t_old, old = timeit(_sort_all, repeat=1)
+    t_new, new = timeit(_paged, repeat=1)
+    assert old == new
+    report('{} label pages'.format(requests), t_old, t_new)
+
+
+def bench_law_diff(articles=300, changed=(10, 100)):
+    """Diff of two versions of a law: difflib.Differ over the issue-like
+    exports against the article by article diff. The amendment adds a
+    first paragraph to consecutive articles, renumbering the rest"""
+    for n in changed:
+        initial = synthetic_law(articles=articles)
+        final = synthetic_law(articles=articles)
+        for article in final.get_articles_sorted()[:n]:
+            paragraphs = final.sentences[article]
+            final.sentences[article] = dict(
+                [('1', ['νέα διάταξη'])] +
+                [(str(int(p) + 1), paragraphs[p]) for p in paragraphs])
+        _bench_law_diff(initial, final, '{} articles, {} changed'.format(articles, n))
+
+
+def _bench_law_diff(initial, final, name):
+    import difflib
+    import law_diff
+
+    def _differ():
+        return list(difflib.Differ().compare(
+            initial.export_law('issue').splitlines(), final.export_law('issue').splitlines()))
+
+    def _hierarchical():
+        return list(law_diff.diff_laws(initial, final))
+
+    t_old, old = timeit(_differ, repeat=1)
+    t_new, new = timeit(_hierarchical)
+    assert len([x for x in old if x[0] != '?']) >= len(new)
+    report(name, t_old, t_new)
+
+
+BENCHMARKS = collections.OrderedDict([
+    ('connected_components', bench_connected_components),
+    ('sort_statutes', bench_sort_statutes),
+    ('autocomplete', bench_autocomplete),
+    ('apply_amendments', bench_apply_amendments),
+    ('law_memory', bench_law_memory),
+    ('lazy_laws', bench_lazy_laws),
+    ('phrase_edits', bench_phrase_edits),
+    ('search', bench_search),
+    ('linkify', bench_linkify),
+    ('export_corpus', bench_export_corpus),
+    ('sentence_corpus', bench_sentence_corpus),
+    ('doc2vec', bench_doc2vec),
+    ('similar_statutes', bench_similar_statutes),
+    ('infer_doc2vec', bench_infer_doc2vec),
+    ('process_topics', bench_process_topics),
+    ('summary_lookup', bench_summary_lookup),
+    ('label_pages', bench_label_pages),
+    ('law_diff', bench_law_diff),
+])
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        print('Running {}'.format(sys.argv[1]))
+        BENCHMARKS[sys.argv[1]](*sys.argv[2:])
+    else:
+        for name in BENCHMARKS:
+            print('Running {}'.format(name))
+            BENCHMARKS[name]()
@@ -8,6 +8,13 @@ import entities
 import pparser as parser
 import helpers
 import database
+import law_cache
+import lemmatize
+import topic_index
+import exporters
+import corpus
+import tempfile
+import shutil
 import pprint
 import tokenizer
 import collections
@@ -114,15 +121,16 @@ class Link:
         """Sort actual links by year"""
 
         if self.is_sorted == 0:
-            helpers.quicksort(self.actual_links, self.compare)
+            self.actual_links.sort(key=self.sort_key)
         self.is_sorted = 1
 
-    def compare(self, x, y):
-        """Comparator function by year, identifier and type
-        params x, y: Items of self.actual_links
+    @staticmethod
+    def sort_key(x):
+        """Sort key by year, identifier and type
+        params x: Item of self.actual_links
         """
 
-        return helpers.compare_statutes(x['from'], y['from'])
+        return helpers.statute_key(x['from'])
 
     @staticmethod
     def from_serialized(s):
@@ -149,16 +157,35 @@ class LawCodifier:
     4. Interfacing with MongoDB
     """
 
-    def __init__(self, issues_directory=None):
+    def __init__(
+            self,
+            issues_directory=None,
+            compact=True,
+            lazy=True,
+            cache_size=law_cache.DEFAULT_CACHE_SIZE):
         """Constructor for LawCodifier class
         :param issues_directory : Issues directory
+        :param compact : Keep the text of loaded laws in compact form
+        :param lazy : Load laws from the database on first access
+        instead of loading all of them on construction
+        :param cache_size : Number of laws kept in memory if lazy
         """
 
         self.laws = {}
         self.links = {}
         self.topics = []
+        self.topic_index = topic_index.TopicIndex()
+        # Stored lemmas of a law are stale once it has a new version
+        self.version_hooks = [lemmatize.invalidate]
+        self.compact = compact
         self.db = database.Database()
-        self.populate_laws()
+        if lazy:
+            self.laws = law_cache.LazyLaws(
+                law_cache.MongoLawLoader(self.db),
+                cache_size=cache_size,
+                compact=compact)
+        else:
+            self.populate_laws()
         self.populate_links()
         self.populate_topics()
         self.issues = []
@@ -181,23 +208,24 @@ class LawCodifier:
         cur = self.db.topics.find()
         for x in cur:
             self.topics.append(x)
+            self.topic_index.add(x)
         return self.topics
 
+    def get_topics(self, identifier):
+        """Return the topics a law belongs to"""
+        return self.topic_index.topics_of(identifier)
+
     def populate_laws(self):
         """Populate laws from database and fetch latest versions"""
 
         cursor = self.db.laws.find({"versions": {"$ne": None}})
         for x in cursor:
-            current_version = 0
-            current_instance = None
-            for v in x['versions']:
-                if int(v['_version']) >= current_version:
-                    current_version = int(v['_version'])
-                    current_instance = v
-
-            law, identifier = parser.LawParser.from_serialized(v)
-            law.version_index = current_version
-            self.laws[identifier] = law
+            law = law_cache.law_from_document(x)
+            if law is None:
+                continue
+            if self.compact:
+                law.compact()
+            self.laws[law.identifier] = law
 
     def get_history(self, law):
         """Return the history and links of a certain law"""
@@ -221,6 +249,33 @@ class LawCodifier:
 
         return history, history_links
 
+    def get_versions(self, law, amendees):
+        """Return the versions of a law written by certain amendees,
+        deserializing only those versions
+        :params law : Identifier of the law
+        :params amendees : Identifiers of the amending laws (the first
+        version has amendee None, also matched by 'None')
+        :returns Dict from amendee to LawParser and the amendees of all
+        versions in order
+        """
+        x = self.db.get_json_from_fs(_id = law)
+
+        all_amendees = []
+        selected = {}
+        for v in x['versions']:
+            amendee = v.get('amendee')
+            all_amendees.append(amendee)
+            if amendee in amendees or str(amendee) in amendees:
+                selected[str(amendee)] = v
+
+        versions = {}
+        for amendee, v in selected.items():
+            instance, identifier = parser.LawParser.from_serialized(v)
+            instance.version_index = int(v['_version'])
+            versions[amendee] = instance
+
+        return versions, all_amendees
+
     def populate_issues(self, directory, text_format=True):
         """Populate issues from directory"""
 
@@ -253,7 +308,8 @@ class LawCodifier:
                             print('Not in keys')
                             self.laws[law_id] = parser.LawParser(law_id)
 
-                        self.db.query_from_tree(self.laws[law_id], t)
+                        self.db.query_from_tree(self.pin_law(law_id), t)
+                        self.unpin_law(law_id)
 
                         print('Pushed to Database')
                     except Exception as e:
@@ -293,7 +349,8 @@ class LawCodifier:
 
                             print('Ammendee, ', issue.name)
                             self.db.query_from_tree(
-                                self.laws[law_id], t, issue.name)
+                                self.pin_law(law_id), t, issue.name)
+                            self.unpin_law(law_id)
 
                             print('Pushed to Database')
                         except Exception as e:
@@ -334,6 +391,20 @@ class LawCodifier:
                 except BaseException as e:
                     logging.warning(str(e))
 
+    def add_version_hook(self, hook):
+        """Register a function to be called with the identifier
+        of a law whenever a new version of it is written"""
+        self.version_hooks.append(hook)
+
+    def commit_version(self, identifier):
+        """Notify version hooks that a new version of a law
+        has been written (e.g. by apply_links)"""
+        for hook in self.version_hooks:
+            try:
+                hook(identifier)
+            except BaseException as e:
+                logging.warning(str(e))
+
     def get_law(self, identifier, export_type='latex'):
         """Get law string in LaTeX, Markdown, str, plaintext or issue-like format
         :param identifier : Law identifier
@@ -341,16 +412,19 @@ class LawCodifier:
         result = self.laws[identifier].export_law(export_type=export_type)
         return result
 
-    def export_codifier_corpus(self, outfile, labels=None):
-        """Export every law in a line in str format"""
-        if labels:
-            labels = open(labels, 'w+')
-        with open(outfile, 'w+') as f:
-            for law in self.laws:
-                s = self.get_law(law, export_type='str')
-                f.write(s + '\n')
-                labels.write(str(law) + '\n')
-        labels.close()
+    def export_codifier_corpus(self, outfile, labels=None, processes=None):
+        """Export every law in a line in str format
+        :param outfile : Corpus file
+        :param labels : Optional file with the identifier of each line
+        :param processes : Number of processes exporting shards
+        """
+        directory = tempfile.mkdtemp()
+        try:
+            paths = corpus.export_shards(
+                self.laws, directory, corpus.DOCUMENTS, processes=processes)
+            corpus.merge_shards(paths, outfile, labels)
+        finally:
+            shutil.rmtree(directory)
 
     def export_phrase_links(self, outfile):
         """Export links that have to do with operations
@@ -367,26 +441,21 @@ class LawCodifier:
     def export_law(self, identifier, outfile, export_type='markdown'):
         """Export a law in markdown or LaTeX"""
 
-        if export_type not in [
-            'latex',
-            'markdown',
-            'str',
-            'plaintext',
-                'issue']:
+        if export_type not in exporters.EXPORT_TYPES:
             raise Exception('Unrecognized export type')
 
-        result = self.get_law(identifier, export_type=export_type)
         if export_type == 'latex':
+            result = self.get_law(identifier, export_type=export_type)
             helpers.texify(result, outfile)
-        elif export_type == 'markdown':
+        else:
             with open(outfile, 'w+') as f:
-                f.write(result)
+                exporters.export_law(self.laws[identifier], f, export_type)
 
     def create_law_links(self):
         """Creates links from existing laws"""
 
         for identifier, law in self.laws.items():
-            articles = law.sentences.keys()
+            articles = law.get_articles()
 
             self.detect_and_apply_removals(identifier=identifier, generate_links=True)
 
@@ -498,8 +567,13 @@ class LawCodifier:
         print('Maximum Degree: ', max_degree)
         print('Average Degree', avg_degree)
 
-    def train_word2vec(self):
-        """Train a word2vec model using the words of the codifier"""
+    def train_word2vec(self, corpus_dir=None, processes=None):
+        """Train a word2vec model using the words of the codifier
+        :param corpus_dir : Directory for the sentence shards. If it
+        already contains shards they are used as they are (default a
+        temporary directory removed after training)
+        :param processes : Number of processes exporting shards
+        """
         params = {
             'size': 200,
             'iter': 20,
@@ -512,15 +586,20 @@ class LawCodifier:
             'sample': 1E-3,
         }
 
-        all_sentences = []
-
-        for law in self.laws.values():
-            for article in law.sentences.keys():
-                for par in law.sentences[article]:
-                    for per in law.sentences[article][par]:
-                        all_sentences.append(per)
-
-        self.model = gensim.models.Word2Vec(all_sentences, **params)
+        # Shards in a temporary directory are removed after training
+        temporary = corpus_dir is None
+        if temporary:
+            corpus_dir = tempfile.mkdtemp()
+        try:
+            sentences = corpus.SentenceCorpus(corpus_dir)
+            if sentences.paths == []:
+                sentences = corpus.SentenceCorpus(corpus.export_shards(
+                    self.laws, corpus_dir, corpus.SENTENCES, processes=processes))
+
+            self.model = gensim.models.Word2Vec(sentences, **params)
+        finally:
+            if temporary:
+                shutil.rmtree(corpus_dir)
         print('Model train complete!')
         self.model.wv.save_word2vec_format('model')
 
@@ -546,6 +625,7 @@ class LawCodifier:
         """Run pagerank on graph built from links"""
         self.graph = self.build_graph_from_links()
         self.ranks = pagerank(self.graph, alpha=0.9)
+        self.topic_index.set_ranks(self.ranks)
         ranking = list(zip(self.ranks.keys(), self.ranks.values()))
         ranking.sort(key=lambda x: x[1])
         self.ranking = {}
@@ -555,6 +635,18 @@ class LawCodifier:
 
         return self.ranks
 
+    def pin_law(self, identifier):
+        """Return a law to be modified in place, keeping it in memory
+        until unpin_law is called"""
+        if isinstance(self.laws, law_cache.LazyLaws):
+            return self.laws.pin(identifier)
+        return self.laws[identifier]
+
+    def unpin_law(self, identifier):
+        """Let a modified law be evicted once it has been stored"""
+        if isinstance(self.laws, law_cache.LazyLaws):
+            self.laws.unpin(identifier)
+
     def detect_and_apply_removals(self, identifier, generate_links=True):
         """Apply removals, if any, of a given law"""
         articles = self.laws[identifier].get_articles_sorted()
@@ -583,7 +675,8 @@ class LawCodifier:
                             self.links[target].add_link(identifier, paragraph, link_type='απαλειπτικός')
                             self.db.links.save(self.links[target].serialize())
                         else:
-                            self.laws[target].query_from_tree(subtree)
+                            # Not stored, so kept in memory for the process
+                            self.pin_law(target).query_from_tree(subtree)
                             logging.info('Applied removal on ' + target)
                     except KeyError as e:
                         logging.warning('Statute nonexistent ' + target)
@@ -602,22 +695,28 @@ def build(
             'laws',
             'links',
             'topics',
-            'versions'],
+            'versions',
+            'indexes',
+            'search'],
         drop=True):
     """Build codifier object
     :params start : Start year
     :params end : End year
     :params data_dir : Text files directory
     :params pipeline : Pipeline to build
-    Full pipeline ['laws', 'links', 'topics', 'versions']
+    Full pipeline ['laws', 'links', 'topics', 'versions', 'indexes', 'search']
     laws: Build laws
     links: Build links
     topics: Build topics
     versions: Build versions
+    indexes: Build materialized index pages
+    search: Build the full-text search index
     """
     # Import here for performance
     import topic_models
     import apply_links
+    import indexes
+    import search
 
     if not data_dir[-1] == '/':
         data_dir = data_dir + '/'
@@ -635,7 +734,9 @@ def build(
         'laws': cod.codify_new_laws,
         'links': cod.create_law_links,
         'topics': topic_models.build_topics,
-        'versions': apply_links.apply_all_links
+        'versions': apply_links.apply_all_links,
+        'indexes': lambda: indexes.build_indexes(cod),
+        'search': lambda: search.build_and_save(cod.db)
     }
 
     # Drop Lookup
@@ -643,7 +744,9 @@ def build(
         'laws': cod.db.drop_laws,
         'links': cod.db.drop_links,
         'topics': cod.db.drop_topics,
-        'versions': cod.db.rollback_all
+        'versions': cod.db.rollback_all,
+        'indexes': cod.db.drop_indexes,
+        'search': search.drop_index
     }
 
     # Apply stages
@@ -0,0 +1,259 @@
+'''
+    Corpus export for training word2vec and doc2vec models.
+    Laws are split in shards of a few laws each which are exported in
+    parallel by a pool of processes, so preprocessing uses every core.
+    Shards are written to disk and read back lazily by SentenceCorpus, a
+    re-iterable corpus that gensim can pass over once per epoch without
+    holding the sentences of the whole codex in memory.
+
+    Two kinds of shards are written:
+    sentences : One tokenized period per line (word2vec)
+    documents : One law per line in str format, with a .labels file
+    holding the identifier of each line (doc2vec)
+
+    TaggedCorpus streams the TaggedDocuments of an exported documents
+    corpus to doc2vec in the same way.
+'''
+
+import collections
+import glob
+import mmap
+import multiprocessing
+import os
+import re
+import shutil
+import exporters
+import tokenizer
+import pparser as parser
+
+SENTENCES = 'sentences'
+DOCUMENTS = 'documents'
+
+# Number of laws per shard
+DEFAULT_SHARD_SIZE = 64
+
+# Words of a period
+WORD_REGEX = re.compile(r'\w+')
+
+
+def tokenize(period):
+    """Lowercase a period and split it in words"""
+    return WORD_REGEX.findall(period.lower())
+
+
+def iter_sentences(law):
+    """Generate the tokenized periods of a law"""
+    for article in law.get_articles_sorted():
+        for paragraph in law.get_paragraph_ids(article):
+            for period in law.get_periods(article, paragraph):
+                words = tokenize(period)
+                if words != []:
+                    yield words
+
+
+def shard_path(directory, i, kind):
+    return os.path.join(directory, '{}-{:05d}.txt'.format(kind, i))
+
+
+def labels_path(path):
+    """Labels file of a documents shard"""
+    return os.path.splitext(path)[0] + '.labels'
+
+
+def write_shard(path, kind, laws):
+    """Write a shard. The file is written under a temporary name and
+    renamed when complete so that partial shards are never read
+    :params path : Shard file
+    :params kind : SENTENCES or DOCUMENTS
+    :params laws : List of LawParser objects or serialized laws
+    """
+    laws = [parser.LawParser.from_serialized(law)[0] if isinstance(law, dict) else law
+            for law in laws]
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        if kind == SENTENCES:
+            for law in laws:
+                f.writelines(' '.join(words) + '\n' for words in iter_sentences(law))
+        elif kind == DOCUMENTS:
+            with open(labels_path(path), 'w') as labels:
+                for law in laws:
+                    exporters.export_law(law, f, 'str')
+                    f.write('\n')
+                    labels.write(law.identifier + '\n')
+        else:
+            raise Exception('Unrecognized shard kind')
+
+    os.replace(tmp, path)
+    return path
+
+
+def _shards(laws, identifiers, directory, kind, shard_size, serialize):
+    """Generate the arguments of write_shard, loading
+    the laws of a shard at a time. LawParser objects cannot be
+    pickled so they are serialized if sent to another process"""
+    batch = []
+    i = 0
+    for identifier in identifiers:
+        try:
+            law = laws[identifier]
+        except KeyError:
+            continue
+        batch.append(law.serialize() if serialize else law)
+        if len(batch) == shard_size:
+            yield shard_path(directory, i, kind), kind, batch
+            batch = []
+            i += 1
+
+    if batch != []:
+        yield shard_path(directory, i, kind), kind, batch
+
+
+def export_shards(
+        laws,
+        directory,
+        kind=SENTENCES,
+        identifiers=None,
+        shard_size=DEFAULT_SHARD_SIZE,
+        processes=None):
+    """Export laws to shards in parallel
+    :params laws : Mapping from identifier to LawParser (e.g. LawCodifier.laws)
+    :params directory : Output directory
+    :params kind : SENTENCES or DOCUMENTS
+    :params identifiers : Laws to export (default all)
+    :params shard_size : Number of laws per shard
+    :params processes : Number of processes (default number of cores - 1)
+    :returns List of shard files in order
+    """
+    if identifiers is None:
+        identifiers = list(laws)
+    if processes is None:
+        processes = max(1, multiprocessing.cpu_count() - 1)
+
+    os.makedirs(directory, exist_ok=True)
+    tasks = _shards(laws, identifiers, directory, kind, shard_size, processes > 1)
+
+    if processes == 1:
+        return [write_shard(*t) for t in tasks]
+
+    # Pool.imap would consume (and load) every shard up front, so at most
+    # two shards per process are pending at any time
+    paths = []
+    pending = collections.deque()
+    with multiprocessing.Pool(processes) as pool:
+        for task in tasks:
+            if len(pending) >= 2 * processes:
+                paths.append(pending.popleft().get())
+            pending.append(pool.apply_async(write_shard, task))
+        while pending:
+            paths.append(pending.popleft().get())
+    return paths
+
+
+def merge_shards(paths, outfile, labels=None):
+    """Concatenate documents shards into a corpus file
+    and (optionally) a labels file"""
+    with open(outfile, 'w') as f:
+        for path in paths:
+            with open(path) as shard:
+                shutil.copyfileobj(shard, f)
+
+    if labels:
+        with open(labels, 'w') as f:
+            for path in paths:
+                with open(labels_path(path)) as shard:
+                    shutil.copyfileobj(shard, f)
+
+
+class SentenceCorpus:
+    """Re-iterable corpus of tokenized sentences read from shards.
+    Every iteration reads the shards from disk again."""
+
+    def __init__(self, paths):
+        """
+        :params paths : List of shard files or a directory of shards
+        """
+        if isinstance(paths, str):
+            paths = sorted(glob.glob(os.path.join(paths, SENTENCES + '-*.txt')))
+        self.paths = list(paths)
+
+    def __iter__(self):
+        for path in self.paths:
+            with open(path) as f:
+                for line in f:
+                    words = line.split()
+                    if words != []:
+                        yield words
+
+
+def clean(doc, tokenize=True):
+    """Lowercase a document and split it in words
+    :params tokenize : Use tokenizer.tokenizer, which keeps abbreviations
+    such as 'π.μ.' in one word, instead of splitting on whitespace
+    """
+    doc = doc.lower().strip()
+    if not tokenize:
+        return doc.split()
+    return [w for w in tokenizer.tokenizer.split(doc, False, ' ') if w != '']
+
+
+def iter_lines(filename, use_mmap=False):
+    """Generate the lines of a file without their line terminator
+    :params use_mmap : Read the file through a memory map
+    """
+    if not use_mmap:
+        with open(filename) as f:
+            for line in f:
+                yield line.rstrip('\n')
+        return
+
+    if os.path.getsize(filename) == 0:
+        return
+    with open(filename, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            for line in iter(m.readline, b''):
+                yield line.decode('utf-8').rstrip('\n')
+
+
+class TaggedCorpus:
+    """Re-iterable corpus of gensim TaggedDocuments read from a corpus
+    file with one document per line (see export_codifier_corpus).
+    Documents are tokenized on the fly at every iteration."""
+
+    def __init__(self, corpus_file, labels_file=None, tokenize=True, use_mmap=False):
+        """
+        :params corpus_file : File with one document per line
+        :params labels_file : File with the tag of each line. Documents
+        are tagged with their line number if None
+        :params tokenize : See clean
+        :params use_mmap : Read the corpus through a memory map
+        """
+        self.corpus_file = corpus_file
+        self.labels_file = labels_file
+        self.tokenize = tokenize
+        self.use_mmap = use_mmap
+
+    def labels(self):
+        """Generate the tags of the documents"""
+        if self.labels_file is None:
+            i = 0
+            while True:
+                yield i
+                i += 1
+        else:
+            yield from iter_lines(self.labels_file)
+
+    def __iter__(self):
+        # Import here for performance
+        from gensim.models.doc2vec import TaggedDocument
+
+        documents = iter_lines(self.corpus_file, self.use_mmap)
+        for label, doc in zip(self.labels(), documents):
+            yield TaggedDocument(words=clean(doc, self.tokenize), tags=[label])
+
+    def write_corpus_file(self, outfile):
+        """Write the tokenized documents one per line with words separated
+        by spaces, as expected by the corpus_file mode of gensim. Documents
+        are then tagged with their line number."""
+        with open(outfile, 'w') as f:
+            for doc in self:
+                f.write(' '.join(doc.words) + '\n')
@@ -80,7 +80,8 @@ class Database:
     def query_from_tree(self, law, tree, issue_name=None):
         """Apply query from tree"""
         print('Querying from tree')
-        result = law.query_from_tree(tree)
+        law.query_from_tree(tree)
+        result = law.serialize()
         result['_version'] = law.version_index
 
         if issue_name:
@@ -189,11 +190,37 @@ class Database:
         dump = self.fs.find_one({'_id' : _id})
         return json.loads(dump.read().decode('utf-8'))
 
+    def get_fs_revision(self, _id):
+        """Return the upload date and length of a file in GridFS, which
+        change whenever it is saved again, without reading the file.
+        Returns None if there is no such file"""
+        x = self.db['fs.files'].find_one({'_id' : _id}, {'uploadDate' : 1, 'length' : 1})
+        if x is None:
+            return None
+        return x['uploadDate'], x['length']
+
     def drop_fs(self):
         """Drop GridFS"""
         self.db.drop_collection('fs.files')
         self.db.drop_collection('fs.chunks')
 
+    def save_index(self, name, index):
+        """Save a materialized index page to GridFS"""
+        self.save_json_to_fs('index:' + name, index)
+
+    def get_index(self, name):
+        """Get a materialized index page from GridFS
+        Returns None if the index has not been built"""
+        try:
+            return self.get_json_from_fs('index:' + name)
+        except AttributeError:
+            return None
+
+    def drop_indexes(self):
+        """Drop materialized index pages"""
+        for x in self.fs.find({'_id': {'$regex': '^index:'}}):
+            self.fs.delete(x._id)
+
     def drop_summaries(self):
         """Drop summaries"""
         self.db.drop_collection('summaries')
@@ -0,0 +1,241 @@
+'''
+    Store of document embeddings (e.g. doc2vec vectors of laws) for
+    nearest neighbour queries. The vectors are kept normalized to unit
+    length in one contiguous float32 matrix, saved with numpy and opened
+    as a memory map, together with a table of the id of every row:
+
+    embeddings.npy : n x d float32 matrix
+    embeddings.ids : The id of each row, one per line
+
+    Cosine similarity is then a matrix product, so the top k neighbours
+    of a batch of queries are found with one BLAS call per batch and
+    numpy.argpartition. HyperplaneIndex is an optional approximate index
+    (random hyperplane LSH) for stores too large to scan.
+'''
+
+import collections
+import os
+import numpy as np
+
+# Number of queries multiplied at once in top_k
+DEFAULT_BATCH_SIZE = 256
+
+Neighbour = collections.namedtuple('Neighbour', ['id', 'score'])
+
+
+def normalize_rows(vectors):
+    """Return the rows of a matrix scaled to unit length as float32"""
+    vectors = np.array(vectors, dtype=np.float32, ndmin=2)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+def store_paths(path):
+    """Files of a store saved under path"""
+    return path + '.npy', path + '.ids'
+
+
+def top_k_rows(scores, k):
+    """Indices of the k largest scores of every row in decreasing order"""
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return np.zeros((scores.shape[0], 0), dtype=np.int64)
+    if k < scores.shape[1]:
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        top = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+    # Fancy indexing instead of take_along_axis, which needs numpy 1.15
+    lines = np.arange(scores.shape[0])[:, None]
+    order = np.argsort(-scores[lines, top], axis=1)
+    return top[lines, order]
+
+
+class EmbeddingStore:
+    """Normalized embeddings and their ids"""
+
+    def __init__(self, ids, vectors, normalized=False):
+        """
+        :params ids : List of ids (e.g. law identifiers)
+        :params vectors : n x d matrix, one row per id
+        :params normalized : The rows already have unit length
+        """
+        self.ids = list(ids)
+        self.vectors = vectors if normalized else normalize_rows(vectors)
+        if len(self.ids) != self.vectors.shape[0]:
+            raise ValueError('Number of ids and vectors differ')
+        self.rows = {id_: i for i, id_ in enumerate(self.ids)}
+        self.index = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, id_):
+        return id_ in self.rows
+
+    @property
+    def dimension(self):
+        return self.vectors.shape[1]
+
+    def vector(self, id_):
+        """Return the (normalized) vector of an id"""
+        return self.vectors[self.rows[id_]]
+
+    def save(self, path):
+        """Save the store as path.npy and path.ids"""
+        matrix, ids = store_paths(path)
+        # Write under temporary names so that readers never see half a store
+        with open(matrix + '.tmp', 'wb') as f:
+            np.save(f, np.ascontiguousarray(self.vectors, dtype=np.float32))
+        with open(ids + '.tmp', 'w') as f:
+            f.writelines(str(id_) + '\n' for id_ in self.ids)
+        os.replace(matrix + '.tmp', matrix)
+        os.replace(ids + '.tmp', ids)
+
+    @staticmethod
+    def load(path, mmap=True):
+        """Load a store saved with save
+        :params mmap : Map the matrix instead of reading it in memory
+        """
+        matrix, ids = store_paths(path)
+        vectors = np.load(matrix, mmap_mode='r' if mmap else None)
+        with open(ids) as f:
+            ids = f.read().splitlines()
+        return EmbeddingStore(ids, vectors, normalized=True)
+
+    @staticmethod
+    def from_dict(embeddings):
+        """Build a store from the dicts of label_embeddings.py and
+        infer_doc2vec.py, which map labels to vectors and vectors back
+        to labels. Only the string keys are used."""
+        ids = [k for k in embeddings if isinstance(k, str)]
+        return EmbeddingStore(ids, [embeddings[k] for k in ids])
+
+    def build_index(self, bits=12, tables=24, seed=0):
+        """Build an approximate HyperplaneIndex used by top_k"""
+        self.index = HyperplaneIndex(self.vectors, bits, tables, seed)
+        return self.index
+
+    def top_k(self, queries, k=10, exclude=None, approximate=False,
+              batch_size=DEFAULT_BATCH_SIZE):
+        """Find the nearest neighbours of a batch of vectors
+        :params queries : m x d matrix (or a single vector)
+        :params k : Number of neighbours of every query
+        :params exclude : Row of each query to leave out (e.g. itself)
+        :params approximate : Use the HyperplaneIndex (see build_index)
+        :returns List of m lists of Neighbour by decreasing cosine similarity
+        """
+        queries = normalize_rows(queries)
+        if exclude is None:
+            exclude = [None] * queries.shape[0]
+
+        if approximate and self.index is not None:
+            return [self._neighbours(*self.index.query(self.vectors, q, k + 1), e, k)
+                    for q, e in zip(queries, exclude)]
+
+        results = []
+        for start in range(0, queries.shape[0], batch_size):
+            scores = np.dot(queries[start:start + batch_size], self.vectors.T)
+            rows = top_k_rows(scores, k + 1)
+            for i in range(scores.shape[0]):
+                results.append(self._neighbours(
+                    rows[i], scores[i, rows[i]], exclude[start + i], k))
+        return results
+
+    def _neighbours(self, rows, scores, exclude, k):
+        return [Neighbour(self.ids[r], float(s))
+                for r, s in zip(rows, scores) if r != exclude][:k]
+
+    def similar(self, ids, k=10, approximate=False):
+        """Find the nearest neighbours of stored ids, excluding themselves
+        :params ids : A single id or a list of ids
+        :returns List of Neighbour, or a list of them for a list of ids
+        """
+        single = isinstance(ids, str)
+        if single:
+            ids = [ids]
+        rows = [self.rows[id_] for id_ in ids]
+        results = self.top_k(self.vectors[rows], k, rows, approximate)
+        return results[0] if single else results
+
+
+class EmbeddingWriter:
+    """Write the matrix of a store a chunk of rows at a time, e.g. as
+    vectors are inferred, without holding the whole matrix in memory.
+    The store becomes visible under path when closed."""
+
+    def __init__(self, path, n, dimension):
+        """
+        :params path : Path of the store (see EmbeddingStore.save)
+        :params n : Number of rows
+        :params dimension : Dimension of the vectors
+        """
+        self.path = path
+        matrix, _ = store_paths(path)
+        self.vectors = np.lib.format.open_memmap(
+            matrix + '.tmp', mode='w+', dtype=np.float32, shape=(n, dimension))
+
+    def write(self, start, vectors):
+        """Write (and normalize) rows starting from row start"""
+        vectors = normalize_rows(vectors)
+        self.vectors[start:start + vectors.shape[0]] = vectors
+
+    def close(self, ids):
+        """Save the ids of the rows and move the store in place"""
+        ids = list(ids)
+        if len(ids) != self.vectors.shape[0]:
+            raise ValueError('Number of ids and vectors differ')
+        matrix, ids_file = store_paths(self.path)
+        self.vectors.flush()
+        del self.vectors
+        with open(ids_file + '.tmp', 'w') as f:
+            f.writelines(str(id_) + '\n' for id_ in ids)
+        os.replace(matrix + '.tmp', matrix)
+        os.replace(ids_file + '.tmp', ids_file)
+
+
+class HyperplaneIndex:
+    """Approximate cosine nearest neighbours with random hyperplane LSH.
+    Every table hashes a vector to the signs of its projections on
+    `bits` random hyperplanes; candidates are the vectors sharing a
+    bucket with the query in any table, which are then ranked exactly."""
+
+    def __init__(self, vectors, bits=12, tables=24, seed=0):
+        random = np.random.RandomState(seed)
+        self.planes = random.standard_normal(
+            (vectors.shape[1], bits * tables)).astype(np.float32)
+        self.bits = bits
+        self.tables = tables
+        self.buckets = []
+        codes = self.hash(vectors)
+        for t in range(tables):
+            buckets = collections.defaultdict(list)
+            for row, code in enumerate(codes[:, t]):
+                buckets[code].append(row)
+            self.buckets.append({c: np.array(r) for c, r in buckets.items()})
+
+    def hash(self, vectors):
+        """Return the bucket of every vector in every table"""
+        signs = np.dot(vectors, self.planes) > 0
+        signs = signs.reshape(signs.shape[0], self.tables, self.bits)
+        return signs.dot(1 << np.arange(self.bits))
+
+    def candidates(self, query):
+        """Rows sharing a bucket with the query"""
+        codes = self.hash(query.reshape(1, -1))[0]
+        found = [self.buckets[t].get(code) for t, code in enumerate(codes)]
+        found = [f for f in found if f is not None]
+        if found == []:
+            return np.zeros(0, dtype=np.int64)
+        return np.unique(np.concatenate(found))
+
+    def query(self, vectors, query, k):
+        """Return the rows and scores of the approximate top k of a
+        normalized query. Falls back to a full scan if there are fewer
+        than k candidates."""
+        rows = self.candidates(query)
+        if len(rows) < k:
+            rows = np.arange(vectors.shape[0])
+        scores = np.dot(vectors[rows], query)
+        top = top_k_rows(scores.reshape(1, -1), k)[0]
+        return rows[top], scores[top]
@@ -0,0 +1,162 @@
+'''
+    Exporters of laws to LaTeX, Markdown, str, plaintext and issue-like
+    format. Laws are exported as a stream of chunks (a heading, a title or
+    a paragraph at a time) that is written to a writer, i.e. any object
+    with a writelines method such as a file, a ListWriter or, via the
+    generator itself, an HTTP response. Nothing is concatenated besides
+    the final join of ListWriter, so export is linear in the size of
+    the law.
+'''
+
+EXPORT_TYPES = ['latex', 'markdown', 'str', 'plaintext', 'issue']
+
+# Headers of issue-like exports
+ISSUE_ABBREVIATIONS = {
+    'ν.': 'ΝΌΜΟΣ',
+    'π.δ.': 'ΠΡΟΕΔΡΙΚΟ ΔΙΑΤΑΓΜΑ',
+    'ν.δ.': 'ΝΟΜΟΘΕΤΙΚΟ ΔΙΑΤΑΓΜΑ'
+}
+
+# Mimetypes of streamed exports
+MIMETYPES = {
+    'latex': 'application/x-latex',
+    'markdown': 'text/markdown',
+    'str': 'text/plain',
+    'plaintext': 'text/plain',
+    'issue': 'text/plain'
+}
+
+
+class ListWriter:
+    """Writer collecting the chunks in a list"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, chunk):
+        self.chunks.append(chunk)
+
+    def writelines(self, chunks):
+        self.chunks.extend(chunks)
+
+    def getvalue(self):
+        """Return the concatenated output"""
+        return ''.join(self.chunks)
+
+
+# Marks articles without a title
+_untitled = object()
+
+
+def _title(law, article, add_titles):
+    if not add_titles:
+        return _untitled
+    try:
+        return law.titles[article]
+    except:
+        return _untitled
+
+
+def iter_latex(law, add_titles=True):
+    yield '\\chapter*{{ {} }}'.format(law.identifier)
+    for article in law.get_articles_sorted():
+        yield '\\subsection*{{ Άρθρο {} }}\n'.format(article)
+        for i, paragraph in enumerate(law.get_paragraphs(article)):
+            yield '\\paragraph {{ {}. }} {}\n'.format(i, paragraph)
+
+
+def iter_markdown(law, add_titles=True):
+    yield '# {}\n'.format(law.identifier)
+    for article in law.get_articles_sorted():
+        yield '### Άρθρο {} \n'.format(article)
+        title = _title(law, article, add_titles)
+        if title is not _untitled:
+            yield '#### {}\n'.format(title)
+        for i, paragraph in enumerate(law.get_paragraphs(article)):
+            yield ' {}. {}\n'.format(i, paragraph)
+
+
+def iter_str(law, add_titles=True):
+    for article in law.get_articles_sorted():
+        yield 'Άρθρο {} '.format(article)
+        for paragraph in law.get_paragraphs(article):
+            yield paragraph
+
+
+def iter_plaintext_article(law, article, add_titles=True):
+    yield 'Άρθρο {} \n'.format(article)
+    title = _title(law, article, add_titles)
+    if title is not _untitled:
+        yield '{}\n'.format(title)
+    for i, paragraph in enumerate(law.get_paragraphs(article)):
+        yield ' {}. {}\n'.format(i + 1, paragraph)
+
+
+def iter_plaintext(law, add_titles=True):
+    for article in law.get_articles_sorted():
+        yield from iter_plaintext_article(law, article, add_titles)
+
+
+def issue_header(law):
+    """Return the header line of an issue-like export or None"""
+    for key, val in ISSUE_ABBREVIATIONS.items():
+        if law.identifier.lower().startswith(key):
+            counter = law.identifier.strip(key).split('/')[-2]
+            return '{} ΥΠ’ ΑΡΙΘΜ. {}\n'.format(val, counter)
+    return None
+
+
+def iter_issue(law, add_titles=True):
+    header = issue_header(law)
+    if header is not None:
+        yield header
+
+    yield from iter_plaintext(law)
+
+
+_iterators = {
+    'latex': iter_latex,
+    'markdown': iter_markdown,
+    'str': iter_str,
+    'plaintext': iter_plaintext,
+    'issue': iter_issue
+}
+
+
+def iter_law(law, export_type='markdown', add_titles=True):
+    """Generate the chunks of an exported law
+    :params law : LawParser object
+    :params export_type : One of EXPORT_TYPES
+    :params add_titles : Include the titles of the articles
+    """
+    try:
+        iterator = _iterators[export_type]
+    except KeyError:
+        raise Exception('Unrecognized export type')
+
+    return iterator(law, add_titles)
+
+
+def export_law(law, writer, export_type='markdown', add_titles=True):
+    """Write an exported law to a writer"""
+    writer.writelines(iter_law(law, export_type, add_titles))
+    return writer
+
+
+def iter_corpus(laws, export_type='str', identifiers=None):
+    """Generate the chunks of many laws, one law per line
+    :params laws : Mapping from identifier to LawParser
+    :params identifiers : The laws to export (default all)
+    """
+    if identifiers is None:
+        identifiers = list(laws)
+
+    for identifier in identifiers:
+        yield from iter_law(laws[identifier], export_type)
+        yield '\n'
+
+
+def export_corpus(laws, writer, export_type='str', identifiers=None):
+    """Write many laws to a writer, one law per line"""
+    writer.writelines(iter_corpus(laws, export_type, identifiers))
+    return writer
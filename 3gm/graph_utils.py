@@ -0,0 +1,164 @@
+"""
+Graph utilities used by the grapher and the topic models.
+Graphs are given as adjacency dicts (vertex -> iterable of neighbors)
+and are converted to NumPy edge arrays over integer vertex ids so that
+component labeling scales to millions of edges.
+"""
+
+import itertools
+import numpy as np
+
+
+class UnionFind:
+    """Disjoint-set forest over the vertices 0, ..., n - 1 with path
+    compression and union by size. Suitable for incremental use, e.g.
+    when edges arrive one at a time.
+    """
+
+    def __init__(self, n=0):
+        """Initialize n singleton sets
+        :params n : Number of vertices
+        """
+        self.parent = list(range(n))
+        self.size = [1] * n
+        self.n_components = n
+
+    def __len__(self):
+        """Returns the number of vertices"""
+        return len(self.parent)
+
+    def add(self):
+        """Add a new singleton set and return its id"""
+        u = len(self.parent)
+        self.parent.append(u)
+        self.size.append(1)
+        self.n_components += 1
+        return u
+
+    def find(self, u):
+        """Return the representative of the set containing u"""
+        parent = self.parent
+        root = u
+        while parent[root] != root:
+            root = parent[root]
+
+        # Path compression
+        while parent[u] != root:
+            parent[u], u = root, parent[u]
+
+        return root
+
+    def union(self, u, v):
+        """Merge the sets containing u and v
+        :returns True if the sets were disjoint
+        """
+        u, v = self.find(u), self.find(v)
+        if u == v:
+            return False
+        if self.size[u] < self.size[v]:
+            u, v = v, u
+        self.parent[v] = u
+        self.size[u] += self.size[v]
+        self.n_components -= 1
+        return True
+
+    def labels(self):
+        """Return the representative of every vertex as an array"""
+        return np.fromiter((self.find(u) for u in range(len(self.parent))),
+                           dtype=np.int64, count=len(self.parent))
+
+
+def edge_array(graph):
+    """Convert an adjacency dict to an edge array
+    :params graph : Dict mapping each vertex to its neighbors
+    :returns (vertices, edges) where vertices is the list of vertex names
+    and edges an (m, 2) int64 array of indices into vertices. Neighbors
+    that are not keys of graph are included as vertices.
+    """
+    vertices = list(graph.keys())
+    ids = {u: i for i, u in enumerate(vertices)}
+
+    def _lookup(v):
+        i = ids.get(v)
+        if i is None:
+            i = ids[v] = len(vertices)
+            vertices.append(v)
+        return i
+
+    degrees = np.fromiter(map(len, graph.values()), dtype=np.int64,
+                          count=len(vertices))
+    m = int(degrees.sum())
+
+    edges = np.empty((m, 2), dtype=np.int64)
+    edges[:, 0] = np.repeat(np.arange(len(vertices), dtype=np.int64), degrees)
+    neighbors = itertools.chain.from_iterable(graph.values())
+    try:
+        # Fast path when every neighbor is also a key
+        edges[:, 1] = np.fromiter(map(ids.__getitem__, neighbors),
+                                  dtype=np.int64, count=m)
+    except KeyError:
+        neighbors = itertools.chain.from_iterable(graph.values())
+        edges[:, 1] = np.fromiter(map(_lookup, neighbors),
+                                  dtype=np.int64, count=m)
+
+    return vertices, edges
+
+
+def label_components(edges, n):
+    """Label the connected components of an undirected graph
+    Vectorized union-find: every round hooks the larger root of each
+    edge onto the smaller one and then compresses all paths by pointer
+    jumping, so only O(log n) passes over the edge array are needed.
+    :params edges : (m, 2) integer array of edges
+    :params n : Number of vertices
+    :returns An array with the smallest vertex id of each component
+    """
+    labels = np.arange(n, dtype=np.int64)
+    if n == 0 or len(edges) == 0:
+        return labels
+
+    u = np.asarray(edges[:, 0], dtype=np.int64)
+    v = np.asarray(edges[:, 1], dtype=np.int64)
+
+    while True:
+        lu, lv = labels[u], labels[v]
+        mask = lu != lv
+        if not mask.any():
+            break
+
+        # Hook roots, always pointing to a smaller id
+        lu, lv = lu[mask], lv[mask]
+        np.minimum.at(labels, np.maximum(lu, lv), np.minimum(lu, lv))
+
+        # Path compression by pointer jumping
+        while True:
+            jumped = labels[labels]
+            if np.array_equal(jumped, labels):
+                break
+            labels = jumped
+
+        # Only edges whose endpoints are still apart need another round
+        u, v = u[mask], v[mask]
+
+    return labels
+
+
+def connected_components(graph):
+    """Return the connected components of a graph as lists of vertices
+    :params graph : Dict mapping each vertex to its neighbors
+    """
+    vertices, edges = edge_array(graph)
+    labels = label_components(edges, len(vertices))
+
+    # Labels are the smallest vertex id of each component, hence sorting
+    # by label keeps the components in order of first appearance
+    order = np.argsort(labels, kind='stable')
+    boundaries = (np.flatnonzero(np.diff(labels[order])) + 1).tolist()
+    members = [vertices[i] for i in order.tolist()]
+
+    return [members[l:r] for l, r in zip([0] + boundaries, boundaries + [len(members)])]
+
+
+def get_edges(graph):
+    """Return the distinct (u, v) edges of an adjacency dict"""
+    return list({(u, v) for u, neighbors in graph.items() for v in neighbors})
@@ -4,7 +4,7 @@ import sys
 import json
 from entities import LegalEntities
 from collections import defaultdict
-from helpers import connected_components, get_edges
+from graph_utils import connected_components, get_edges
 from matplotlib import pyplot as plt
 import networkx
 from networkx.readwrite import json_graph
@@ -12,6 +12,7 @@ import datetime
 import re
 import entities
 import itertools
+import functools
 
 # Helper class that defines useful formatting and file handling functions
 
@@ -732,6 +733,47 @@ def compare_statutes(x, y):
         else:
             return xs[0] != 'ν.'
 
+class StatuteId(collections.namedtuple('StatuteId', ['type', 'number', 'year'])):
+    """Parsed statute identifier, e.g. 'ν. 4511/2018' becomes
+    StatuteId(type='ν.', number=4511, year=2018). Acts identified by a
+    date such as 'πράξη νομοθετικού περιεχομένου 24.12.1990' get the
+    date as mmdd in their number. Use key for chronological ordering.
+    """
+    __slots__ = ()
+
+    @staticmethod
+    @functools.lru_cache(maxsize=65536)
+    def parse(s):
+        """Parse an identifier string (cached)
+        :params s : Identifier e.g. ν. 4511/2018
+        """
+        s = s.lower().strip()
+        statute_type, _, tail = s.rpartition(' ')
+
+        try:
+            if '/' in tail:
+                number, year = tail.split('/')[-2:]
+                return StatuteId(statute_type, int(number), int(year))
+            else:
+                day, month, year = tail.split('.')[-3:]
+                return StatuteId(statute_type, 100 * int(month) + int(day), int(year))
+        except ValueError:
+            return StatuteId(s, 0, 0)
+
+    @property
+    def key(self):
+        """Sort key ordering statutes by year, other statute types before
+        laws (ν.) of the same year and then by number"""
+        return (self.year, self.type == 'ν.', self.type, self.number)
+
+
+@functools.lru_cache(maxsize=65536)
+def statute_key(s):
+    """Chronological sort key of an identifier string, for use with sorted
+    e.g. sorted(identifiers, key=statute_key)"""
+    return StatuteId.parse(s).key
+
+
 def remove_front_num(s, max_span=4):
     """Remove front number if exists.
     e.g. '1. Lorem Ipsum' becomes 'Lorem Ipsum'"""
@@ -0,0 +1,160 @@
+'''
+    Materialized index pages.
+    The year-grouped table of contents and the sorted listings behind
+    /legal_index and /full_index are computed once per build, stored to
+    GridFS and served from an in-process cache together with an ETag.
+    The cache checks the stored index again once a page is older than
+    max_age seconds, so that a new build is served without restarting
+    the application.
+'''
+
+import hashlib
+import json
+import logging
+import time
+import helpers
+
+# Seconds after which a cached index is checked against the stored one
+DEFAULT_MAX_AGE = 300
+
+# Names of the materialized indexes
+LEGAL_INDEX = 'legal_index'
+FULL_INDEX = 'full_index'
+INDEXES = [LEGAL_INDEX, FULL_INDEX]
+
+
+def build_toc(identifiers):
+    """Group sorted identifiers by year
+    :params identifiers : Identifiers sorted with helpers.statute_key
+    :returns List of (year, first identifier of the year)
+    """
+    current = None
+    toc = []
+    for identifier in identifiers:
+        year = helpers.StatuteId.parse(identifier).year
+        if current == None or year != current:
+            current = year
+            toc.append((current, identifier))
+    return toc
+
+
+def compute_etag(index):
+    """ETag of a materialized index"""
+    dump = json.dumps(index, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(dump.encode('utf-8')).hexdigest()
+
+
+def build_legal_index(identifiers):
+    """Build the index containing only statutes
+    :params identifiers : Statute identifiers (e.g. codifier.keys())
+    """
+    indexed_list = sorted(set(identifiers), key=helpers.statute_key)
+    index = {
+        'indexed_list': indexed_list,
+        'toc': build_toc(indexed_list),
+        'count': len(indexed_list)
+    }
+    index['etag'] = compute_etag(index)
+    return index
+
+
+def build_full_index(db):
+    """Build the full linking index. Only the ids of the linking
+    statutes and the number of links are fetched, not the link texts
+    :params db : database.Database object
+    """
+    cursor = db.links.aggregate([
+        {'$project': {
+            'links_to': 1,
+            'count': {'$size': {'$ifNull': ['$actual_links', []]}}
+        }}
+    ])
+
+    full_index = sorted(cursor, key=lambda x: helpers.statute_key(x['_id']))
+    for x in full_index:
+        x['links_to'] = sorted(x['links_to'], key=helpers.statute_key)
+
+    index = {
+        'full_index': full_index,
+        'toc': build_toc([x['_id'] for x in full_index]),
+        'count': len(full_index)
+    }
+    index['etag'] = compute_etag(index)
+    return index
+
+
+def build_indexes(cod):
+    """Compute and store every materialized index (build stage)
+    :params cod : LawCodifier object
+    """
+    lookup = {
+        LEGAL_INDEX: lambda: build_legal_index(cod.keys()),
+        FULL_INDEX: lambda: build_full_index(cod.db)
+    }
+
+    for name in INDEXES:
+        index = lookup[name]()
+        cod.db.save_index(name, index)
+        print('Stored {} with {} entries'.format(name, index['count']))
+
+
+class IndexPage:
+    """A materialized index and its ETag. The rendered page is kept
+    along with it so that repeated requests do not render again.
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.etag = index['etag']
+        self.html = None
+        self.checked_at = time.time()
+
+
+class IndexCache:
+    """In-process cache of materialized indexes. Indexes are loaded
+    from the database on first access. If they have not been built
+    yet they are computed with the given builders and stored.
+    """
+
+    def __init__(self, db, builders, max_age=DEFAULT_MAX_AGE):
+        """Initialize cache
+        :params db : database.Database object
+        :params builders : Dict from index name to a function computing it
+        :params max_age : Seconds after which the stored index is loaded
+        again and replaces the cached one if its ETag changed (None never)
+        """
+        self.db = db
+        self.builders = builders
+        self.max_age = max_age
+        self.pages = {}
+
+    def get(self, name):
+        """Return the IndexPage of an index"""
+        page = self.pages.get(name)
+        if page is not None and (self.max_age is None
+                or time.time() - page.checked_at <= self.max_age):
+            return page
+
+        index = self.db.get_index(name)
+        if index is None:
+            logging.info('Materializing ' + name)
+            index = self.builders[name]()
+            try:
+                self.db.save_index(name, index)
+            except BaseException as e:
+                logging.warning(str(e))
+
+        if page is not None and page.etag == index['etag']:
+            # Unchanged, keep the rendered page
+            page.checked_at = time.time()
+        else:
+            page = IndexPage(index)
+            self.pages[name] = page
+        return page
+
+    def invalidate(self, name=None):
+        """Drop a cached index (or all of them if name is None)"""
+        if name is None:
+            self.pages = {}
+        else:
+            self.pages.pop(name, None)
@@ -1,43 +1,175 @@
 #!/usr/bin/env python3
 
 # Infer document vectors from trained doc2vec model
-# usage: infer_doc2vec.py model.bin docs.txt embeddings.pickle
+# usage: infer_doc2vec.py model.bin docs.txt embeddings [--labels labels.txt] [--epochs 1000]
+#   [--min-epochs 50] [--tolerance 0] [--chunk-size 64] [--processes n]
+# Writes an embeddings.EmbeddingStore to embeddings.npy and embeddings.ids
+# Documents are tagged with the lines of labels.txt (default their line number)
+# The vector of a document is inferred with min-epochs, then with twice as
+# many epochs up to epochs, until the cosine similarity of two successive
+# vectors is at least 1 - tolerance. A tolerance of 0 (the default) always
+# runs all epochs. Successive vectors of long documents can agree closely
+# while still far from the vector of all epochs, check a tolerance with
+# benchmarks.py infer_doc2vec before using it.
+# Workers memory map the model once and infer chunks of documents, whose
+# vectors are written to the store as they arrive.
 
 import gensim.models as g
-import codecs
+import argparse
+import itertools
+import logging
+import multiprocessing
+import time
+import zlib
+import numpy as np
 import sys
-import pickle
-import muliprocessing
+sys.path.insert(0, '../')
+import corpus
+import embeddings
+from train_doc2vec import gensim_version
 
-def infer(d):
-	global m
-	global start_alpha
-	global infer_epoch
-	return tuple(m.infer_vector(d, alpha=start_alpha, steps=infer_epoch))
+#inference hyper-parameters
+start_alpha = 0.01
+infer_epoch = 1000
+min_infer_epoch = 50
+tolerance = 0
+chunk_size = 64
 
-#parameters
-model = sys.argv[1]
-test_docs = sys.argv[2]
-output_file = sys.argv[3]
+# Model of the worker process, loaded once by init_worker
+model = None
 
-#inference hyper-parameters
-start_alpha=0.01
-infer_epoch=1000
-njobs = multiprocessing.cpu_count() - 1
-pool = multiprocessing.Pool(njobs)
-
-#load model
-m = g.Doc2Vec.load(model)
-test_docs = [ x.strip().split() for x in codecs.open(test_docs, "r", "utf-8").readlines() ]
-
-# parallelize jobs using pool
-vectors = pool.map(infer, test_docs)
-
-# build lookup
-embeddings = {}
-for i, d in enumerate(test_docs):
-	embeddings[d] = vectors[i]
-	embeddings[vectors[i]] = d
-
-# export to dump
-pickle.dump(embeddings, open(output_file, "wb"))
+def load_model(model_path):
+	# Memory map the arrays of the model so that workers share them
+	return g.Doc2Vec.load(model_path, mmap='r')
+
+def init_worker(model_path):
+	global model
+	model = load_model(model_path)
+
+def infer_vector(m, words, epochs=infer_epoch, alpha=start_alpha):
+	# Seed the sampling with the document, so that inferences of the same
+	# document differ only by their epochs
+	m.random = np.random.RandomState(zlib.crc32(' '.join(words).encode('utf-8')))
+	if gensim_version() >= (4, 0):
+		return m.infer_vector(words, alpha=alpha, epochs=epochs)
+	return m.infer_vector(words, alpha=alpha, steps=epochs)
+
+def cosine(u, v):
+	norm = np.linalg.norm(u) * np.linalg.norm(v)
+	return np.dot(u, v) / norm if norm > 0 else 1.0
+
+def infer_converged(m, words, epochs=infer_epoch, min_epochs=min_infer_epoch, tol=tolerance,
+		alpha=start_alpha):
+	"""Infer the vector of a document with min_epochs, then with twice as
+	many epochs up to epochs, until the vector converges, i.e. the cosine
+	similarity of two successive vectors is at least 1 - tol
+	:params epochs : Maximum epochs
+	:params tol : Tolerance, 0 runs all epochs at once
+	:returns The vector and the number of epochs it was inferred with
+	"""
+	if tol <= 0 or min_epochs >= epochs:
+		return infer_vector(m, words, epochs, alpha), epochs
+
+	n = min_epochs
+	previous = infer_vector(m, words, n, alpha)
+	while n < epochs:
+		n = min(2 * n, epochs)
+		vector = infer_vector(m, words, n, alpha)
+		if cosine(previous, vector) >= 1 - tol:
+			return vector, n
+		previous = vector
+	return previous, n
+
+def infer_chunk(args):
+	"""Infer the vectors of a chunk of documents in a worker
+	:returns Index of the chunk, matrix of the vectors and total epochs
+	"""
+	i, docs, epochs, min_epochs, tol = args
+	vectors = np.zeros((len(docs), model.vector_size), dtype=np.float32)
+	total = 0
+	for j, doc in enumerate(docs):
+		vectors[j], n = infer_converged(model, doc.split(), epochs, min_epochs, tol)
+		total += n
+	return i, vectors, total
+
+def chunks(docs_file, size):
+	docs = corpus.iter_lines(docs_file)
+	for i in itertools.count():
+		chunk = list(itertools.islice(docs, size))
+		if chunk == []:
+			return
+		yield i, chunk
+
+def infer(model_path, docs_file, output, labels_file=None, epochs=infer_epoch,
+		min_epochs=min_infer_epoch, tol=tolerance, size=chunk_size, processes=None):
+	"""Infer the vectors of the documents of a file and save them as
+	an embeddings.EmbeddingStore
+	:params model_path : Trained doc2vec model
+	:params docs_file : Documents, one per line, tokenized with spaces
+	:params output : Path of the store
+	:params labels_file : Ids of the documents (default their line number)
+	:params epochs : Maximum inference epochs
+	:params min_epochs : Epochs of the first inference (see infer_converged)
+	:params tol : Tolerance of the convergence check, 0 runs all epochs
+	:params size : Documents per chunk
+	:params processes : Number of processes (default number of cores - 1)
+	"""
+	if processes is None:
+		processes = max(1, multiprocessing.cpu_count() - 1)
+
+	n = sum(1 for _ in corpus.iter_lines(docs_file))
+	if labels_file is None:
+		labels = [str(i) for i in range(n)]
+	else:
+		labels = list(corpus.iter_lines(labels_file))[:n]
+		n = len(labels)
+
+	tasks = ((i, docs, epochs, min_epochs, tol) for i, docs in chunks(docs_file, size))
+	if processes == 1:
+		init_worker(model_path)
+		results = map(infer_chunk, tasks)
+		pool = None
+	else:
+		pool = multiprocessing.Pool(processes, initializer=init_worker, initargs=(model_path,))
+		results = pool.imap_unordered(infer_chunk, tasks)
+
+	start = time.time()
+	writer = None
+	total = 0
+	try:
+		for i, vectors, epochs_run in results:
+			total += epochs_run
+			if writer is None:
+				writer = embeddings.EmbeddingWriter(output, n, vectors.shape[1])
+			writer.write(i * size, vectors[:max(0, n - i * size)])
+	finally:
+		if pool is not None:
+			pool.close()
+			pool.join()
+
+	if writer is None:
+		raise ValueError('No documents to infer')
+	writer.close(labels)
+
+	elapsed = time.time() - start
+	logging.info('Inferred {} documents in {:.1f}s ({:.1f} documents/s, {:.0f} epochs on average)'.format(
+		n, elapsed, n / elapsed if elapsed > 0 else 0, total / n if n else 0))
+
+if __name__ == '__main__':
+	argparser = argparse.ArgumentParser(description='Infer doc2vec document vectors')
+	argparser.add_argument('model', help='Trained doc2vec model')
+	argparser.add_argument('docs', help='Documents, one per line')
+	argparser.add_argument('output', help='Output embedding store')
+	argparser.add_argument('--labels', help='Labels of the documents')
+	argparser.add_argument('--epochs', type=int, default=infer_epoch)
+	argparser.add_argument('--min-epochs', type=int, default=min_infer_epoch)
+	argparser.add_argument('--tolerance', type=float, default=tolerance)
+	argparser.add_argument('--chunk-size', type=int, default=chunk_size)
+	argparser.add_argument('--processes', type=int)
+	args = argparser.parse_args()
+
+	#enable logging
+	logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.INFO)
+
+	infer(args.model, args.docs, args.output, args.labels, args.epochs,
+		args.min_epochs, args.tolerance, args.chunk_size, args.processes)
@@ -1,20 +1,17 @@
 #!/usr/bin/env python3
 # Label embedding description
-# usage: label_embeddings.py labels.txt output.pickle < embeddings.txt
+# usage: label_embeddings.py labels.txt output < embeddings.txt
+# Writes an embeddings.EmbeddingStore to output.npy and output.ids
 import sys
-import pickle
+import numpy as np
+import embeddings
 
-embeddings_txt = sys.stdin.read().splitlines()
 label_file = sys.argv[1]
 output = sys.argv[2]
 with open(label_file) as f:
     labels = f.read().splitlines()
 
-embeddings = {}
+# One vector per line with its components separated by spaces
+vectors = np.loadtxt(sys.stdin, dtype=np.float32, ndmin=2)
 
-for emb, lbl in zip(embeddings_txt, labels):
-    emb = tuple([float(x) for x in emb.split(' ')])
-    embeddings[lbl] = emb
-    embeddings[emb] = lbl
-
-pickle.dump(embeddings, open(output, 'wb'))
+embeddings.EmbeddingStore(labels[:len(vectors)], vectors[:len(labels)]).save(output)
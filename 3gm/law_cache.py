@@ -0,0 +1,332 @@
+'''
+    Lazy loading of laws.
+    LawCodifier.laws used to hold every law of the database in memory
+    although a request of the web application touches one or two of them.
+    LazyLaws is a mapping from identifier to LawParser that knows the ids
+    of all laws from a lightweight projection and loads a law the first
+    time it is accessed. Loaded laws are kept in a bounded LRU working set.
+    Passes over many laws (e.g. lemmatization) use stream, which reads
+    them with one cursor in the order of their ids instead of one query
+    per law and does not fill the working set.
+    Laws that are assigned to the mapping or modified in place (new or
+    modified laws that may not be stored yet) are pinned and are not
+    evicted until they are unpinned once stored. Laws are read from the
+    database outside the lock of the mapping.
+'''
+
+import collections
+import collections.abc
+import json
+import sys
+import threading
+import pparser as parser
+
+# Default number of laws kept in memory
+DEFAULT_CACHE_SIZE = 512
+
+
+def latest_version(document):
+    """Return the latest version of a law document as stored in the
+    laws collection and its version index, or (None, 0)"""
+    current_version = 0
+    current_instance = None
+    for v in document.get('versions') or []:
+        if int(v['_version']) >= current_version:
+            current_version = int(v['_version'])
+            current_instance = v
+    return current_instance, current_version
+
+
+def law_from_document(document):
+    """Deserialize the latest version of a law document"""
+    instance, version = latest_version(document)
+    if instance is None:
+        return None
+    law, identifier = parser.LawParser.from_serialized(instance)
+    law.version_index = version
+    return law
+
+
+class MongoLawLoader:
+    """Loads laws from the laws collection"""
+
+    query = {'versions': {'$ne': None}}
+
+    def __init__(self, db):
+        """
+        :params db : database.Database object
+        """
+        self.db = db
+
+    def ids(self):
+        """Return the identifiers of all laws without fetching them"""
+        return [x['_id'] for x in self.db.laws.find(self.query, {'_id': 1})]
+
+    def load(self, identifier):
+        """Return the latest version of a law or None"""
+        query = dict(self.query, _id=identifier)
+        document = self.db.laws.find_one(query)
+        if document is None:
+            return None
+        return law_from_document(document)
+
+    def scan(self, identifiers=None, batch_size=100):
+        """Generate (identifier, document) of laws in the order of their
+        ids with a single cursor
+        :params identifiers : Laws to read (default all)
+        """
+        query = self.query
+        if identifiers is not None:
+            query = dict(query, _id={'$in': list(identifiers)})
+        cursor = self.db.laws.find(query).sort('_id', 1).batch_size(batch_size)
+        for document in cursor:
+            yield document['_id'], document
+
+
+def iter_laws(db, batch_size=100):
+    """Generate the latest versions of all laws of the laws collection
+    with a single cursor, for passes over the whole corpus
+    :params db : database.Database object
+    """
+    cursor = db.laws.find(MongoLawLoader.query).batch_size(batch_size)
+    for document in cursor:
+        law = law_from_document(document)
+        if law is not None:
+            yield law
+
+
+class SnapshotLawLoader:
+    """Loads laws from a local snapshot of the laws collection,
+    i.e. an iterable of documents or a file with one JSON document
+    per line (as written by mongoexport)"""
+
+    def __init__(self, documents):
+        """
+        :params documents : Iterable of law documents
+        """
+        self.documents = {
+            x['_id']: x for x in documents if x.get('versions')}
+
+    @staticmethod
+    def from_file(filename):
+        """Read a snapshot with one JSON document per line"""
+        with open(filename) as f:
+            return SnapshotLawLoader(json.loads(line) for line in f if line.strip())
+
+    def ids(self):
+        """Return the identifiers of all laws"""
+        return list(self.documents.keys())
+
+    def load(self, identifier):
+        """Return the latest version of a law or None"""
+        try:
+            return law_from_document(self.documents[identifier])
+        except KeyError:
+            return None
+
+    def scan(self, identifiers=None):
+        """Generate (identifier, document) of laws in the order of their ids"""
+        if identifiers is None:
+            identifiers = self.documents
+        for identifier in sorted(set(identifiers) & set(self.documents)):
+            yield identifier, self.documents[identifier]
+
+
+def law_size(law):
+    """Approximate memory held by the text of a law in bytes"""
+    if law.is_compact():
+        return law._sentences.nbytes()
+
+    size = 0
+    for paragraphs in law._sentences.values():
+        for periods in paragraphs.values():
+            size += sys.getsizeof(periods)
+            size += sum(sys.getsizeof(p) for p in periods if p is not None)
+    return size
+
+
+def stream(laws, identifiers=None):
+    """Generate (identifier, law) of a mapping of laws in the order of
+    identifiers (default all), with a single cursor for a LazyLaws"""
+    if hasattr(laws, 'stream'):
+        return laws.stream(identifiers)
+    if identifiers is None:
+        identifiers = list(laws)
+    return ((x, laws[x]) for x in identifiers)
+
+
+class LazyLaws(collections.abc.MutableMapping):
+    """Mapping from identifier to LawParser that loads laws on first access
+    and keeps at most cache_size of them in memory"""
+
+    def __init__(self, loader, cache_size=DEFAULT_CACHE_SIZE, compact=True):
+        """
+        :params loader : Object with ids() and load(identifier) methods
+        :params cache_size : Maximum number of loaded (not pinned) laws
+        :params compact : Compact the text of loaded laws
+        """
+        self.loader = loader
+        self.cache_size = cache_size
+        self.compact = compact
+        self.ids = set(loader.ids())
+        self.cache = collections.OrderedDict()
+        self.pinned = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.RLock()
+
+    def __getitem__(self, identifier):
+        with self.lock:
+            try:
+                return self.pinned[identifier]
+            except KeyError:
+                pass
+
+            try:
+                law = self.cache[identifier]
+                self.cache.move_to_end(identifier)
+                self.hits += 1
+                return law
+            except KeyError:
+                pass
+
+            if identifier not in self.ids:
+                raise KeyError(identifier)
+            self.misses += 1
+
+        # Load without holding the lock so that a slow read does not
+        # block requests for other laws
+        law = self.loader.load(identifier)
+        if law is None:
+            raise KeyError(identifier)
+        if self.compact:
+            law.compact()
+
+        with self.lock:
+            # Another thread may have loaded or assigned it meanwhile
+            if identifier in self.pinned:
+                return self.pinned[identifier]
+            if identifier in self.cache:
+                return self.cache[identifier]
+            if identifier not in self.ids:
+                raise KeyError(identifier)
+
+            self.cache[identifier] = law
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+                self.evictions += 1
+            return law
+
+    def __setitem__(self, identifier, law):
+        """Assign a law, which is pinned until unpin is called
+        (e.g. once it has been stored)"""
+        with self.lock:
+            self.cache.pop(identifier, None)
+            self.pinned[identifier] = law
+            self.ids.add(identifier)
+
+    def pin(self, identifier):
+        """Return a law and keep it in memory until unpin is called.
+        Laws modified in place must be pinned, else the changes are
+        lost when they are evicted"""
+        law = self[identifier]
+        with self.lock:
+            if identifier in self.pinned:
+                return self.pinned[identifier]
+            self.cache.pop(identifier, None)
+            self.pinned[identifier] = law
+            return law
+
+    def unpin(self, identifier):
+        """Let a pinned law be evicted again, e.g. after it was stored"""
+        with self.lock:
+            law = self.pinned.pop(identifier, None)
+            if law is None:
+                return
+            self.cache[identifier] = law
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+                self.evictions += 1
+
+    def __delitem__(self, identifier):
+        with self.lock:
+            if identifier not in self.ids:
+                raise KeyError(identifier)
+            self.ids.discard(identifier)
+            self.cache.pop(identifier, None)
+            self.pinned.pop(identifier, None)
+
+    def stream(self, identifiers=None):
+        """Generate (identifier, law) in the order of identifiers with one
+        pass, for passes over many laws. Laws in memory are used as they
+        are and the rest are read with a single cursor of the loader
+        (if it has a scan method and identifiers are sorted) without
+        being added to the working set.
+        :params identifiers : Laws to read (default all, sorted)
+        """
+        if identifiers is None:
+            identifiers = sorted(self.ids)
+        else:
+            identifiers = list(identifiers)
+        scan = getattr(self.loader, 'scan', None)
+        if scan is None or any(a > b for a, b in zip(identifiers, identifiers[1:])):
+            for identifier in identifiers:
+                yield identifier, self[identifier]
+            return
+
+        # Read everything when most laws are needed, else only those
+        selected = set(identifiers)
+        documents = scan(None if len(selected) > len(self.ids) // 2 else selected)
+        current = next(documents, None)
+        for identifier in identifiers:
+            with self.lock:
+                law = self.pinned.get(identifier)
+                if law is None:
+                    law = self.cache.get(identifier)
+            while current is not None and current[0] < identifier:
+                current = next(documents, None)
+            if law is None and current is not None and current[0] == identifier:
+                law = law_from_document(current[1])
+            if law is None:
+                law = self[identifier]
+            yield identifier, law
+
+    def __iter__(self):
+        return iter(sorted(self.ids))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, identifier):
+        return identifier in self.ids
+
+    def is_loaded(self, identifier):
+        """Returns True if a law is in memory"""
+        return identifier in self.cache or identifier in self.pinned
+
+    def invalidate(self, identifier=None):
+        """Drop a loaded law (or all of them if None) so that it is
+        loaded again on next access. Pinned laws are kept."""
+        with self.lock:
+            if identifier is None:
+                self.cache.clear()
+            else:
+                self.cache.pop(identifier, None)
+
+    def stats(self):
+        """Return cache statistics"""
+        with self.lock:
+            laws = list(self.cache.values()) + list(self.pinned.values())
+            total = self.hits + self.misses
+            return {
+                'laws': len(self.ids),
+                'loaded': len(self.cache),
+                'pinned': len(self.pinned),
+                'cache_size': self.cache_size,
+                'bytes': sum(law_size(law) for law in laws),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / total if total else 0.0
+            }
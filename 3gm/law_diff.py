@@ -0,0 +1,113 @@
+'''
+    Differences between two versions of a law.
+    The diff page used to export both versions to issue-like text and
+    compare all of their lines with difflib.Differ, which is quadratic
+    in the length of the law. Here the versions are compared article by
+    article: articles are aligned by their id and a hash of their text,
+    identical articles are copied to the output without comparing their
+    lines and only the articles that changed are compared paragraph by
+    paragraph. Paragraphs are matched by their text, so inserting a
+    paragraph does not mark the renumbered ones after it as changed.
+
+    The output has the format of difflib.Differ, i.e. lines of the
+    issue-like export prefixed with '  ', '- ' or '+ '.
+'''
+
+import difflib
+import hashlib
+import re
+import exporters
+
+# Number of a paragraph in a plaintext export
+PARAGRAPH_NUMBER = re.compile(r'^ \d+\. ')
+
+
+class ArticleText:
+    """Lines of an article in an issue-like export"""
+
+    __slots__ = ('id', 'lines', 'keys', 'digest')
+
+    def __init__(self, law, article):
+        self.id = article
+        self.lines = []
+        # Paragraphs are matched without their number
+        self.keys = []
+        for chunk in exporters.iter_plaintext_article(law, article):
+            for line in chunk.splitlines():
+                self.lines.append(line)
+                self.keys.append(PARAGRAPH_NUMBER.sub('', line))
+        h = hashlib.sha1()
+        for line in self.lines:
+            h.update(line.encode('utf-8'))
+            h.update(b'\n')
+        self.digest = h.hexdigest()
+
+
+def law_articles(law):
+    """Return the ArticleText of every article of a law in order"""
+    return [ArticleText(law, article) for article in law.get_articles_sorted()]
+
+
+def _mark(prefix, lines):
+    for line in lines:
+        yield prefix + line
+
+
+def diff_articles(a, b):
+    """Compare two versions of an article paragraph by paragraph"""
+    if a.digest == b.digest:
+        yield from _mark('  ', b.lines)
+        return
+
+    matcher = difflib.SequenceMatcher(None, a.keys, b.keys, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            yield from _mark('  ', b.lines[j1:j2])
+        else:
+            yield from _mark('- ', a.lines[i1:i2])
+            yield from _mark('+ ', b.lines[j1:j2])
+
+
+def _merge(a, b):
+    """Articles of two unaligned runs in order of their ids, pairing
+    the articles with the same id"""
+    i, j = 0, 0
+    while i < len(a) or j < len(b):
+        if j == len(b) or (i < len(a) and int(a[i].id) < int(b[j].id)):
+            yield from _mark('- ', a[i].lines)
+            i += 1
+        elif i == len(a) or int(b[j].id) < int(a[i].id):
+            yield from _mark('+ ', b[j].lines)
+            j += 1
+        else:
+            yield from diff_articles(a[i], b[j])
+            i += 1
+            j += 1
+
+
+def diff_laws(initial, final):
+    """Generate the differences of two versions of a law
+    :params initial : LawParser of the initial version
+    :params final : LawParser of the final version
+    :returns Generator of lines in the format of difflib.Differ
+    """
+    a, b = exporters.issue_header(initial), exporters.issue_header(final)
+    a = [] if a is None else a.splitlines()
+    b = [] if b is None else b.splitlines()
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, a, b).get_opcodes():
+        if tag == 'equal':
+            yield from _mark('  ', b[j1:j2])
+        else:
+            yield from _mark('- ', a[i1:i2])
+            yield from _mark('+ ', b[j1:j2])
+
+    a, b = law_articles(initial), law_articles(final)
+    keys_a = [(x.id, x.digest) for x in a]
+    keys_b = [(x.id, x.digest) for x in b]
+    matcher = difflib.SequenceMatcher(None, keys_a, keys_b, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            for article in b[j1:j2]:
+                yield from _mark('  ', article.lines)
+        else:
+            yield from _merge(a[i1:i2], b[j1:j2])
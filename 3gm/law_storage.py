@@ -0,0 +1,159 @@
+'''
+    Compact storage of the text of a law.
+    LawParser.sentences is a dict of articles, each a dict of paragraphs,
+    each a list of period strings. Holding every law of the codifier in
+    that form costs one Python object per period plus the dicts and lists
+    around them. CompactSentences keeps the same read-only Mapping
+    interface but stores all the text of a law in a single string buffer
+    with arrays of period offsets, and interns article and paragraph ids.
+'''
+
+import collections
+import collections.abc
+import sys
+from array import array
+
+
+def _intern(x):
+    return sys.intern(x) if isinstance(x, str) else x
+
+
+class CompactArticle(collections.abc.Mapping):
+    """Read-only mapping from paragraph id to the list of its periods"""
+
+    __slots__ = ('store', 'ids', 'bounds')
+
+    def __init__(self, store, ids, bounds):
+        """
+        :params store : The CompactSentences holding the text
+        :params ids : Tuple of paragraph ids
+        :params bounds : Array with the index of the first period of each
+        paragraph, followed by the total number of periods
+        """
+        self.store = store
+        self.ids = ids
+        self.bounds = bounds
+
+    def _index(self, paragraph):
+        try:
+            return self.ids.index(paragraph)
+        except ValueError:
+            raise KeyError(paragraph)
+
+    def __getitem__(self, paragraph):
+        i = self._index(paragraph)
+        return self.store.periods(self.bounds[i], self.bounds[i + 1])
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, paragraph):
+        return paragraph in self.ids
+
+    def text(self, paragraph):
+        """Return the periods of a paragraph joined with '. '"""
+        i = self._index(paragraph)
+        return self.store.text(self.bounds[i], self.bounds[i + 1])
+
+
+class CompactSentences(collections.abc.Mapping):
+    """Read-only mapping from article id to CompactArticle. Consecutive
+    periods of a paragraph are separated in the buffer by '. ', so the
+    text of a paragraph is a single slice of the buffer. None periods
+    (left behind by some amendments) take no space in the buffer and are
+    returned as None, so that to_dict gives back the original sentences.
+    """
+
+    __slots__ = ('buffer', 'starts', 'ends', 'articles', 'missing')
+
+    separator = '. '
+
+    def __init__(self, sentences):
+        """Build from a dict of dicts of lists of periods
+        :params sentences : LawParser.sentences
+        """
+        chunks = []
+        starts = array('I')
+        ends = array('I')
+        position = 0
+        articles = {}
+        missing = []
+
+        for article, paragraphs in sentences.items():
+            ids = []
+            bounds = array('I', [len(starts)])
+
+            for paragraph, periods in paragraphs.items():
+                first = True
+                for period in periods:
+                    if period is None:
+                        missing.append(len(starts))
+                        starts.append(position)
+                        ends.append(position)
+                        continue
+                    if not first:
+                        chunks.append(self.separator)
+                        position += len(self.separator)
+                    first = False
+
+                    chunks.append(period)
+                    starts.append(position)
+                    position += len(period)
+                    ends.append(position)
+
+                ids.append(_intern(paragraph))
+                bounds.append(len(starts))
+
+            articles[_intern(article)] = CompactArticle(self, tuple(ids), bounds)
+
+        self.buffer = ''.join(chunks)
+        self.starts = starts
+        self.ends = ends
+        self.articles = articles
+        self.missing = frozenset(missing)
+
+    def __getitem__(self, article):
+        return self.articles[article]
+
+    def __iter__(self):
+        return iter(self.articles)
+
+    def __len__(self):
+        return len(self.articles)
+
+    def __contains__(self, article):
+        return article in self.articles
+
+    def periods(self, first, last):
+        """Return the periods with indices in [first, last) as a list"""
+        buffer, starts, ends = self.buffer, self.starts, self.ends
+        if self.missing:
+            return [None if k in self.missing else buffer[starts[k]:ends[k]]
+                    for k in range(first, last)]
+        return [buffer[starts[k]:ends[k]] for k in range(first, last)]
+
+    def text(self, first, last):
+        """Return the periods with indices in [first, last) joined"""
+        if first >= last:
+            return ''
+        return self.buffer[self.starts[first]:self.ends[last - 1]]
+
+    def paragraph_text(self, article, paragraph):
+        """Return the periods of a paragraph joined with '. '"""
+        return self.articles[article].text(paragraph)
+
+    def nbytes(self):
+        """Approximate memory used by the text and offsets in bytes"""
+        return sys.getsizeof(self.buffer) + \
+            (len(self.starts) + len(self.ends)) * self.starts.itemsize
+
+    def to_dict(self):
+        """Return the text as a dict of dicts of lists of periods"""
+        result = collections.defaultdict(dict)
+        for article, paragraphs in self.articles.items():
+            for paragraph in paragraphs:
+                result[article][paragraph] = paragraphs[paragraph]
+        return result
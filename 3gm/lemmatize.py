@@ -0,0 +1,356 @@
+'''
+    Lemmatization of laws for topic modelling.
+    Laws are exported to text, split in chunks of bounded length and
+    lemmatized by spaCy with nlp.pipe in a pool of processes, each of
+    which loads the model (without the parser and the named entity
+    recognizer, which are not needed for lemmas) once. The lemmatized
+    text of every law is cached by (identifier, version), so laws that
+    did not change are not lemmatized again, and is generated lazily in
+    the order of the laws so that it can be fed to a vectorizer.
+
+    A LemmaStore persists the lemmatized texts on disk across runs. Every
+    entry is keyed by the identifier of the law and a hash of its text
+    (and of the lemmatization settings), so a stale entry is never read,
+    and entries are dropped when a new version of a law is written
+    (see LawCodifier.commit_version).
+'''
+
+import collections
+import hashlib
+import multiprocessing
+import os
+import string
+import sys
+import exporters
+import law_cache
+
+# Components of the spaCy pipeline not needed for lemmas
+DISABLED_COMPONENTS = ['parser', 'ner']
+
+# Laws longer than this many characters are lemmatized in chunks
+MAX_CHUNK_LENGTH = 100000
+
+# Chunks lemmatized by a worker at a time
+DEFAULT_BATCH_SIZE = 16
+
+PUNCTUATION = set(string.punctuation)
+
+
+def load_nlp():
+    """Load the Greek spaCy model for lemmatization"""
+    # Import here for performance
+    import el_small
+    return el_small.load(disable=DISABLED_COMPONENTS)
+
+
+def load_lemmas():
+    """Return the dict of resources/greek_lemmas.py"""
+    sys.path.insert(0, '../resources')
+    import greek_lemmas
+    for name, value in vars(greek_lemmas).items():
+        if isinstance(value, dict) and not name.startswith('__'):
+            return value
+    return {}
+
+
+def contains_digit_or_num(word):
+    return any(c.isdigit() or c in PUNCTUATION for c in word)
+
+
+def export(law):
+    """The text of a law that is lemmatized"""
+    return ''.join(exporters.iter_law(law, 'str'))
+
+
+def chunk_text(text, max_length=MAX_CHUNK_LENGTH):
+    """Split a text in chunks of at most max_length characters
+    at whitespace (unless a single word is longer)"""
+    chunks = []
+    while len(text) > max_length:
+        split = text.rfind(' ', 0, max_length)
+        if split <= 0:
+            split = max_length
+        chunks.append(text[:split])
+        text = text[split:]
+    chunks.append(text)
+    return chunks
+
+
+# Default location of the lemma store
+LEMMA_STORE_PATH = '../models/lemmas'
+lemma_store = None
+
+
+class LemmaStore:
+    """Lemmatized texts of laws on disk, one file per law holding
+    the key of the text it was computed from and the lemmas"""
+
+    def __init__(self, directory=LEMMA_STORE_PATH):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, identifier):
+        name = hashlib.sha1(identifier.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, name + '.txt')
+
+    def get(self, identifier, key):
+        """Return the lemmatized text of a law if it was stored with key"""
+        try:
+            with open(self.path(identifier)) as f:
+                if f.readline().rstrip('\n') == key:
+                    self.hits += 1
+                    return f.read()
+        except FileNotFoundError:
+            pass
+        self.misses += 1
+        return None
+
+    def put(self, identifier, key, text):
+        path = self.path(identifier)
+        # Write under a temporary name so that readers never see half an entry
+        with open(path + '.tmp', 'w') as f:
+            f.write(key + '\n')
+            f.write(text)
+        os.replace(path + '.tmp', path)
+
+    def invalidate(self, identifier):
+        """Drop the entry of a law, e.g. when a new version is written"""
+        try:
+            os.remove(self.path(identifier))
+        except FileNotFoundError:
+            pass
+
+
+def get_lemma_store():
+    global lemma_store
+    if lemma_store is None:
+        lemma_store = LemmaStore()
+    return lemma_store
+
+
+def invalidate(identifier):
+    """Version hook dropping the stored lemmas of a law"""
+    if lemma_store is not None or os.path.isdir(LEMMA_STORE_PATH):
+        get_lemma_store().invalidate(identifier)
+
+
+# State of a lemmatization process, set by init_worker
+_nlp = None
+_lemmas = None
+
+
+def init_worker(lemmas, use_spacy):
+    global _nlp, _lemmas
+    _nlp = load_nlp() if use_spacy else None
+    _lemmas = lemmas
+
+
+def lemmatize_batch(args):
+    """Lemmatize a batch of chunks in a worker
+    :params args : List of (identifier, chunk) and minimum word length
+    :returns List of (identifier, list of lemmas)
+    """
+    batch, min_size = args
+    texts = [chunk for identifier, chunk in batch]
+    if _nlp is not None:
+        docs = ([(t.text, t.lemma_) for t in doc]
+                for doc in _nlp.pipe(texts, batch_size=len(texts)))
+    else:
+        docs = ([(w, w) for w in text.split()] for text in texts)
+
+    result = []
+    for (identifier, chunk), tokens in zip(batch, docs):
+        words = []
+        for text, lemma in tokens:
+            if len(text) < min_size or contains_digit_or_num(text):
+                continue
+            words.append(_lemmas.get(lemma, _lemmas.get(text, text)))
+        result.append((identifier, words))
+    return result
+
+
+class Lemmatizer:
+    """Lemmatizes laws and caches the result per (identifier, version)"""
+
+    def __init__(self, use_spacy=True, processes=None, min_size=4,
+                 max_length=MAX_CHUNK_LENGTH, batch_size=DEFAULT_BATCH_SIZE,
+                 lemmas=None, store=None):
+        """
+        :params use_spacy : Lemmatize with spaCy, else split on whitespace
+        :params processes : Number of processes (default number of cores - 1)
+        :params min_size : Words shorter than this are dropped
+        :params max_length : Maximum length of a chunk
+        :params batch_size : Chunks per task of a worker
+        :params lemmas : Dict from words to lemmas (default resources/greek_lemmas.py)
+        :params store : LemmaStore persisting the results (optional)
+        """
+        if processes is None:
+            processes = max(1, multiprocessing.cpu_count() - 1)
+        if lemmas is None:
+            lemmas = load_lemmas()
+        self.use_spacy = use_spacy
+        self.processes = processes
+        self.min_size = min_size
+        self.max_length = max_length
+        self.batch_size = batch_size
+        self.lemmas = lemmas
+        self.store = store
+        # identifier -> (version, lemmatized text)
+        self.cache = {}
+        # identifier -> (version, key of the text in the store)
+        self.keys = {}
+
+    def cached(self, law):
+        """Return the cached text of the current version of a law or None"""
+        version, text = self.cache.get(law.identifier, (None, None))
+        return text if version == law.version_index else None
+
+    def key(self, law, text=None):
+        """Hash of the text of a law and the settings it is lemmatized with
+        :params text : The law exported to text, if already exported
+        """
+        version, key = self.keys.get(law.identifier, (None, None))
+        if version != law.version_index:
+            if text is None:
+                text = export(law)
+            h = hashlib.sha1('{} {}\n'.format(self.use_spacy, self.min_size).encode('utf-8'))
+            h.update(text.encode('utf-8'))
+            key = h.hexdigest()
+            self.keys[law.identifier] = (law.version_index, key)
+        return key
+
+    def load(self, law, text=None):
+        """Return the text of a law from the cache or the store or None
+        :params text : The law exported to text, if already exported
+        """
+        lemmatized = self.cached(law)
+        if lemmatized is None and self.store is not None:
+            lemmatized = self.store.get(law.identifier, self.key(law, text))
+            if lemmatized is not None:
+                self.cache[law.identifier] = (law.version_index, lemmatized)
+        return lemmatized
+
+    def lemmatize(self, laws, identifiers=None):
+        """Generate the lemmatized text of laws in order. Every law is
+        read once (see law_cache.stream) and exported to text at most
+        once, for both its key and its chunks, and missing laws are
+        lemmatized in the pool while the next laws are read.
+        :params laws : Mapping from identifier to LawParser (e.g. LawCodifier.laws)
+        :params identifiers : The laws to lemmatize (default all)
+        :returns Generator of (identifier, text)
+        """
+        # Laws in order as (identifier, version, key, text, number of
+        # chunks), text is None until their chunks are lemmatized
+        order = collections.deque()
+        # Lemmas of the lemmatized chunks in order
+        lemmas = collections.deque()
+        submitted = collections.deque()
+        pending = set()
+        batch = []
+        pool = None
+        started = False
+
+        def submit(batch):
+            nonlocal pool, started
+            if self.processes == 1:
+                if not started:
+                    init_worker(self.lemmas, self.use_spacy)
+                    started = True
+                lemmas.extend(words for _, words in lemmatize_batch((batch, self.min_size)))
+                return
+            if pool is None:
+                pool = multiprocessing.Pool(
+                    self.processes, initializer=init_worker,
+                    initargs=(self.lemmas, self.use_spacy))
+            submitted.append(pool.apply_async(lemmatize_batch, ((batch, self.min_size),)))
+
+        def collect(block):
+            # Bound the batches in flight, keep the finished ones in order
+            while submitted and (block or submitted[0].ready()
+                                 or len(submitted) > 2 * self.processes):
+                lemmas.extend(words for _, words in submitted.popleft().get())
+
+        def ready():
+            while order:
+                identifier, version, key, text, n = order[0]
+                if text is None and n is None:
+                    # Repeated law, lemmatized for its first occurrence
+                    text = self.cache[identifier][1]
+                elif text is None:
+                    if len(lemmas) < n:
+                        return
+                    # The chunks of a law are consecutive, join them back
+                    words = []
+                    for _ in range(n):
+                        words.extend(lemmas.popleft())
+                    text = ' '.join(words)
+                    self.cache[identifier] = (version, text)
+                    pending.discard(identifier)
+                    if self.store is not None:
+                        self.store.put(identifier, key, text)
+                order.popleft()
+                yield identifier, text
+
+        try:
+            for identifier, law in law_cache.stream(laws, identifiers):
+                version = law.version_index
+                text = self.cached(law)
+                exported = None
+                if text is None and identifier not in pending:
+                    if self.store is not None and self.keys.get(identifier, (None,))[0] != version:
+                        exported = export(law)
+                    text = self.load(law, exported)
+                if text is not None:
+                    order.append((identifier, version, None, text, 0))
+                elif identifier in pending:
+                    order.append((identifier, version, None, None, None))
+                else:
+                    if exported is None:
+                        exported = export(law)
+                    key = self.key(law, exported) if self.store is not None else None
+                    chunks = chunk_text(exported, self.max_length)
+                    for chunk in chunks:
+                        batch.append((identifier, chunk))
+                        if len(batch) == self.batch_size:
+                            submit(batch)
+                            batch = []
+                    order.append((identifier, version, key, None, len(chunks)))
+                    pending.add(identifier)
+                collect(False)
+                yield from ready()
+
+            if batch != []:
+                submit(batch)
+            collect(True)
+            yield from ready()
+        finally:
+            if pool is not None:
+                pool.terminate()
+
+
+class LemmatizedCorpus:
+    """Re-iterable corpus of the lemmatized texts of laws, e.g. the
+    data samples of a vectorizer. Texts are lemmatized during the first
+    iteration and read from the cache of the Lemmatizer afterwards."""
+
+    def __init__(self, lemmatizer, laws, identifiers=None):
+        self.lemmatizer = lemmatizer
+        self.laws = laws
+        self.identifiers = list(laws) if identifiers is None else list(identifiers)
+
+    def __len__(self):
+        return len(self.identifiers)
+
+    def __iter__(self):
+        for identifier, text in self.lemmatizer.lemmatize(self.laws, self.identifiers):
+            yield text
+
+    def fingerprint(self):
+        """Hash of the texts of the laws, which changes when any
+        law is added, removed or modified"""
+        h = hashlib.sha1()
+        for identifier, law in law_cache.stream(self.laws, self.identifiers):
+            h.update('{} {}\n'.format(identifier, self.lemmatizer.key(law)).encode('utf-8'))
+        return h.hexdigest()
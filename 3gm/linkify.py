@@ -0,0 +1,105 @@
+'''
+    Hyperlinks to statutes mentioned in a text.
+    All statute patterns of entities.LegalEntities are combined into a
+    single compiled alternation, so a text is scanned once and the output
+    is assembled from the text between matches and the links. The links
+    of the known statutes are computed once on startup (see precompute),
+    the links of other mentions are kept in a bounded LRU memo.
+'''
+
+import collections
+import re
+import entities
+
+# Links of statutes that were not precomputed kept per output type
+DEFAULT_MAX_LINKS = 10000
+
+# A pattern starting with a group of plain alternatives e.g. (ν.|Ν.) ...
+LEADING_GROUP_REGEX = re.compile(r'^\(([^()]*)\)(.*)$')
+
+
+def expand_leading_group(pattern):
+    """Rewrite (a|b)rest as a rest|b rest. When every branch of an
+    alternation starts with a literal the regex engine scans for the
+    first characters before matching, which makes the combined
+    pattern faster than running each pattern separately"""
+    match = LEADING_GROUP_REGEX.match(pattern)
+    if not match:
+        return [pattern]
+    return [x + match.group(2) for x in match.group(1).split('|')]
+
+
+class Linkifier:
+    """Replace mentions of statutes with markdown or HTML links"""
+
+    formats = {
+        'markdown': '[{0}]({1})',
+        'html': '<a href="{1}">{0}</a>'
+    }
+
+    def __init__(self, url_for_statute, patterns=None, max_links=DEFAULT_MAX_LINKS):
+        """
+        :params url_for_statute : Function from a statute to its URL
+        :params patterns : List of regular expressions of statutes
+        (default entities.LegalEntities.entities)
+        :params max_links : Links of statutes that were not precomputed
+        memoized per output type
+        """
+        if patterns is None:
+            patterns = entities.LegalEntities.entities
+        branches = [x for p in patterns for x in expand_leading_group(p)]
+        self.regex = re.compile('|'.join('(?:{})'.format(x) for x in branches))
+        self.url_for_statute = url_for_statute
+        self.max_links = max_links
+        # Precomputed links of known statutes
+        self.links = {link_type: {} for link_type in self.formats}
+        # Links of other mentions, least recently used first
+        self.recent = {link_type: collections.OrderedDict() for link_type in self.formats}
+
+    def format(self, statute, link_type):
+        return self.formats[link_type].format(statute, self.url_for_statute(statute))
+
+    def link(self, statute, link_type='markdown'):
+        """Return the link of a statute"""
+        try:
+            return self.links[link_type][statute]
+        except KeyError:
+            pass
+
+        recent = self.recent[link_type]
+        try:
+            recent.move_to_end(statute)
+            return recent[statute]
+        except KeyError:
+            pass
+
+        link = self.format(statute, link_type)
+        recent[statute] = link
+        while len(recent) > self.max_links:
+            recent.popitem(last=False)
+        return link
+
+    def precompute(self, statutes):
+        """Compute the links of the given statutes (e.g. all statutes
+        of the codifier) in advance. They are never evicted"""
+        for statute in statutes:
+            for link_type in self.formats:
+                self.links[link_type][statute] = self.format(statute, link_type)
+
+    def render(self, content, link_type='markdown'):
+        """Return content with every statute replaced by a link
+        :params content : Markdown or plain text
+        :params link_type : markdown or html
+        """
+        pieces = []
+        position = 0
+        for match in self.regex.finditer(content):
+            pieces.append(content[position:match.start()])
+            pieces.append(self.link(match.group(), link_type))
+            position = match.end()
+
+        if position == 0:
+            return content
+
+        pieces.append(content[position:])
+        return ''.join(pieces)
@@ -1,24 +1,120 @@
 import tokenizer
 import re
+import bisect
 import entities
 import helpers
 
+class PeriodIndex:
+	"""Positional index over the periods of a paragraph.
+	The periods are joined with '. ' once and the start offset of every
+	period is kept, so that a phrase is located with a literal substring
+	search (possibly across period boundaries) and only the periods it
+	touches are edited and re-tokenized.
+	"""
+
+	separator = '. '
+
+	def __init__(self, periods):
+		"""
+		:params periods : List of periods of a paragraph
+		"""
+		self.periods = [p for p in periods if p is not None]
+		self.text = self.separator.join(self.periods)
+		self.starts = []
+		position = 0
+		for p in self.periods:
+			self.starts.append(position)
+			position += len(p) + len(self.separator)
+
+	def period_at(self, offset):
+		"""Index of the period containing (or preceding) an offset"""
+		return max(bisect.bisect_right(self.starts, offset) - 1, 0)
+
+	def period_end(self, i):
+		"""Offset one past the last character of period i"""
+		return self.starts[i] + len(self.periods[i])
+
+	def find(self, phrase):
+		"""Generate the (start, end) offsets of non-overlapping
+		literal occurrences of phrase"""
+		if not phrase:
+			return
+		start = self.text.find(phrase)
+		while start != -1:
+			yield start, start + len(phrase)
+			start = self.text.find(phrase, start + len(phrase))
+
+	def span(self, start, end):
+		"""First and last period touched by text[start:end]"""
+		first = self.period_at(start)
+		last = self.period_at(max(end - 1, start))
+		if end > self.period_end(last) and last + 1 < len(self.periods):
+			last += 1
+		return first, last
+
+	def replace(self, old_phrase, new_phrase):
+		"""Return the periods with every occurrence of old_phrase
+		replaced by new_phrase"""
+		matches = list(self.find(old_phrase))
+		if matches == []:
+			return list(self.periods)
+
+		result = []
+		done = 0
+		k = 0
+		while k < len(matches):
+			first, last = self.span(*matches[k])
+			group = [matches[k]]
+			k += 1
+
+			# Matches touching the same periods are edited together
+			while k < len(matches) and self.period_at(matches[k][0]) <= last:
+				last = max(last, self.span(*matches[k])[1])
+				group.append(matches[k])
+				k += 1
+
+			pieces = []
+			position = self.starts[first]
+			for start, end in group:
+				pieces.append(self.text[position:start])
+				pieces.append(new_phrase)
+				position = end
+			pieces.append(self.text[position:self.period_end(last)])
+
+			result.extend(self.periods[done:first])
+			result.extend(self.split(''.join(pieces)))
+			done = last + 1
+
+		result.extend(self.periods[done:])
+		return result
+
+	def split(self, text):
+		"""Tokenize edited text into periods. Text without a separator
+		is a single period and needs no tokenization"""
+		if self.separator not in text:
+			return [text]
+		return tokenizer.tokenizer.split(text, False, self.separator)
+
+	def edit_period(self, i, content):
+		"""Return the periods with period i replaced by content,
+		re-tokenized locally"""
+		result = list(self.periods)
+		if i < 0:
+			i += len(result)
+		result[i:i + 1] = self.split(content)
+		return result
+
 def replace_phrase(
 		s,
 		old_phrase,
 		new_phrase):
-	"""Replacement of phrase inside document
+	"""Replacement of phrase inside document. The phrase is matched
+	literally and may span consecutive periods
 	:old_phrase phrase to be replaced
 	:new_phrase new phrase
-	:article optional detect phrase in certain article
-	:paragraph optional detect phrase in certain paragraph
 	"""
 
-	joined = '. '.join(s)
-	joined = re.sub(old_phrase, new_phrase, joined)
-	splitted = tokenizer.tokenizer.split(joined, False, '. ')
-
-	return splitted
+	return PeriodIndex(s).replace(old_phrase, new_phrase)
 
 def remove_phrase(s, old_phrase):
 	return replace_phrase(s, old_phrase, '')
@@ -31,26 +127,26 @@ def insert_phrase(
 
 	"""Phrase insertion with respect to another phrase"""
 
-	joined = '. '.join(s)
+	index = PeriodIndex(s)
+
+	if position in ['prepend', 'append'] and index.periods == []:
+		return tokenizer.tokenizer.split(
+			new_phrase + ' ' if position == 'prepend' else ' ' + new_phrase,
+			False, '. ')
 
 	if position == 'prepend':
-		joined = new_phrase + ' ' + joined
+		return index.edit_period(0, new_phrase + ' ' + index.periods[0])
 	elif position == 'append':
-		joined = joined + ' ' + new_phrase
+		return index.edit_period(-1, index.periods[-1] + ' ' + new_phrase)
 	elif position in ['before', 'after']:
 		assert(old_phrase != '')
 		if position == 'before':
 			rep = new_phrase + ' ' + old_phrase
-		elif position == 'after':
-			rep = old_phrase + ' ' + new_phrase
 		else:
-			raise Exception('Not a valid position')
-		q = replace_phrase(s, old_phrase, rep)
-		joined = '. '.join(q)
-
-	splitted = tokenizer.tokenizer.split(joined, False, '. ')
-
-	return splitted
+			rep = old_phrase + ' ' + new_phrase
+		return index.replace(old_phrase, rep)
+	else:
+		raise Exception('Not a valid position')
 
 def get_cases(s):
 	cases = []
@@ -22,6 +22,8 @@ import sys
 import phrase_fun
 import syntax
 import json
+import law_storage
+import exporters
 
 # configuration and parameters
 
@@ -461,6 +463,10 @@ def get_issues_from_dataset(directory='../data', text_format=False):
     return issues
 
 
+# Record returned by the mutation methods of LawParser
+Change = collections.namedtuple('Change', ['action', 'article', 'paragraph'])
+
+
 class LawParser:
     """
     This class hosts the law parser. The law is provided
@@ -468,8 +474,9 @@ class LawParser:
     split in articles and sentences, ready to be stored in
     the database. This class supports insertions, replacements
     and deletions of articles, paragraphs, phrases and periods.
-    It can also provide a serializable object for updating the
-    database with its contents.
+    Mutation methods return a Change record; a serializable
+    object for updating the database with its contents is built
+    on demand by serialize() at version boundaries.
     """
 
     def __init__(self, identifier, filename=None, autoincrement_version=False):
@@ -519,6 +526,31 @@ class LawParser:
     def __str__(self):
         return self.identifier
 
+    @property
+    def sentences(self):
+        """Articles, paragraphs and periods of the law. Accessing it
+        turns a compacted law back into mutable dicts and lists"""
+        if isinstance(self._sentences, law_storage.CompactSentences):
+            self._sentences = self._sentences.to_dict()
+        return self._sentences
+
+    @sentences.setter
+    def sentences(self, value):
+        self._sentences = value
+
+    def compact(self):
+        """Keep the text in a law_storage.CompactSentences to save memory.
+        Read-only accessors (get_paragraph, get_paragraphs, export_law,
+        serialize etc.) work on it directly; accessing sentences restores
+        the mutable representation"""
+        if not isinstance(self._sentences, law_storage.CompactSentences):
+            self._sentences = law_storage.CompactSentences(self._sentences)
+        return self
+
+    def is_compact(self):
+        """Returns True if the text is kept in compact form"""
+        return isinstance(self._sentences, law_storage.CompactSentences)
+
     def fix_paragraphs(self, lines, get_title=True):
         """Fix paragraphs in a text. That means that
         a corpus of lines enumerated with natural numbers
@@ -660,12 +692,17 @@ class LawParser:
         if self.autoincrement_version:
             self.version_index += 1
 
+        if self.is_compact():
+            articles = self._sentences.to_dict()
+        else:
+            articles = self._sentences
+
         return {
             '_id': self.identifier,
             'thesaurus': self.thesaurus,
             'lemmas': self.lemmas,
             'titles': self.titles,
-            'articles': self.sentences,
+            'articles': articles,
             'amendee': self.amendee
         }
 
@@ -734,7 +771,7 @@ class LawParser:
         if lemmas:
             self.lemmas[article] = lemmas
 
-        return self.serialize()
+        return Change('add_article', article, None)
 
     def remove_article(self, article):
         """Removal of article based on its id
@@ -759,7 +796,7 @@ class LawParser:
         except BaseException:
             logging.warning('Could not find titles')
 
-        return self.serialize()
+        return Change('remove_article', article, None)
 
     def add_paragraph(self, article, paragraph, content):
         """Addition of paragraph on article
@@ -782,7 +819,7 @@ class LawParser:
         self.sentences[article][paragraph] = tokenizer.tokenizer.split(
             content, False, '. ')
 
-        return self.serialize()
+        return Change('add_paragraph', article, paragraph)
 
     def remove_paragraph(self, article, paragraph):
         """Removal of paragraph"""
@@ -795,7 +832,7 @@ class LawParser:
         except BaseException:
             pass
 
-        return self.serialize()
+        return Change('remove_paragraph', article, paragraph)
 
     def replace_phrase(
             self,
@@ -815,7 +852,7 @@ class LawParser:
             old_phrase=old_phrase
         )
 
-        return self.serialize()
+        return Change('replace_phrase', article, paragraph)
 
     def remove_phrase(self, old_phrase, article=None, paragraph=None):
         """Removal of certain phrase i.e. replacement with empty string"""
@@ -838,7 +875,7 @@ class LawParser:
             old_phrase=old_phrase
         )
 
-        return self.serialize()
+        return Change('insert_phrase', article, paragraph)
 
     def renumber_case(
             self,
@@ -860,7 +897,7 @@ class LawParser:
             new_letter=new_letter,
             suffix=suffix)
 
-        return self.serialize()
+        return Change('renumber_case', article, paragraph)
 
     def insert_case(
             self,
@@ -884,7 +921,7 @@ class LawParser:
             suffix=suffix
         )
 
-        return self.serialize()
+        return Change('insert_case', article, paragraph)
 
     def replace_case(
             self,
@@ -908,7 +945,7 @@ class LawParser:
             suffix=suffix
         )
 
-        return self.serialize()
+        return Change('replace_case', article, paragraph)
 
     def delete_case(
             self,
@@ -928,7 +965,7 @@ class LawParser:
             case_letter=case_letter,
         )
 
-        return self.serialize()
+        return Change('delete_case', article, paragraph)
 
     def replace_period(
             self,
@@ -965,7 +1002,7 @@ class LawParser:
         else:
             self.sentences[article][paragraph][int(position)] = new_period
 
-        return self.serialize()
+        return Change('replace_period', article, paragraph)
 
     def remove_period(
             self,
@@ -997,11 +1034,11 @@ class LawParser:
                             self.sentences[article][paragraph]):
                         if old_period == period or old_period == period[:-1]:
                             del self.sentences[article][paragraph][i]
-                            return self.serialize()
+                            return Change('remove_period', article, paragraph)
         else:
             del self.sentences[article][paragraph][int(position)]
 
-        return self.serialize()
+        return Change('remove_period', article, paragraph)
 
     def insert_period(
             self,
@@ -1028,11 +1065,11 @@ class LawParser:
             else:
                 self.append_period(new_period, article, paragraph)
 
-            return self.serialize()
+            return Change('insert_period', article, paragraph)
 
         elif isinstance(position, int):
             self.sentences[article][paragraph].insert(position, new_period)
-            return self.serialize()
+            return Change('insert_period', article, paragraph)
         else:
             search_all = (article is None)
 
@@ -1057,14 +1094,14 @@ class LawParser:
                             if position == 'before':
                                 self.sentences[article][paragraph].insert(
                                     max(0, i - 1), new_period)
-                                return self.serialize()
+                                return Change('insert_period', article, paragraph)
 
                             elif position == 'after':
                                 self.sentences[article][paragraph].insert(
                                     i + 1, new_period)
-                                return self.serialize()
+                                return Change('insert_period', article, paragraph)
 
-        return self.serialize()
+        return Change('insert_period', article, paragraph)
 
     def append_period(self, content, article, paragraph):
         """Append period to article and paragraph
@@ -1075,6 +1112,7 @@ class LawParser:
         assert(article and paragraph)
         article, paragraph = str(article), str(paragraph)
         self.sentences[article][paragraph].append(content)
+        return Change('append_period', article, paragraph)
 
     def set_title(self, content, article):
         """Set title of article
@@ -1084,7 +1122,7 @@ class LawParser:
         assert(article)
         article = str(article)
         self.titles[article] = content
-        return self.serialize()
+        return Change('set_title', article, None)
 
     def delete_title(self, article):
         """Delete the title of an article
@@ -1093,14 +1131,14 @@ class LawParser:
         assert(article)
         article = str(article)
         del self.titles[article]
-        return self.serialize()
+        return Change('delete_title', article, None)
 
     def renumber_article(self, old_id, new_id):
         """Renumber article to new id"""
         assert(article)
         self.sentences[new_id] = copy.deepcopy(self.sentences[old_id])
         del self.sentences[old_id]
-        return self.serialize()
+        return Change('renumber_article', new_id, None)
 
     def renumber_paragraph(self, article, old_id, new_id):
         """Renumber paragraph to new id"""
@@ -1108,12 +1146,12 @@ class LawParser:
         self.sentences[article][new_id] = copy.deepcopy(
             self.sentences[article][old_id])
         del self.sentences[article][old_id]
-        return self.serialize()
+        return Change('renumber_paragraph', article, new_id)
 
     def delete(self):
         self.sentences = {}
         self.titles = {}
-        return self.serialize()
+        return Change('delete', None, None)
 
     def apply_amendment(self, s, is_removal=False, throw_exceptions=False):
         """Applies amendment given a string s
@@ -1139,7 +1177,9 @@ class LawParser:
         return detected, applied, self
 
     def query_from_tree(self, tree):
-        """Returns a serizlizable object from a tree in nested form
+        """Applies the query of a tree in nested form and returns
+        the Change record of the mutation (None if nothing was applied).
+        Call serialize() to obtain a serializable object.
         :params tree : A query tree generated from syntax.py
         """
         # Additive / Modifying actions
@@ -1325,13 +1365,17 @@ class LawParser:
             else:
                 raise UnsupportedOperationException(tree)
 
-        return self.serialize()
+        return None
 
     def get_paragraph(self, article, paragraph_id):
         """Join sentences to paragraph
         :params article : Article number
         :params paragraph_id : Paragraph ID
         """
+        if self.is_compact():
+            return self._sentences.paragraph_text(
+                article, paragraph_id).rstrip('.') + '.'
+
         try:
             return '. '.join(self.sentences[article][paragraph_id]).rstrip('.') + '.'
         except:
@@ -1342,8 +1386,8 @@ class LawParser:
             return '. '.join(self.sentences[article][paragraph_id]).rstrip('.') + '.'
 
 
-    def get_paragraphs(self, article):
-        """Return Paragraphs via a generator
+    def get_paragraph_ids(self, article):
+        """Return the paragraph ids of an article sorted
         :params article : The article number
         """
         def _get_par(x):
@@ -1352,88 +1396,37 @@ class LawParser:
             except:
                 return 100
 
+        return sorted(self._sentences[str(article)].keys(), key=_get_par)
+
+    def get_periods(self, article, paragraph_id):
+        """Return the periods of a paragraph
+        :params article : Article number
+        :params paragraph_id : Paragraph ID
+        """
+        return [p for p in self._sentences[article][paragraph_id] if p is not None]
+
+    def get_paragraphs(self, article):
+        """Return Paragraphs via a generator
+        :params article : The article number
+        """
         article = str(article)
-        for paragraph_id in sorted(
-                self.sentences[article].keys(),
-                key=_get_par):
+        for paragraph_id in self.get_paragraph_ids(article):
             yield self.get_paragraph(article, paragraph_id)
 
+    def get_articles(self):
+        """Returns the article ids of the statute"""
+        return list(self._sentences.keys())
+
     def get_articles_sorted(self):
         """Returns the articles of the statute sorted"""
-        return sorted(self.sentences.keys(), key=lambda x: int(x))
+        return sorted(self._sentences.keys(), key=lambda x: int(x))
 
     def export_law(self, export_type='markdown', add_titles=True):
         """Get law string in LaTeX, Markdown, string, plaintext and Issue-like format
-        :param identifier : Law identifier
+        :param export_type : One of exporters.EXPORT_TYPES
+        :param add_titles : Include the titles of the articles
         """
-        if export_type not in [
-            'latex',
-            'markdown',
-            'str',
-            'plaintext',
-                'issue']:
-            raise Exception('Unrecognized export type')
-
-        if export_type == 'latex':
-            result = '\chapter*{{ {} }}'.format(self.identifier)
-            for article in self.get_articles_sorted():
-                result = result + \
-                    '\subsection*{{ Άρθρο {} }}\n'.format(article)
-                for i, paragraph in enumerate(self.get_paragraphs(article)):
-                    result = result + '\paragraph {{ {}. }} {}\n'.format(
-                        i, paragraph)
-        elif export_type == 'markdown':
-
-            result = '# {}\n'.format(self.identifier)
-            for article in self.get_articles_sorted():
-                result = result + '### Άρθρο {} \n'.format(article)
-                if add_titles:
-                    try:
-                        result = result + '#### {}\n'.format(self.titles[article])
-                    except:
-                        pass
-                for i, paragraph in enumerate(self.get_paragraphs(article)):
-                    result = result + \
-                        ' {}. {}\n'.format(i, paragraph)
-
-        elif export_type == 'str':
-            result = ''
-            for article in self.get_articles_sorted():
-                result = result + 'Άρθρο {} '.format(article)
-                for i, paragraph in enumerate(self.get_paragraphs(article)):
-                    result = result + '{}'.format(paragraph)
-
-        elif export_type == 'plaintext':
-
-            result = ''
-            for article in self.get_articles_sorted():
-                result = result + 'Άρθρο {} \n'.format(article)
-                if add_titles:
-                    try:
-                        result = result + '{}\n'.format(self.titles[article])
-                    except:
-                        pass
-                for i, paragraph in enumerate(self.get_paragraphs(article)):
-                    result = result + \
-                        ' {}. {}\n'.format(i + 1, paragraph)
-
-        elif export_type == 'issue':
-            abbreviations = {
-                'ν.': 'ΝΌΜΟΣ',
-                'π.δ.': 'ΠΡΟΕΔΡΙΚΟ ΔΙΑΤΑΓΜΑ',
-                'ν.δ.': 'ΝΟΜΟΘΕΤΙΚΟ ΔΙΑΤΑΓΜΑ'
-            }
-            result = ''
-
-            for key, val in abbreviations.items():
-                if self.identifier.lower().startswith(key):
-                    counter = self.identifier.strip(key).split('/')[-2]
-                    result = '{} ΥΠ’ ΑΡΙΘΜ. {}\n'.format(val, counter)
-                    break
-
-            result = result + self.export_law('plaintext')
-
-        return result
+        return ''.join(exporters.iter_law(self, export_type, add_titles))
 
     def prune_title(self, article):
         self.titles[article] = re.sub(
@@ -1445,11 +1438,11 @@ class LawParser:
             self.prune_title(title)
 
     def get_next_article(self):
-        maximum = max([int(x) for x in self.sentences.keys()])
+        maximum = max([int(x) for x in self._sentences.keys()])
         return str(maximum + 1)
 
     def get_next_paragraph(self, article):
-        maximum = max([int(x) for x in self.sentences[article].keys()])
+        maximum = max([int(x) for x in self._sentences[article].keys()])
         return str(maximum + 1)
 
 
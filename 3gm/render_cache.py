@@ -0,0 +1,116 @@
+'''
+    Cache of rendered laws for the web application.
+    Exporting a large law to markdown and rendering it to HTML is
+    expensive, so rendered output is kept in a size-bounded LRU cache
+    keyed by (law id, version index, export type). Entries of a law are
+    invalidated whenever a new version of it is written.
+'''
+
+import collections
+import sys
+import threading
+
+# Default memory budget of the cache in bytes
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def sizeof(value):
+    """Approximate size of a cached value, i.e. a string or a tuple
+    of strings and lists of strings"""
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(sizeof(x) for x in value)
+    return sys.getsizeof(value)
+
+
+class RenderCache:
+    """Size-bounded LRU cache of rendered laws"""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        """Initialize empty cache
+        :params max_bytes : Memory budget. Least recently used entries are
+        evicted when it is exceeded
+        """
+        self.max_bytes = max_bytes
+        self.entries = collections.OrderedDict()
+        self.keys_by_law = collections.defaultdict(set)
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        """Returns the number of cached entries"""
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, identifier, version, export_type, render):
+        """Return a rendered law, rendering it on a miss
+        :params identifier : Law identifier
+        :params version : Version index of the law
+        :params export_type : Kind of output e.g. markdown or html
+        :params render : Function with no arguments returning the output
+        """
+        key = (identifier, version, export_type)
+        with self.lock:
+            try:
+                value = self.entries[key][0]
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return value
+            except KeyError:
+                self.misses += 1
+
+        value = render()
+        self.put(key, value)
+        return value
+
+    def put(self, key, value):
+        """Insert a rendered law and evict entries over the budget"""
+        size = sizeof(value)
+        if size > self.max_bytes:
+            return
+
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (value, size)
+            self.keys_by_law[key[0]].add(key)
+            self.size += size
+
+            while self.size > self.max_bytes:
+                oldest = next(iter(self.entries))
+                self._remove(oldest)
+
+    def _remove(self, key):
+        value, size = self.entries.pop(key)
+        self.size -= size
+        keys = self.keys_by_law[key[0]]
+        keys.discard(key)
+        if not keys:
+            del self.keys_by_law[key[0]]
+
+    def invalidate(self, identifier=None):
+        """Drop every cached output of a law (or everything if None)"""
+        with self.lock:
+            if identifier is None:
+                self.entries.clear()
+                self.keys_by_law.clear()
+                self.size = 0
+                return
+
+            for key in list(self.keys_by_law.get(identifier, ())):
+                self._remove(key)
+
+    def stats(self):
+        """Return cache statistics"""
+        total = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'bytes': self.size,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0
+        }
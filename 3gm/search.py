@@ -0,0 +1,250 @@
+'''
+    Full-text search over the current versions of the codified laws.
+    Every paragraph is a document of a positional inverted index: for
+    each normalized term (lowercase, without accents, see
+    autocomplete.normalize) the index keeps the paragraphs containing it
+    and the positions of the term in them. Phrase queries intersect the
+    postings of their terms and check that the positions are consecutive.
+    A query ending with '*' matches the last term as a prefix.
+
+    Indexing the whole corpus takes long, so the index is built by the
+    search stage of the build pipeline, which reads the current versions
+    of the laws with a single cursor, and saved to SEARCH_INDEX_PATH,
+    from where the web application loads it on startup.
+'''
+
+import bisect
+import collections
+import collections.abc
+import os
+import pickle
+import re
+import threading
+import helpers
+from autocomplete import normalize
+
+# Location of the index built by the search stage
+SEARCH_INDEX_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'models', 'search_index.pickle')
+
+# Terms are maximal runs of word characters of the normalized text
+TERM_REGEX = re.compile(r'\w+')
+
+SearchResult = collections.namedtuple(
+    'SearchResult', ['identifier', 'article', 'paragraph', 'count'])
+
+
+def tokenize(text):
+    """Return the normalized terms of a text"""
+    return TERM_REGEX.findall(normalize(text))
+
+
+class SearchIndex:
+    """Positional inverted index over the paragraphs of laws"""
+
+    # Upper bound for all characters following a prefix
+    sentinel = '\U0010ffff'
+
+    def __init__(self):
+        # term -> {document: [positions]}
+        self.postings = collections.defaultdict(dict)
+        # document -> (identifier, article, paragraph)
+        self.documents = {}
+        # document -> terms it contains (needed to remove it)
+        self.document_terms = {}
+        # identifier -> documents of the law
+        self.documents_by_law = collections.defaultdict(list)
+        self.next_document = 0
+        self.sorted_terms = None
+        self.lock = threading.RLock()
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state['lock']
+        state['sorted_terms'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.RLock()
+
+    def save(self, path=SEARCH_INDEX_PATH):
+        """Save the index, writing under a temporary name so that
+        readers never see half an index"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self.lock:
+            with open(path + '.tmp', 'wb') as f:
+                pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+
+    @staticmethod
+    def load(path=SEARCH_INDEX_PATH):
+        """Load a saved index or return None if there is none"""
+        try:
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+
+    def __len__(self):
+        """Returns the number of indexed laws"""
+        return len(self.documents_by_law)
+
+    def __contains__(self, identifier):
+        return identifier in self.documents_by_law
+
+    def add(self, law):
+        """Index the paragraphs of a law
+        :params law : LawParser object
+        """
+        with self.lock:
+            if law.identifier in self.documents_by_law:
+                self.remove(law.identifier)
+
+            for article in law.get_articles():
+                for paragraph in law.get_paragraph_ids(article):
+                    text = law.get_paragraph(article, paragraph)
+                    self.add_document(law.identifier, article, paragraph, text)
+            self.sorted_terms = None
+
+    def add_document(self, identifier, article, paragraph, text):
+        """Index a single paragraph"""
+        document = self.next_document
+        self.next_document += 1
+
+        positions = collections.defaultdict(list)
+        for i, term in enumerate(tokenize(text)):
+            positions[term].append(i)
+
+        for term, p in positions.items():
+            self.postings[term][document] = p
+
+        self.documents[document] = (identifier, article, paragraph)
+        self.document_terms[document] = tuple(positions.keys())
+        self.documents_by_law[identifier].append(document)
+
+    def remove(self, identifier):
+        """Remove a law from the index"""
+        with self.lock:
+            for document in self.documents_by_law.pop(identifier, []):
+                for term in self.document_terms.pop(document):
+                    postings = self.postings[term]
+                    del postings[document]
+                    if not postings:
+                        del self.postings[term]
+                del self.documents[document]
+            self.sorted_terms = None
+
+    def update(self, law):
+        """Reindex a law, e.g. when a new version of it is written"""
+        self.add(law)
+
+    def expand(self, prefix):
+        """Return the indexed terms starting with prefix"""
+        with self.lock:
+            if self.sorted_terms is None:
+                self.sorted_terms = sorted(self.postings.keys())
+            terms = self.sorted_terms
+
+        lo = bisect.bisect_left(terms, prefix)
+        hi = bisect.bisect_left(terms, prefix + self.sentinel, lo)
+        return terms[lo:hi]
+
+    def term_postings(self, term, prefix=False):
+        """Postings of a term, or the union of the postings of
+        every term starting with it if prefix is True"""
+        if not prefix:
+            return self.postings.get(term, {})
+
+        result = collections.defaultdict(list)
+        for t in self.expand(term):
+            for document, positions in self.postings[t].items():
+                result[document].extend(positions)
+        return result
+
+    def search(self, query, prefix=None):
+        """Find the paragraphs containing a phrase
+        :params query : The phrase. If it ends with '*' (or prefix is
+        True) its last term is matched as a prefix
+        :params prefix : Override the '*' convention
+        :returns List of SearchResult sorted by number of occurrences
+        """
+        if prefix is None:
+            prefix = query.rstrip().endswith('*')
+        terms = tokenize(query)
+        if terms == []:
+            return []
+
+        with self.lock:
+            postings = [self.term_postings(t) for t in terms[:-1]]
+            postings.append(self.term_postings(terms[-1], prefix))
+            if any(len(p) == 0 for p in postings):
+                return []
+
+            # Start from the rarest term
+            rarest = min(range(len(postings)), key=lambda i: len(postings[i]))
+            results = []
+            for document, positions in postings[rarest].items():
+                # Candidate start positions of the phrase
+                starts = {p - rarest for p in positions}
+                for i, p in enumerate(postings):
+                    if i == rarest:
+                        continue
+                    try:
+                        starts.intersection_update(q - i for q in p[document])
+                    except KeyError:
+                        starts = None
+                    if not starts:
+                        break
+
+                if starts:
+                    results.append(SearchResult(*self.documents[document], len(starts)))
+
+        results.sort(key=lambda x: (-x.count, helpers.statute_key(x.identifier)))
+        return results
+
+    def laws_containing(self, query, prefix=None):
+        """Return the identifiers of the laws containing a phrase
+        sorted by number of occurrences"""
+        counts = collections.Counter()
+        for result in self.search(query, prefix):
+            counts[result.identifier] += result.count
+        return [identifier for identifier, count in counts.most_common()]
+
+
+def build_search_index(laws):
+    """Index every law of a mapping (e.g. LawCodifier.laws) or an
+    iterable of laws (e.g. law_cache.iter_laws)"""
+    index = SearchIndex()
+    if isinstance(laws, collections.abc.Mapping):
+        for identifier in laws:
+            try:
+                index.add(laws[identifier])
+            except KeyError:
+                pass
+    else:
+        for law in laws:
+            index.add(law)
+    return index
+
+
+def drop_index(path=SEARCH_INDEX_PATH):
+    """Remove a saved index"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def build_and_save(db, path=SEARCH_INDEX_PATH):
+    """Index the current versions of all laws of the database and save
+    the index (search stage of the build)
+    :params db : database.Database object
+    """
+    # Import here for performance
+    import law_cache
+
+    index = build_search_index(law_cache.iter_laws(db))
+    index.save(path)
+    print('Indexed {} laws to {}'.format(len(index), path))
+    return index
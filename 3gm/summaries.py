@@ -0,0 +1,82 @@
+'''
+    Lookup of the summaries of laws.
+    The label and history pages show the summary of every statute they
+    list and used to query the summaries collection once per statute.
+    SummaryLookup fetches the summaries of many laws with a single $in
+    query, or serves them from an in-memory map of the whole collection,
+    which is small (one short text per law). Summaries only change when
+    summarize.py runs, so the map is reloaded once it is older than
+    max_age seconds or when refresh is called. summarize.py runs in its
+    own process and the web application does not call refresh, so new
+    summaries show up after at most max_age seconds (or a restart).
+'''
+
+import threading
+import time
+
+# Seconds after which the in-memory map is reloaded
+DEFAULT_MAX_AGE = 3600
+
+
+class SummaryLookup:
+    """Batch lookup of summaries by law identifier"""
+
+    def __init__(self, db, in_memory=True, max_age=DEFAULT_MAX_AGE):
+        """
+        :params db : database.Database object
+        :params in_memory : Keep every summary in memory, else query
+        the summaries of each request with $in
+        :params max_age : Seconds after which the map is reloaded (None never)
+        """
+        self.db = db
+        self.in_memory = in_memory
+        self.max_age = max_age
+        self.summaries = None
+        self.loaded_at = None
+        self.queries = 0
+        self.lock = threading.Lock()
+
+    def load(self):
+        """Load every summary in memory"""
+        cursor = self.db.summaries.find({}, {'summary': 1})
+        self.queries += 1
+        summaries = {x['_id']: x.get('summary', '') for x in cursor}
+        with self.lock:
+            self.summaries = summaries
+            self.loaded_at = time.time()
+        return summaries
+
+    def refresh(self):
+        """Drop the in-memory map, e.g. after summarize.py has run"""
+        with self.lock:
+            self.summaries = None
+            self.loaded_at = None
+
+    def current(self):
+        """Return the in-memory map, loading it if missing or expired"""
+        with self.lock:
+            summaries, loaded_at = self.summaries, self.loaded_at
+        if summaries is None or (self.max_age is not None
+                and time.time() - loaded_at > self.max_age):
+            summaries = self.load()
+        return summaries
+
+    def get_many(self, identifiers):
+        """Return a dict from identifier to summary for the laws
+        that have one
+        :params identifiers : Iterable of law identifiers
+        """
+        identifiers = list(set(identifiers))
+        if self.in_memory:
+            summaries = self.current()
+            return {x: summaries[x] for x in identifiers if x in summaries}
+
+        if identifiers == []:
+            return {}
+        cursor = self.db.summaries.find(
+            {'_id': {'$in': identifiers}}, {'summary': 1})
+        self.queries += 1
+        return {x['_id']: x.get('summary', '') for x in cursor}
+
+    def get(self, identifier, default=''):
+        return self.get_many([identifier]).get(identifier, default)
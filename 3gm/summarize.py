@@ -1,46 +1,131 @@
 # Produce summaries of laws from law titles using
 # TextRank algorithm provided by gensim
+# Only the titles of the laws are sent to the worker processes and
+# laws whose titles did not change since their last summary are skipped.
+# Summaries are written to the database in bulk.
 
-from gensim.summarization import summarize as summarize_textrank
 import codifier
+import hashlib
 import multiprocessing
 import database
 import string
 import logging
+import time
+from pymongo import ReplaceOne
 db = database.Database()
 
 # Filtering Heuristic
 MAX_TITLE_WORDS = 20
 
+# Laws sent to a worker at a time
+DEFAULT_CHUNKSIZE = 16
+
+# Summaries written to the database at a time
+DEFAULT_BATCH_SIZE = 500
+
+PUNCTUATION = str.maketrans('', '', string.punctuation)
+
+def clean_titles(titles):
+    """Join the titles of the articles of a law into the text that is
+    summarized, leaving out punctuation and long titles"""
+    titles = [x.strip().translate(PUNCTUATION) for x in titles]
+    titles = filter(lambda x: len(x.split()) <= MAX_TITLE_WORDS, titles)
+    titles = filter(lambda x: x.rstrip() != '', titles)
+    return '. '.join(titles)
+
+def titles_hash(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+def pending(laws, identifiers, hashes, force=False):
+    """Generate the laws whose titles changed since their last summary
+    :params laws : Mapping from identifier to LawParser
+    :params identifiers : Laws to summarize
+    :params hashes : Dict from identifier to the hash of the titles it was summarized from
+    :params force : Summarize every law
+    :returns Generator of (identifier, titles, hash)
+    """
+    for identifier in identifiers:
+        try:
+            text = clean_titles(laws[identifier].titles.values())
+        except KeyError:
+            continue
+        h = titles_hash(text)
+        if force or hashes.get(identifier) != h:
+            yield identifier, text, h
+
 # Summarization job
-def job(identifier):
-    global db
-    punct = str.maketrans('', '', string.punctuation)
+def job(task):
+    """Summarize the titles of a law
+    :params task : (identifier, titles, hash)
+    :returns The summary document
+    """
+    # Import here for performance
+    from gensim.summarization import summarize as summarize_textrank
+
+    identifier, text, h = task
     try:
-        l = codifier.codifier.laws[identifier]
-        titles = filter(lambda x: len(x.split()) <= MAX_TITLE_WORDS,
-            [x.lstrip().rstrip().translate(punct) for x in l.titles.values()])
-        titles = filter(lambda x: x.rstrip() != '', titles)
-        titles = '. '.join(titles)
-        summary = summarize_textrank(titles, ratio=0.1)
+        summary = summarize_textrank(text, ratio=0.1)
     except BaseException as e:
-        logging.warning(str(e))
+        # Store no hash so that the law is summarized again next time
+        logging.warning('{}: {}'.format(identifier, e))
+        summary, h = '', None
+
+    return {
+        '_id' : identifier,
+        'summary' : summary,
+        'titles_hash' : h
+    }
 
-    finally:
-        summary_obj = {
-            '_id' : identifier,
-            'summary' : summary
-        }
-        db.summaries.save(summary_obj)
+def write_summaries(summaries):
+    """Write a batch of summary documents"""
+    if summaries:
+        db.summaries.bulk_write(
+            [ReplaceOne({'_id': x['_id']}, x, upsert=True) for x in summaries],
+            ordered=False)
 
 # Summarize
-def summarize(identifiers=[]):
-    workers = multiprocessing.cpu_count() - 1
-    pool = multiprocessing.Pool(workers)
-    if identifiers == []:
-        identifiers = list(codifier.codifier.laws.keys())
-    print(identifiers)
-    pool.map(job, identifiers)
+def summarize(identifiers=None, processes=None, chunksize=DEFAULT_CHUNKSIZE,
+        batch_size=DEFAULT_BATCH_SIZE, force=False):
+    """Summarize laws whose titles changed since their last summary
+    :params identifiers : Laws to summarize (default all)
+    :params processes : Number of processes (default number of cores - 1)
+    :params chunksize : Laws sent to a worker at a time
+    :params batch_size : Summaries written to the database at a time
+    :params force : Summarize laws with unchanged titles too
+    """
+    if processes is None:
+        processes = max(1, multiprocessing.cpu_count() - 1)
+    # Fork before loading laws, workers only receive titles
+    pool = multiprocessing.Pool(processes)
+
+    laws = codifier.codifier.laws
+    if not identifiers:
+        identifiers = list(laws.keys())
+
+    hashes = {x['_id']: x.get('titles_hash')
+        for x in db.summaries.find({}, {'titles_hash': 1})}
+    tasks = list(pending(laws, identifiers, hashes, force))
+    print('Summarizing {} laws, {} unchanged'.format(
+        len(tasks), len(identifiers) - len(tasks)))
+
+    start = time.time()
+    done = 0
+    batch = []
+    with pool:
+        for summary in pool.imap_unordered(job, tasks, chunksize):
+            batch.append(summary)
+            if len(batch) == batch_size:
+                write_summaries(batch)
+                done += len(batch)
+                batch = []
+                elapsed = time.time() - start
+                print('{}/{} laws, {:.1f} laws/s'.format(done, len(tasks), done / elapsed))
+    write_summaries(batch)
+    done += len(batch)
+
+    elapsed = time.time() - start
+    print('Summarized {} laws in {:.1f}s ({:.1f} laws/s)'.format(
+        done, elapsed, done / elapsed if elapsed > 0 else 0))
 
 if __name__ == '__main__':
     summarize()
@@ -10,6 +10,27 @@ import re
 from copy import deepcopy
 import phrase_fun
 import codifier
+import graph_utils
+import autocomplete
+import render_cache
+import indexes
+import law_storage
+import law_cache
+import search
+import linkify
+import exporters
+import corpus
+import embeddings
+import train_doc2vec
+import infer_doc2vec
+import lemmatize
+import topic_index
+import topic_models
+import topic_sweep
+import summarize
+import summaries
+import law_diff
+import sys
 import logging
 logger = logging.getLogger()
 logger.disabled = True
@@ -104,7 +125,8 @@ def test_phrase():
 	assert('foo boo' in tmp)
 
 	test7 = law.insert_phrase('boo', position='before', old_phrase='επίδοσής της στο αντίδικο μέρος', article='1', paragraph='1')
-	assert('boo επίδοσής της στο αντίδικο μέρος' in '. '.join(test7['articles']['1']['1']))
+	assert(test7 == parser.Change('insert_phrase', '1', '1'))
+	assert('boo επίδοσής της στο αντίδικο μέρος' in '. '.join(law.serialize()['articles']['1']['1']))
 
 def test_phrase_ops():
 	s = 'Στην περίπτωση α΄ της παραγράφου 1 του άρθρου 12 του ν. 4067/2012, διαγράφεται η φράση «και το ισχύον ποσοστό κάλυψης»'
@@ -209,3 +231,598 @@ def test_iterator():
 	z = helpers.ssconj_doc_iterator(s.split(' '), 0, True, True)
 	assert(list(z) == ['6', '7', '8', '9', '10', '11', '18', '19',
 		'20', '21', '22', '23', '24', '25', '27', '25', '26', '27'])
+
+def test_statute_id():
+	x = helpers.StatuteId.parse('ν. 4511/2018')
+	assert(x == ('ν.', 4511, 2018))
+	assert(helpers.StatuteId.parse('Πράξη Νομοθετικού Περιεχομένου 24.12.1990').year == 1990)
+	ids = ['ν. 4511/2018', 'ν. 12/2008', 'π.δ. 160/2008', 'ν. 3000/2008']
+	assert(sorted(ids, key=helpers.statute_key) == ['π.δ. 160/2008', 'ν. 12/2008', 'ν. 3000/2008', 'ν. 4511/2018'])
+
+# Graph utilities tests
+def test_union_find():
+	uf = graph_utils.UnionFind(5)
+	assert(uf.union(0, 1))
+	assert(uf.union(3, 4))
+	assert(not uf.union(1, 0))
+	assert(uf.find(1) == uf.find(0))
+	assert(uf.find(2) != uf.find(3))
+	assert(uf.n_components == 3)
+
+def test_connected_components():
+	graph = {1: {2}, 2: {1, 3}, 3: {2}, 4: {5}, 6: set()}
+	components = graph_utils.connected_components(graph)
+	assert(sorted(map(sorted, components)) == [[1, 2, 3], [4, 5], [6]])
+	assert(sorted(graph_utils.get_edges(graph)) == [(1, 2), (2, 1), (2, 3), (3, 2), (4, 5)])
+
+# Autocomplete tests
+def test_autocomplete():
+	index = autocomplete.AutocompleteIndex(['ν. 4511/2018', 'ν. 4512/2018', 'νόμος', 'π.δ. 12/2008'], {'ν. 4512/2018': 0.5})
+	assert(index.complete('ν. 45') == ['ν. 4512/2018', 'ν. 4511/2018'])
+	assert(index.complete('ΝΟΜ') == ['νόμος'])
+	assert(index.complete('ν', k=1) == ['ν. 4512/2018'])
+	assert(index.complete('foo') == [])
+
+# Render cache tests
+def test_render_cache():
+	cache = render_cache.RenderCache(max_bytes=3 * sys.getsizeof('a' * 100))
+	for i in range(4):
+		assert(cache.get('ν. {}/2018'.format(i), 0, 'html', lambda: 'a' * 100) == 'a' * 100)
+	assert(len(cache) == 3)
+	assert(('ν. 0/2018', 0, 'html') not in cache)
+	cache.get('ν. 1/2018', 0, 'html', lambda: 'b')
+	assert(cache.hits == 1 and cache.misses == 4)
+	cache.invalidate('ν. 1/2018')
+	assert(('ν. 1/2018', 0, 'html') not in cache)
+	assert(len(cache) == 2)
+
+	# Tuples are accounted by the size of their items
+	value = ('a' * 1000, ['ν. 1/2018'])
+	assert(render_cache.sizeof(value) > sys.getsizeof('a' * 1000))
+	cache.get('ν. 5/2018', 1, ('None', 'ν. 1/2018'), lambda: value)
+	assert(('ν. 5/2018', 1, ('None', 'ν. 1/2018')) not in cache)
+
+def test_indexes():
+	class _Links:
+		def __init__(self, documents):
+			self.documents = documents
+		def aggregate(self, pipeline):
+			return [{'_id': x['_id'], 'links_to': list(x['links_to']),
+				'count': len(x.get('actual_links') or [])} for x in self.documents]
+
+	class _Database:
+		def __init__(self):
+			self.links = _Links([
+				{'_id': 'ν. 2/2018', 'links_to': ['ν. 1/2017', 'ν. 1/2018'], 'actual_links': [{}, {}]},
+				{'_id': 'ν. 1/2017', 'links_to': ['ν. 2/2018'], 'actual_links': None}])
+			self.stored = {}
+		def get_index(self, name):
+			return self.stored.get(name)
+		def save_index(self, name, index):
+			self.stored[name] = index
+
+	legal = indexes.build_legal_index(['ν. 3/2018', 'ν. 1/2017', 'ν. 1/2018', 'ν. 3/2018'])
+	assert(legal['indexed_list'] == ['ν. 1/2017', 'ν. 1/2018', 'ν. 3/2018'])
+	assert(legal['toc'] == [(2017, 'ν. 1/2017'), (2018, 'ν. 1/2018')] and legal['count'] == 3)
+	assert(legal['etag'] == indexes.build_legal_index(['ν. 1/2018', 'ν. 3/2018', 'ν. 1/2017'])['etag'])
+
+	db = _Database()
+	full = indexes.build_full_index(db)
+	assert([x['_id'] for x in full['full_index']] == ['ν. 1/2017', 'ν. 2/2018'])
+	assert(full['full_index'][1] == {'_id': 'ν. 2/2018', 'links_to': ['ν. 1/2017', 'ν. 1/2018'], 'count': 2})
+
+	# Built and stored on first access, then served from memory
+	cache = indexes.IndexCache(db, {indexes.FULL_INDEX: lambda: indexes.build_full_index(db)})
+	page = cache.get(indexes.FULL_INDEX)
+	assert(db.stored[indexes.FULL_INDEX]['etag'] == page.etag == full['etag'])
+	page.html = 'rendered'
+	assert(cache.get(indexes.FULL_INDEX) is page)
+
+	# A new build is picked up once the page is older than max_age
+	db.links.documents.append({'_id': 'ν. 5/2016', 'links_to': [], 'actual_links': []})
+	db.save_index(indexes.FULL_INDEX, indexes.build_full_index(db))
+	assert(cache.get(indexes.FULL_INDEX) is page)
+	cache.max_age = 0
+	page.checked_at -= 1
+	assert(cache.get(indexes.FULL_INDEX).index['count'] == 3)
+	page = cache.get(indexes.FULL_INDEX)
+	page.html = 'rendered'
+	page.checked_at -= 1
+	assert(cache.get(indexes.FULL_INDEX).html == 'rendered')
+
+def test_compact_law():
+	law = parser.LawParser('ν. 1/2018')
+	law.add_article('1', '1. Lorem. Ipsum\n2. Dolor sit amet')
+	law.add_article('2', '1. Foo')
+	expected = law.serialize()['articles']
+	text = law.export_law('markdown')
+	law.compact()
+	assert(law.is_compact())
+	assert(sorted(law.get_articles()) == ['1', '2'])
+	assert(law.get_paragraph('1', '1') == 'Lorem. Ipsum.')
+	assert(law.export_law('markdown') == text)
+	assert(law.serialize()['articles'] == expected)
+	law.add_paragraph('2', '2', 'Bar')
+	assert(not law.is_compact())
+	assert(law.sentences['2']['2'] == ['Bar'])
+	assert(law.sentences['1']['1'] == expected['1']['1'])
+
+	# None periods left by amendments survive compaction
+	sentences = {'1': {'1': [None, 'Lorem', None, 'Ipsum', None], '2': [None]}}
+	compact = law_storage.CompactSentences(sentences)
+	assert(compact.to_dict() == sentences)
+	assert(compact.paragraph_text('1', '1') == 'Lorem. Ipsum')
+	assert(compact.paragraph_text('1', '2') == '')
+
+def test_lazy_laws():
+	def _document(identifier, versions):
+		return {'_id': identifier, 'versions': [
+			{'_id': identifier, '_version': v, 'articles': {'1': {'1': ['Version {}'.format(v)]}},
+			 'titles': {}, 'lemmas': {}, 'thesaurus': {}, 'amendee': None} for v in versions]}
+
+	loader = law_cache.SnapshotLawLoader(
+		[_document('ν. {}/2018'.format(i), [0, 2, 1]) for i in range(5)] + [{'_id': 'ν. 9/2018'}])
+	laws = law_cache.LazyLaws(loader, cache_size=2)
+	assert(len(laws) == 5)
+	assert('ν. 0/2018' in laws.keys() and 'ν. 9/2018' not in laws)
+	assert(not laws.is_loaded('ν. 0/2018'))
+	law = laws['ν. 0/2018']
+	assert(law.version_index == 2 and law.is_compact())
+	assert(law.get_paragraph('1', '1') == 'Version 2.')
+	laws['ν. 1/2018']
+	laws['ν. 2/2018']
+	assert(not laws.is_loaded('ν. 0/2018'))
+	laws['ν. 2/2018']
+	stats = laws.stats()
+	assert(stats['hits'] == 1 and stats['misses'] == 3 and stats['evictions'] == 1)
+	laws['ν. 10/2018'] = parser.LawParser('ν. 10/2018')
+	for i in range(5):
+		laws['ν. {}/2018'.format(i)]
+	assert(laws.is_loaded('ν. 10/2018') and len(laws) == 6)
+	with pytest.raises(KeyError):
+		laws['ν. 9/2018']
+
+	# Laws modified in place stay pinned until they are stored
+	law = laws.pin('ν. 0/2018')
+	law.add_paragraph('1', '2', 'Removed')
+	for i in range(1, 5):
+		laws['ν. {}/2018'.format(i)]
+	assert(laws['ν. 0/2018'] is law and laws.stats()['pinned'] == 2)
+	laws.unpin('ν. 0/2018')
+	laws.unpin('ν. 10/2018')
+	for i in range(1, 5):
+		laws['ν. {}/2018'.format(i)]
+	assert(not laws.is_loaded('ν. 0/2018') and not laws.is_loaded('ν. 10/2018'))
+	assert(laws.stats()['pinned'] == 0 and len(laws) == 6)
+
+	# Passes over many laws read them with one scan without filling the cache
+	laws = law_cache.LazyLaws(loader, cache_size=2)
+	laws['ν. 3/2018'] = parser.LawParser('ν. 3/2018')
+	loader.load = None
+	assert([x for x, law in laws.stream()] == ['ν. {}/2018'.format(i) for i in range(5)])
+	assert(laws.stats()['loaded'] == 0)
+	streamed = dict(laws.stream(['ν. 1/2018', 'ν. 3/2018']))
+	assert(streamed['ν. 3/2018'] is laws['ν. 3/2018'] and streamed['ν. 1/2018'].version_index == 2)
+	lemmatizer = lemmatize.Lemmatizer(use_spacy=False, processes=1, lemmas={})
+	assert(list(lemmatize.LemmatizedCorpus(lemmatizer, laws))[:2] == ['Άρθρο Version'] * 2)
+
+def test_period_index():
+	s = ['Lorem', 'Ipsum']
+	assert(phrase_fun.replace_phrase(s, 'Lorem', 'Example') == ['Example', 'Ipsum'])
+	assert(phrase_fun.remove_phrase(s, 'Lorem') == ['', 'Ipsum'])
+	assert(phrase_fun.replace_phrase(s, 'm. Ip', 'X') == ['LoreXsum'])
+	assert(phrase_fun.replace_phrase(['a b', 'c d', 'e'], 'b. c', 'Q. R') == ['a Q', 'R d', 'e'])
+	assert(phrase_fun.replace_phrase(s, 'Dolor', 'X') == s)
+
+	# Phrases are matched literally
+	s = ['Κατά το άρθρο 5 (α) ισχύει', 'Foo']
+	assert(phrase_fun.replace_phrase(s, 'άρθρο 5 (α)', 'άρθρο 6') == ['Κατά το άρθρο 6 ισχύει', 'Foo'])
+
+	# Periods not touched by the phrase keep their boundaries
+	s = ['Ώρα 5 μ.μ', 'Foo']
+	assert(phrase_fun.replace_phrase(s, 'Foo', 'Bar') == ['Ώρα 5 μ.μ', 'Bar'])
+
+	assert(phrase_fun.insert_phrase(['a', 'b'], 'X') == ['a', 'b X'])
+	assert(phrase_fun.insert_phrase(['a', 'b'], 'X', position='prepend') == ['X a', 'b'])
+	assert(phrase_fun.insert_phrase(['a', 'b'], 'X', position='after', old_phrase='a') == ['a X', 'b'])
+	with pytest.raises(Exception):
+		phrase_fun.insert_phrase(['a', 'b'], 'X', position='middle')
+
+def test_search_index():
+	law = parser.LawParser('ν. 1/2018')
+	law.add_article('1', '1. Το Δημόσιο συμφέρον. Foo\n2. Δημοσίου συμφέροντος')
+	other = parser.LawParser('ν. 2/2018')
+	other.add_article('1', '1. Συμφέρον δημόσιο')
+	index = search.build_search_index({law.identifier: law, other.identifier: other})
+	assert(len(index) == 2)
+	assert(index.search('δημοσιο ΣΥΜΦΕΡΟΝ') == [search.SearchResult('ν. 1/2018', '1', '1', 1)])
+	assert(index.laws_containing('δημόσιο') == ['ν. 1/2018', 'ν. 2/2018'])
+	assert(len(index.search('δημοσ* συμφ*')) == 0)
+	assert(len(index.search('δημόσιο συμφ*')) == 1)
+	assert(index.laws_containing('δημοσ*') == ['ν. 1/2018', 'ν. 2/2018'])
+	law.add_paragraph('1', '3', 'Δημόσιο συμφέρον')
+	index.update(law)
+	assert(len(index.search('δημόσιο συμφέρον')) == 2)
+	index.remove('ν. 1/2018')
+	assert(index.laws_containing('δημόσιο') == ['ν. 2/2018'])
+
+def test_search_index_storage(tmpdir):
+	law = parser.LawParser('ν. 1/2018')
+	law.add_article('1', '1. Το Δημόσιο συμφέρον')
+	path = str(tmpdir.join('models', 'search_index.pickle'))
+	assert(search.SearchIndex.load(path) is None)
+	search.build_search_index([law]).save(path)
+	index = search.SearchIndex.load(path)
+	assert(index.laws_containing('δημόσιο συμ*') == ['ν. 1/2018'])
+	index.remove('ν. 1/2018')
+	assert(len(index) == 0)
+	search.drop_index(path)
+	assert(search.SearchIndex.load(path) is None)
+
+def test_linkify():
+	linkifier = linkify.Linkifier(lambda l: '/codify_law?identifier=' + l)
+	s = 'Κατά τον ν. 4009/2011 και το π.δ. 18/1989 όπως και τον ν. 4009/2011'
+	assert(linkifier.render(s) == 'Κατά τον [ν. 4009/2011](/codify_law?identifier=ν. 4009/2011) και το [π.δ. 18/1989](/codify_law?identifier=π.δ. 18/1989) όπως και τον [ν. 4009/2011](/codify_law?identifier=ν. 4009/2011)')
+	assert(linkifier.render('π.δ. 18/1989', 'html') == '<a href="/codify_law?identifier=π.δ. 18/1989">π.δ. 18/1989</a>')
+	assert(linkifier.render('Lorem Ipsum') == 'Lorem Ipsum')
+
+	# Precomputed links are kept, other mentions are bounded
+	linkifier = linkify.Linkifier(lambda l: '/' + l, max_links=2)
+	linkifier.precompute(['ν. 1/2018'])
+	for i in range(2, 10):
+		assert(linkifier.link('ν. {}/2018'.format(i)) == '[ν. {0}/2018](/ν. {0}/2018)'.format(i))
+	assert(len(linkifier.recent['markdown']) == 2 and 'ν. 1/2018' in linkifier.links['html'])
+	assert(linkifier.link('ν. 1/2018', 'html') == '<a href="/ν. 1/2018">ν. 1/2018</a>')
+
+def test_exporters():
+	law = parser.LawParser('ν. 1/2018')
+	law.add_article('1', '1. Lorem. Ipsum\n2. Dolor', title='Τίτλος')
+	law.add_article('2', '1. Foo')
+	writer = exporters.export_law(law, exporters.ListWriter(), 'markdown')
+	assert(writer.getvalue() == '# ν. 1/2018\n### Άρθρο 1 \n#### Τίτλος\n 0. Lorem. Ipsum.\n 1. Dolor.\n### Άρθρο 2 \n 0. Foo.\n')
+	assert(law.export_law('markdown') == writer.getvalue())
+	assert(law.export_law('issue').startswith('ΝΌΜΟΣ ΥΠ’ ΑΡΙΘΜ.  1\nΆρθρο 1 \nΤίτλος\n 1. Lorem. Ipsum.\n'))
+	corpus = exporters.export_corpus({law.identifier: law}, exporters.ListWriter(), 'str').getvalue()
+	assert(corpus == 'Άρθρο 1 Lorem. Ipsum.Dolor.Άρθρο 2 Foo.\n')
+	with pytest.raises(Exception):
+		law.export_law('docx')
+
+def test_corpus_shards(tmpdir):
+	laws = {}
+	for i in range(5):
+		law = parser.LawParser('ν. {}/2018'.format(i + 1))
+		law.add_article('1', '1. Lorem Ipsum. Dolor\n2. Sit amet')
+		laws[law.identifier] = law.compact()
+
+	paths = corpus.export_shards(laws, str(tmpdir), corpus.SENTENCES, shard_size=2, processes=1)
+	assert(len(paths) == 3)
+	sentences = corpus.SentenceCorpus(str(tmpdir))
+	assert(list(sentences)[:3] == [['lorem', 'ipsum'], ['dolor'], ['sit', 'amet']])
+	assert(len(list(sentences)) == 15)
+
+	paths = corpus.export_shards(laws, str(tmpdir), corpus.DOCUMENTS, shard_size=2, processes=2)
+	corpus.merge_shards(paths, str(tmpdir.join('corpus.txt')), str(tmpdir.join('labels.txt')))
+	assert(tmpdir.join('corpus.txt').read().splitlines()[0] == laws['ν. 1/2018'].export_law('str'))
+	assert(tmpdir.join('labels.txt').read().splitlines() == sorted(laws))
+
+def test_tagged_corpus(tmpdir):
+	tmpdir.join('corpus.txt').write('Άρθρο 1 Ώρα 5 μ.μ. Foo\nΆρθρο 2  Bar\n')
+	tmpdir.join('labels.txt').write('ν. 1/2018\nν. 2/2018\n')
+	assert(corpus.clean(' Ώρα 5 μ.μ. Foo ') == ['ώρα', '5', 'μ.μ.', 'foo'])
+	for use_mmap in [False, True]:
+		tagged = corpus.TaggedCorpus(str(tmpdir.join('corpus.txt')), str(tmpdir.join('labels.txt')), use_mmap=use_mmap)
+		docs = list(tagged)
+		assert(docs == list(tagged))
+		assert(docs[1].words == ['άρθρο', '2', 'bar'] and docs[1].tags == ['ν. 2/2018'])
+	tagged.write_corpus_file(str(tmpdir.join('tokenized.txt')))
+	docs = list(corpus.TaggedCorpus(str(tmpdir.join('tokenized.txt')), tokenize=False))
+	assert(docs[0].tags == [0] and docs[0].words == ['άρθρο', '1', 'ώρα', '5', 'μ.μ.', 'foo'])
+
+def test_embedding_store(tmpdir):
+	ids = ['ν. 1/2000', 'ν. 2/2000', 'ν. 3/2000', 'π.δ. 4/2000']
+	vectors = [[1, 0, 0], [2, 0.2, 0], [0, 1, 0], [0, 1, 1]]
+	store = embeddings.EmbeddingStore.from_dict({x: tuple(v) for x, v in zip(ids, vectors)})
+	assert(len(store) == 4 and store.dimension == 3)
+	assert(abs(float(store.vector('ν. 2/2000').dot(store.vector('ν. 2/2000'))) - 1) < 1e-6)
+
+	similar = store.similar('ν. 1/2000', k=2)
+	assert([x.id for x in similar] == ['ν. 2/2000', 'ν. 3/2000'])
+	assert(similar[0].score > similar[1].score)
+	assert([x.id for x in store.top_k([0, 1, 0.9], k=1)[0]] == ['π.δ. 4/2000'])
+
+	store.save(str(tmpdir.join('embeddings')))
+	loaded = embeddings.EmbeddingStore.load(str(tmpdir.join('embeddings')))
+	assert(loaded.ids == ids)
+	assert(loaded.similar(ids, k=3) == store.similar(ids, k=3))
+
+	loaded.build_index(bits=2, tables=4)
+	for x in ids:
+		assert(x not in [y.id for y in loaded.similar(x, k=3, approximate=True)])
+
+def test_infer_doc2vec(tmpdir):
+	docs = ['ο νόμος τροποποιείται ως εξής', 'το άρθρο καταργείται', 'η παράγραφος αντικαθίσταται ως εξής'] * 4
+	tmpdir.join('corpus.txt').write('\n'.join(docs) + '\n')
+	tmpdir.join('labels.txt').write('\n'.join('ν. {}/2018'.format(i) for i in range(len(docs))) + '\n')
+	model = str(tmpdir.join('model.bin'))
+	train_doc2vec.train(str(tmpdir.join('corpus.txt')), model, str(tmpdir.join('labels.txt')),
+		size=8, iter=2, min_count=1, workers=1)
+
+	m = infer_doc2vec.load_model(model)
+	assert(infer_doc2vec.infer_vector(m, docs[0].split(), epochs=10).shape == (8,))
+	assert((infer_doc2vec.infer_vector(m, docs[0].split(), 10) == infer_doc2vec.infer_vector(m, docs[0].split(), 10)).all())
+
+	# Inference stops once successive vectors converge, tolerance 0 runs all epochs
+	vector, epochs = infer_doc2vec.infer_converged(m, docs[0].split(), epochs=80, min_epochs=10, tol=0)
+	assert(epochs == 80)
+	vector, epochs = infer_doc2vec.infer_converged(m, docs[0].split(), epochs=80, min_epochs=10, tol=2)
+	assert(epochs == 20 and vector.shape == (8,))
+
+	output = str(tmpdir.join('embeddings'))
+	infer_doc2vec.infer(model, model + '.corpus', output, str(tmpdir.join('labels.txt')),
+		epochs=50, size=5, processes=1)
+	store = embeddings.EmbeddingStore.load(output)
+	assert(store.ids == ['ν. {}/2018'.format(i) for i in range(len(docs))])
+	assert(store.vectors.shape == (len(docs), 8))
+	assert(abs(float(store.vector('ν. 11/2018').dot(store.vector('ν. 11/2018'))) - 1) < 1e-5)
+
+def test_lemmatizer():
+	assert(lemmatize.chunk_text('abc def ghi', 7) == ['abc', ' def', ' ghi'])
+	assert(lemmatize.chunk_text('abcdefgh', 3) == ['abc', 'def', 'gh'])
+
+	laws = {}
+	for i in range(3):
+		law = parser.LawParser('ν. {}/2018'.format(i + 1))
+		law.add_article('1', '1. Τα μέτρα ισχύουν. Ο νόμος 1234 ισχύει από σήμερα\n2. Προθεσμία έως')
+		laws[law.identifier] = law
+
+	# Words with digits or punctuation are dropped
+	lemmas = {'ισχύει': 'ισχύω'}
+	expected = 'Άρθρο μέτρα νόμος ισχύω'
+	for processes in [1, 2]:
+		lemmatizer = lemmatize.Lemmatizer(use_spacy=False, processes=processes, max_length=20, batch_size=2, lemmas=lemmas)
+		data_samples = lemmatize.LemmatizedCorpus(lemmatizer, laws)
+		assert(len(data_samples) == 3)
+		assert(list(data_samples) == [expected] * 3)
+
+	# Only new versions are lemmatized again
+	laws['ν. 2/2018'].add_article('2', '1. Νέα διάταξη ισχύει από σήμερα')
+	laws['ν. 2/2018'].version_index += 1
+	lemmatizer.lemmas = {}
+	result = dict(lemmatizer.lemmatize(laws))
+	assert(result['ν. 1/2018'] == expected)
+	assert(result['ν. 2/2018'] == 'Άρθρο μέτρα νόμος ισχύει διάταξη ισχύει')
+
+def test_lemma_store(tmpdir):
+	laws = {}
+	for i in range(3):
+		law = parser.LawParser('ν. {}/2018'.format(i + 1))
+		law.add_article('1', '1. Ο νόμος ισχύει από σήμερα')
+		laws[law.identifier] = law
+
+	store = lemmatize.LemmaStore(str(tmpdir.join('lemmas')))
+	lemmatizer = lemmatize.Lemmatizer(use_spacy=False, processes=1, lemmas={'ισχύει': 'ισχύω'}, store=store)
+	data_samples = lemmatize.LemmatizedCorpus(lemmatizer, laws)
+	assert(list(data_samples) == ['Άρθρο νόμος ισχύω'] * 3)
+	fingerprint = data_samples.fingerprint()
+
+	# A new run reads the store instead of lemmatizing again
+	lemmatizer = lemmatize.Lemmatizer(use_spacy=False, processes=1, lemmas={}, store=store)
+	data_samples = lemmatize.LemmatizedCorpus(lemmatizer, laws)
+	assert(list(data_samples) == ['Άρθρο νόμος ισχύω'] * 3)
+	assert(store.hits == 3 and data_samples.fingerprint() == fingerprint)
+
+	# Modified laws are lemmatized again even if the store was not invalidated
+	laws['ν. 1/2018'].add_article('2', '1. Καταργείται')
+	laws['ν. 1/2018'].version_index += 1
+	store.invalidate('ν. 2/2018')
+	lemmatizer = lemmatize.Lemmatizer(use_spacy=False, processes=1, lemmas={}, store=store)
+	data_samples = lemmatize.LemmatizedCorpus(lemmatizer, laws)
+	assert(list(data_samples) == ['Άρθρο νόμος ισχύει', 'Άρθρο νόμος ισχύει', 'Άρθρο νόμος ισχύω'])
+	assert(store.hits == 4)
+	assert(data_samples.fingerprint() != fingerprint)
+
+def test_topic_index():
+	topics = [
+		{'_id': 0, 'keywords': ['φόρος', 'εισόδημα'], 'statutes': ['ν. 1/2018', 'ν. 2/2018']},
+		{'_id': 1, 'keywords': ['σχολείο', 'φόρος'], 'statutes': ['ν. 2/2018']}
+	]
+	index = topic_index.TopicIndex(topics)
+	assert(len(index) == 2)
+	assert([t['_id'] for t in index.topics_of('ν. 2/2018')] == [0, 1])
+	assert(index.topics_of('ν. 3/2018') == [])
+	assert([t['_id'] for t in index.topics_with_keyword('φόρος')] == [0, 1])
+
+	index.add({'_id': 1, 'keywords': ['σχολείο'], 'statutes': ['ν. 3/2018']})
+	assert([t['_id'] for t in index.topics_of('ν. 2/2018')] == [0])
+	assert([t['_id'] for t in index.topics_of('ν. 3/2018')] == [1])
+	assert([t['_id'] for t in index.topics_with_keyword('φόρος')] == [0])
+
+def test_update_topics(tmpdir, monkeypatch):
+	from sklearn.feature_extraction.text import CountVectorizer
+	from sklearn.decomposition import LatentDirichletAllocation
+
+	words = ['φόρος', 'εισόδημα', 'σχολείο', 'μαθητής', 'λιμάνι', 'πλοίο']
+	laws = {}
+	for i in range(6):
+		law = parser.LawParser('ν. {}/2018'.format(i + 1))
+		law.add_article('1', '1. ' + ' '.join(words[(i + j) % 6] for j in range(4)))
+		laws[law.identifier] = law
+
+	# A small fitted state as written by build_topics
+	lemmatizer = lemmatize.Lemmatizer(use_spacy=False, processes=1, lemmas={})
+	identifiers = list(laws)
+	vectorizer = CountVectorizer()
+	tf = vectorizer.fit_transform(lemmatize.LemmatizedCorpus(lemmatizer, laws, identifiers))
+	lda_model = LatentDirichletAllocation(n_components=2, learning_method='online', random_state=0)
+	W = lda_model.fit_transform(tf)
+	indices = dict(enumerate(identifiers))
+	topics = topic_models.topic_documents(
+		lda_model.components_, W, topic_models.feature_names(vectorizer), indices, 3, 3)
+	state = {
+		'vectorizer': vectorizer, 'lda_model': lda_model, 'tf': tf, 'W': W,
+		'memberships': topic_models.topic_memberships(topic_models.top_documents(W, 3), 6),
+		'identifiers': identifiers,
+		'keys': {x: lemmatizer.key(laws[x]) for x in identifiers},
+		'no_top_words': 3, 'topics': topics
+	}
+
+	class _Topics:
+		saved = []
+		def save(self, document):
+			self.saved.append(document)
+
+	class _Database:
+		topics = _Topics()
+
+	monkeypatch.chdir(tmpdir)
+	monkeypatch.setattr(topic_models, 'TOPIC_STATE_FILE', str(tmpdir.join('topic_state.pickle')))
+	monkeypatch.setattr(topic_models, 'db', _Database())
+	monkeypatch.setattr(topic_models, 'lemmatizer', lemmatizer)
+	monkeypatch.setattr(codifier.codifier, 'laws', laws)
+	topic_models.pickle.dump(state, open(topic_models.TOPIC_STATE_FILE, 'wb'))
+
+	# Nothing changed
+	topic_models.update_topics(use_spacy=False)
+	assert(_Topics.saved == [])
+
+	# A new, a modified and a removed law
+	law = parser.LawParser('ν. 7/2018')
+	law.add_article('1', '1. φόρος εισόδημα σχολείο μαθητής')
+	laws[law.identifier] = law
+	laws['ν. 2/2018'].add_article('2', '1. λιμάνι πλοίο λιμάνι')
+	laws['ν. 2/2018'].version_index += 1
+	del laws['ν. 4/2018']
+	topic_models.update_topics(use_spacy=False)
+
+	state = topic_models.pickle.load(open(topic_models.TOPIC_STATE_FILE, 'rb'))
+	expected = ['ν. 1/2018', 'ν. 2/2018', 'ν. 3/2018', 'ν. 5/2018', 'ν. 6/2018', 'ν. 7/2018']
+	assert(state['identifiers'] == expected and sorted(state['keys']) == expected)
+	assert(state['tf'].shape == (6, len(vectorizer.vocabulary_)) and state['W'].shape == (6, 2))
+	assert(state['memberships'].shape == (6, 2))
+	tf = vectorizer.transform(lemmatize.LemmatizedCorpus(lemmatizer, laws, expected))
+	assert((state['tf'] != tf).nnz == 0 and state['tf'][1, vectorizer.vocabulary_['πλοίο']] == 1)
+	statutes = sum((t['statutes'] for t in state['topics'].values()), [])
+	assert('ν. 4/2018' not in statutes)
+	assert(all(state['topics'][t['_id']] == t for t in _Topics.saved))
+
+def test_label_pages():
+	topics = [
+		{'_id': 0, 'keywords': ['φόρος'], 'statutes': ['ν. {}/2018'.format(i) for i in range(1, 8)]},
+		{'_id': 1, 'keywords': ['φόρος'], 'statutes': ['ν. 1/2017', 'ν. 3/2018']}
+	]
+	index = topic_index.TopicIndex(topics, ranks={'ν. 1/2017': 0.5, 'ν. 2/2018': 0.2})
+	assert(index.statutes_with_keyword('φόρος', 'chronological').statutes[:2] == ['ν. 7/2018', 'ν. 6/2018'])
+
+	pages = []
+	cursor = None
+	while True:
+		refs, cursor, total = index.page('φόρος', 'rank', cursor, limit=3)
+		pages.append(refs)
+		if cursor is None:
+			break
+	assert(total == 8 and len(pages) == 3)
+	assert(pages[0] == ['ν. 1/2017', 'ν. 2/2018', 'ν. 7/2018'])
+	assert(sum(pages, []) == index.statutes_with_keyword('φόρος').statutes)
+	assert(index.page('σχολείο') == ([], None, 0))
+
+	# Postings follow changes of the ranks and the topics
+	index.set_ranks({'ν. 5/2018': 1.0})
+	assert(index.page('φόρος', limit=1)[0] == ['ν. 5/2018'])
+	index.remove(1)
+	assert(index.page('φόρος', limit=10)[2] == 7)
+	with pytest.raises(KeyError):
+		index.page('φόρος', cursor='ν. 1/2017')
+
+def test_topic_sweep(tmpdir):
+	words = ['φόρος', 'εισόδημα', 'σχολείο', 'μαθητής', 'λιμάνι', 'πλοίο', 'δήμος', 'νοσοκομείο']
+	data_samples = [' '.join(words[(i + j) % 8] for j in range(3 + i % 4)) for i in range(40)]
+	path = str(tmpdir.join('counts'))
+	tf, feature_names = topic_sweep.cache_counts(data_samples, path, 6, fingerprint='abc')
+	assert(len(feature_names) == 6 and tf.shape == (40, 6))
+	assert(topic_sweep.counts_are_current(path, 'abc', 6))
+	assert(not topic_sweep.counts_are_current(path, 'abd', 6))
+	assert(not topic_sweep.counts_are_current(path, 'abc', 8))
+	assert(not topic_sweep.counts_are_current(str(tmpdir.join('missing')), 'abc', 6))
+
+	cached, cached_names = topic_sweep.load_counts(path)
+	assert(cached_names == feature_names and (cached != tf).nnz == 0)
+	assert(topic_sweep.select_features(cached, 4).shape == (40, 4))
+
+	grid = {'model': ['lda', 'nmf'], 'n_components': [2], 'no_features': [4, 6], 'max_iter': [5]}
+	assert(len(topic_sweep.parameter_grid(grid)) == 4)
+	results = topic_sweep.sweep(path, grid, processes=1)
+	assert([r['model'] for r in results] == ['lda', 'lda', 'nmf', 'nmf'])
+	assert(all(r['perplexity'] > 0 for r in results[:2]))
+	assert(all(r['reconstruction_err'] is not None for r in results[2:]))
+
+	topic_sweep.write_report(results, str(tmpdir.join('report.csv')))
+	assert(len(tmpdir.join('report.csv').read().splitlines()) == 5)
+
+def test_summary_pending():
+	laws = {}
+	for i in range(3):
+		law = parser.LawParser('ν. {}/2018'.format(i + 1))
+		law.titles = {'1': 'Σκοπός, ορισμοί', '2': ' ', '3': 'λέξη ' * 30}
+		laws[law.identifier] = law
+	assert(summarize.clean_titles(laws['ν. 1/2018'].titles.values()) == 'Σκοπός ορισμοί')
+
+	tasks = list(summarize.pending(laws, list(laws) + ['ν. 4/2018'], {}))
+	assert([x[0] for x in tasks] == ['ν. 1/2018', 'ν. 2/2018', 'ν. 3/2018'])
+
+	# Laws whose titles did not change are skipped
+	hashes = {identifier: h for identifier, text, h in tasks}
+	laws['ν. 2/2018'].titles['4'] = 'Έναρξη ισχύος'
+	assert([x[0] for x in summarize.pending(laws, list(laws), hashes)] == ['ν. 2/2018'])
+	assert(len(list(summarize.pending(laws, list(laws), hashes, force=True))) == 3)
+
+	# Laws whose summary failed are stored without a hash and retried
+	hashes['ν. 1/2018'] = None
+	assert([x[0] for x in summarize.pending(laws, list(laws), hashes)] == ['ν. 1/2018', 'ν. 2/2018'])
+
+def test_summary_lookup():
+	class _Summaries:
+		def __init__(self, documents):
+			self.documents = documents
+		def find(self, query, projection=None):
+			ids = query.get('_id', {}).get('$in')
+			return [dict(x) for x in self.documents if ids is None or x['_id'] in ids]
+
+	class _Database:
+		summaries = _Summaries([{'_id': 'ν. {}/2018'.format(i), 'summary': str(i)} for i in range(100)])
+
+	refs = ['ν. {}/2018'.format(i) for i in range(0, 120, 2)]
+	for in_memory in [True, False]:
+		lookup = summaries.SummaryLookup(_Database(), in_memory=in_memory)
+		result = lookup.get_many(refs)
+		assert(len(result) == 50 and result['ν. 42/2018'] == '42')
+		assert(lookup.get('ν. 7/2018') == '7' and lookup.get('ν. 200/2018') == '')
+		assert(lookup.queries == (1 if in_memory else 3))
+
+	# The in-memory map is reloaded after a refresh
+	_Database.summaries.documents[0]['summary'] = 'Νέα περίληψη'
+	lookup = summaries.SummaryLookup(_Database())
+	assert(lookup.get('ν. 0/2018') == 'Νέα περίληψη')
+	_Database.summaries.documents[0]['summary'] = '0'
+	assert(lookup.get('ν. 0/2018') == 'Νέα περίληψη')
+	lookup.refresh()
+	assert(lookup.get('ν. 0/2018') == '0' and lookup.queries == 2)
+
+def test_law_diff():
+	initial = parser.LawParser('ν. 1/2018')
+	final = parser.LawParser('ν. 1/2018')
+	for i in range(1, 5):
+		initial.add_article(str(i), '1. Foo {}\n2. Bar'.format(i))
+		if i != 3:
+			final.add_article(str(i), '1. Foo {}\n2. Bar'.format(i))
+	final.add_article('2', '1. Baz\n2. Foo 2\n3. Bar')
+	final.add_article('5', '1. Qux')
+
+	diffs = list(law_diff.diff_laws(initial, final))
+	assert(diffs[:3] == ['  ΝΌΜΟΣ ΥΠ’ ΑΡΙΘΜ.  1', '  Άρθρο 1 ', '   1. Foo 1.'])
+	# Paragraphs after an inserted one are not marked as changed
+	assert([x for x in diffs if x[0] != ' '] == [
+		'+  1. Baz.', '- Άρθρο 3 ', '-  1. Foo 3.', '-  2. Bar.',
+		'+ Άρθρο 5 ', '+  1. Qux.'])
+	assert([x[2:] for x in diffs if x[0] != '-'] == final.export_law('issue').splitlines())
+	assert(len([x for x in diffs if x[0] != '+']) == len(initial.export_law('issue').splitlines()))
+	assert(all(x[0] == ' ' for x in law_diff.diff_laws(final, final)))
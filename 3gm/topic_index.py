@@ -0,0 +1,141 @@
+'''
+    In-memory lookup of the topics collection.
+    The web application used to query the topics collection by statute
+    or keyword on every request. The topics are few and change only when
+    topic_models rebuilds them, so they are loaded once and indexed by
+    the statutes and keywords they contain.
+
+    The statutes of all topics with a keyword (the postings of the
+    keyword) are sorted by rank or by date once and cached until the
+    topics or the ranks change, so that the label pages are served a
+    page at a time. Pages are addressed with a cursor, the last statute
+    of the previous page.
+'''
+
+import collections
+import helpers
+
+# Orders of the postings of a keyword
+SORTINGS = ['rank', 'chronological']
+
+# Statutes per page of a keyword
+DEFAULT_PAGE_SIZE = 50
+
+
+class Postings:
+    """Sorted statutes of a keyword and their positions"""
+
+    def __init__(self, statutes):
+        self.statutes = statutes
+        self.positions = {x: i for i, x in enumerate(statutes)}
+
+    def __len__(self):
+        return len(self.statutes)
+
+    def offset(self, cursor=None):
+        """Position of the first statute after cursor"""
+        return 0 if cursor is None else self.positions[cursor] + 1
+
+    def page(self, cursor=None, limit=DEFAULT_PAGE_SIZE):
+        """Return the statutes after cursor and the cursor of the next
+        page (None on the last page)
+        :params cursor : Last statute of the previous page (None for the first page)
+        :params limit : Statutes per page
+        """
+        start = self.offset(cursor)
+        statutes = self.statutes[start:start + limit]
+        if start + limit < len(self.statutes) and statutes != []:
+            return statutes, statutes[-1]
+        return statutes, None
+
+
+class TopicIndex:
+    """Topics by statute and by keyword"""
+
+    def __init__(self, topics=(), ranks=None):
+        """
+        :params topics : Documents of the topics collection
+        :params ranks : Dict from statute to its pagerank
+        """
+        self.topics = {}
+        self.by_statute = collections.defaultdict(list)
+        self.by_keyword = collections.defaultdict(list)
+        self.ranks = ranks or {}
+        # (keyword, sorting) -> Postings
+        self.postings = {}
+        for topic in topics:
+            self.add(topic)
+
+    def __len__(self):
+        return len(self.topics)
+
+    def add(self, topic):
+        """Index a topic document, replacing a topic with the same _id"""
+        if topic['_id'] in self.topics:
+            self.remove(topic['_id'])
+        self.topics[topic['_id']] = topic
+        for statute in topic.get('statutes', []):
+            self.by_statute[statute].append(topic)
+        for keyword in topic.get('keywords', []):
+            self.by_keyword[keyword].append(topic)
+            self.invalidate(keyword)
+
+    def remove(self, topic_id):
+        topic = self.topics.pop(topic_id)
+        for key, lookup in [('statutes', self.by_statute), ('keywords', self.by_keyword)]:
+            for x in topic.get(key, []):
+                lookup[x] = [t for t in lookup[x] if t['_id'] != topic_id]
+                if lookup[x] == []:
+                    del lookup[x]
+        for keyword in topic.get('keywords', []):
+            self.invalidate(keyword)
+
+    def invalidate(self, keyword):
+        for sorting in SORTINGS:
+            self.postings.pop((keyword, sorting), None)
+
+    def set_ranks(self, ranks):
+        """Use new ranks, e.g. after LawCodifier.pagerank"""
+        self.ranks = ranks
+        self.postings = {}
+
+    def topics_of(self, identifier):
+        """Return the topics a law belongs to"""
+        return list(self.by_statute.get(identifier, []))
+
+    def topics_with_keyword(self, keyword):
+        """Return the topics having keyword among their keywords"""
+        return list(self.by_keyword.get(keyword, []))
+
+    def statutes_with_keyword(self, keyword, sorting='rank'):
+        """Return the Postings of a keyword, i.e. the statutes of the
+        topics having keyword sorted by rank or chronologically (latest first)"""
+        try:
+            return self.postings[keyword, sorting]
+        except KeyError:
+            pass
+
+        statutes = {x for t in self.by_keyword.get(keyword, []) for x in t.get('statutes', [])}
+        statutes = sorted(statutes, key=helpers.statute_key, reverse=True)
+        if sorting == 'rank':
+            # Statutes with equal rank stay in chronological order
+            statutes.sort(key=lambda x: -self.ranks.get(x, 0))
+        elif sorting != 'chronological':
+            raise ValueError('Unrecognized sorting ' + sorting)
+
+        postings = Postings(statutes)
+        self.postings[keyword, sorting] = postings
+        return postings
+
+    def page(self, keyword, sorting='rank', cursor=None, limit=DEFAULT_PAGE_SIZE):
+        """Return a page of the statutes of a keyword
+        :params keyword : Label of the topics
+        :params sorting : rank or chronological
+        :params cursor : Last statute of the previous page (None for the first page)
+        :params limit : Statutes per page
+        :returns Statutes, cursor of the next page (None on the last page)
+        and the number of statutes
+        """
+        postings = self.statutes_with_keyword(keyword, sorting)
+        statutes, next_cursor = postings.page(cursor, limit)
+        return statutes, next_cursor, len(postings)
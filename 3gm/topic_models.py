@@ -2,11 +2,10 @@ from multiprocessing import cpu_count
 
 # sklearn
 from sklearn.feature_extraction.text import TfidfVectorizer, CountVectorizer
-from sklearn.model_selection import GridSearchCV
 from sklearn.decomposition import NMF, LatentDirichletAllocation
 
 # Imports
-from helpers import connected_components, get_edges
+from graph_utils import connected_components, get_edges
 import parser
 import collections
 import numpy as np
@@ -18,24 +17,68 @@ import database
 import math
 import pickle
 import string
+import scipy.sparse
+from embeddings import top_k_rows
 
-# spacy
-import spacy
-import el_small
-nlp = el_small.load(max_length=2000000)
-
-
-sys.path.insert(0, '../resources')
-import greek_lemmas
+# Lemmatization with spaCy
+import lemmatize
+import law_cache
+lemmatizer = None
 
 
 db = database.Database()
 
+# Fitted vectorizer, model and memberships for incremental updates
+TOPIC_STATE_FILE = 'topic_state.pickle'
+
 
 def contains_digit_or_num(i): return any(
     j.isdigit() or j in string.punctuation for j in i)
 
 
+def feature_names(vectorizer):
+    """Return the vocabulary of a fitted vectorizer in column order,
+    for any version of scikit-learn"""
+    return sorted(vectorizer.vocabulary_, key=vectorizer.vocabulary_.get)
+
+
+def topic_keywords(H, feature_names, no_top_words):
+    """Return the top words of every topic (row of H)"""
+    top = top_k_rows(H, no_top_words)
+    return [[feature_names[i] for i in row] for row in top]
+
+
+def top_documents(W, no_top_data_samples):
+    """Return the indices of the documents with the highest weights
+    in every topic (column of W), one row per topic"""
+    return top_k_rows(W.T, no_top_data_samples)
+
+
+def topic_memberships(top, n_samples):
+    """Sparse documents x topics matrix with a 1 for the top documents of every topic
+    :params top : Top documents of every topic (see top_documents)
+    """
+    rows = top.ravel()
+    cols = np.repeat(np.arange(top.shape[0]), top.shape[1])
+    return scipy.sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.int8), (rows, cols)),
+        shape=(n_samples, top.shape[0]))
+
+
+def topic_documents(H, W, feature_names, indices, no_top_words, no_top_data_samples):
+    """Return the documents of the topics collection by topic index"""
+    keywords = topic_keywords(H, feature_names, no_top_words)
+    top = top_documents(W, no_top_data_samples)
+    return {
+        topic_idx: {
+            '_id': topic_idx,
+            'keywords': keywords[topic_idx],
+            'statutes': [indices[d] for d in top[topic_idx]]
+        }
+        for topic_idx in range(H.shape[0])
+    }
+
+
 def process_topics(
         H,
         W,
@@ -44,41 +87,26 @@ def process_topics(
         no_top_words,
         no_top_data_samples,
         indices):
-    graph = {}
-    topics = {}
+    """Write the topics collection
+    :returns The graph of documents sharing a topic, the topic documents
+    and the sparse documents x topics memberships
+    """
     global db
-    db.drop_topics()
-    for topic_idx, topic in enumerate(H):
-
-        print("Topic %d:" % (topic_idx))
-        topics[topic_idx] = [feature_names[i]
-                             for i in topic.argsort()[:-no_top_words - 1:-1]]
-
-        print(" ".join(topics[topic_idx]))
-        top_doc_indices = np.argsort(W[:, topic_idx])[
-            ::-1][0:no_top_data_samples]
-
-        similar = []
-        for doc_index in top_doc_indices:
-            print(indices[doc_index])
-            similar.append(indices[doc_index])
-            graph[doc_index] = list(
-                filter(
-                    lambda x: x != doc_index,
-                    top_doc_indices))
-
-        s = {
-            '_id': topic_idx,
-            'keywords': topics[topic_idx],
-            'statutes': similar
+    documents = topic_documents(
+        H, W, feature_names, indices, no_top_words, no_top_data_samples)
+    memberships = topic_memberships(top_documents(W, no_top_data_samples), W.shape[0])
 
-        }
+    # Documents sharing a topic with each document
+    shared = (memberships.dot(memberships.T)).tolil()
+    graph = {d: [x for x in row if x != d] for d, row in enumerate(shared.rows) if row}
 
-        db.topics.save(s)
+    for topic_idx, s in documents.items():
+        print("Topic %d: %s" % (topic_idx, " ".join(s['keywords'][:10])))
 
-    print(graph)
-    print(topics)
-    return graph, topics, top_doc_indices
+    db.drop_topics()
+    db.topics.insert_many(list(documents.values()))
+
+    return graph, documents, memberships
 
 
 def build_greek_stoplist(cnt_swords=300):
@@ -95,63 +123,57 @@ def build_greek_stoplist(cnt_swords=300):
     return greek_stopwords
 
 
+def get_lemmatizer(use_spacy=True, min_size=4):
+    global lemmatizer
+    if lemmatizer is None or (lemmatizer.use_spacy, lemmatizer.min_size) != (use_spacy, min_size):
+        lemmatizer = lemmatize.Lemmatizer(
+            use_spacy=use_spacy,
+            min_size=min_size,
+            store=lemmatize.get_lemma_store())
+    return lemmatizer
+
+
 def build_data_samples(min_size=4, use_spacy=True):
-    data_samples = []
-    indices = {}
-
-    i = 0
-    for law in codifier.codifier.laws.keys():
-        print(law)
-        corpus = codifier.codifier.laws[law].export_law('str')
-        if use_spacy:
-            tmp = nlp(corpus)
-        else:
-            tmp = corpus.split(' ')
-        corpus = []
-        for j, word in enumerate(tmp):
-            if contains_digit_or_num(word.text) or len(word.text) < min_size:
-                continue
-            try:
-                if use_spacy:
-                    try:
-                        corpus.append(greek_lemmas[word.lemma_])
-                    except BaseException:
-                        corpus.append(greek_lemmas[word])
-                else:
-                    corpus.append(greek_lemmas[word])
-            except BaseException:
-                corpus.append(str(word))
-
-        corpus = ' '.join(corpus)
-
-        data_samples.append(corpus)
-        indices[i] = law
-
-        i += 1
+    """Lemmatize the laws of the codifier
+    :returns A lemmatize.LemmatizedCorpus, lemmatized lazily, and a dict
+    from the index of every text to the identifier of its law
+    """
+    laws = codifier.codifier.laws
+    identifiers = list(laws.keys())
+    indices = dict(enumerate(identifiers))
+    data_samples = lemmatize.LemmatizedCorpus(
+        get_lemmatizer(use_spacy, min_size), laws, identifiers)
 
     return data_samples, indices
 
 
 def build_gg_stoplist(data_samples, greek_stopwords, gg_most_common=500):
-    words = []
-    for x in data_samples:
-        words.extend(x.split(' '))
     print('Counting words')
 
+    # The counts are cached along with the fingerprint of the corpus
+    # they were computed from and recomputed when any law changes
+    fingerprint = data_samples.fingerprint()
     try:
-        counter = pickle.load(open('gg_stoplist.pickle', 'rb'))
+        cached = pickle.load(open('gg_stoplist.pickle', 'rb'))
+        counter = cached['counter'] if cached['fingerprint'] == fingerprint else None
     except BaseException:
-        counter = collections.Counter(words)
-        pickle.dump(counter, open('gg_stoplist.pickle', 'wb'))
-    finally:
-        for w in counter.most_common(gg_most_common):
-            greek_stopwords.append(w[0])
+        counter = None
+
+    if counter is None:
+        counter = collections.Counter()
+        for x in data_samples:
+            counter.update(x.split(' '))
+        pickle.dump({'fingerprint': fingerprint, 'counter': counter},
+                    open('gg_stoplist.pickle', 'wb'))
+
+    for w in counter.most_common(gg_most_common):
+        greek_stopwords.append(w[0])
     print('Done Counting')
-    return greek_stopwords, words
+    return greek_stopwords, counter
 
 
-def display_components(graph_lda):
-    print('\nBreadth first Search for Connected Components for Latent Dirichlet Allocation')
+def display_components(graph_lda, indices):
+    print('\nConnected Components for Latent Dirichlet Allocation')
     cc_lda = connected_components(graph_lda)
     print(cc_lda)
     print('Statutes')
@@ -159,16 +181,19 @@ def display_components(graph_lda):
         print([codifier.codifier.laws[indices[d]] for d in c])
 
 
-def build_topics(use_spacy=True):
+def build_topics(use_spacy=True, n_components=100, no_features=1000, max_iter=10):
+    """Fit the topic model and write the topics collection
+    :params n_components : Number of topics
+    :params no_features : Size of the vocabulary
+    :params max_iter : Iterations of LDA (see topic_sweep.py to choose them)
+    """
     greek_stopwords = build_greek_stoplist()
     data_samples, indices = build_data_samples(use_spacy=use_spacy)
-    greek_stopwords, words = build_gg_stoplist(data_samples, greek_stopwords)
+    greek_stopwords, counter = build_gg_stoplist(data_samples, greek_stopwords)
 
     # Initial Parameters
-    no_features = 1000  # Number of features
     n_samples = len(data_samples)  # Len of data samples
     no_top_words = 100  # Number of top words in each topic
-    n_components = 100  # Number of topics
     # How many correlations under each topic
     no_top_data_samples = math.ceil(n_samples / n_components)
 
@@ -179,15 +204,16 @@ def build_topics(use_spacy=True):
         min_df=2,
         max_features=no_features,
         stop_words=greek_stopwords)
+    # The lemmatized texts are cached, so the second pass is cheap
     tf = tf_vectorizer.fit_transform(data_samples)
-    tf_feature_names = tf_vectorizer.get_feature_names()
+    tf_feature_names = feature_names(tf_vectorizer)
 
     lda_model = LatentDirichletAllocation(n_components=n_components,
-                                          max_iter=10,
+                                          max_iter=max_iter,
                                           learning_method='online',
                                           learning_offset=50.,
                                           verbose=1,
-                                          n_jobs=cpu_count() - 1,
+                                          n_jobs=max(1, cpu_count() - 1),
                                           random_state=0)
     lda_model.fit(tf)
 
@@ -196,7 +222,7 @@ def build_topics(use_spacy=True):
     lda_W = lda_model.transform(tf)
     lda_H = lda_model.components_
 
-    graph_lda, topics, top_doc_indices = process_topics(
+    graph_lda, topics, memberships = process_topics(
         lda_H,
         lda_W,
         tf_feature_names,
@@ -208,7 +234,115 @@ def build_topics(use_spacy=True):
     pickle.dump(lda_model, open('lda_model.pickle', 'wb'))
     pickle.dump(tf, open('tf.pickle', 'wb'))
 
+    identifiers = [indices[i] for i in range(n_samples)]
+    lemmatizer = data_samples.lemmatizer
+    pickle.dump({
+        'vectorizer': tf_vectorizer,
+        'lda_model': lda_model,
+        'tf': tf,
+        'W': lda_W,
+        'memberships': memberships,
+        'identifiers': identifiers,
+        'keys': {x: lemmatizer.key(law) for x, law in law_cache.stream(codifier.codifier.laws, identifiers)},
+        'no_top_words': no_top_words,
+        'topics': topics
+    }, open(TOPIC_STATE_FILE, 'wb'))
+
+
+def update_topics(use_spacy=True, identifiers=None):
+    """Update the topics with new, modified or removed laws instead of
+    refitting. The vocabulary and the model fitted by build_topics are
+    reused: the model is updated with partial_fit on the changed laws
+    only, only their topic memberships are recomputed, the rows of laws
+    removed from the codifier are dropped and only the topics whose
+    keywords or statutes changed are written.
+    :params identifiers : Laws to check for changes (default all)
+    """
+    try:
+        state = pickle.load(open(TOPIC_STATE_FILE, 'rb'))
+    except BaseException:
+        print('No fitted topic model, building topics from scratch')
+        return build_topics(use_spacy=use_spacy)
+
+    laws = codifier.codifier.laws
+    lemmatizer = get_lemmatizer(use_spacy)
+    if identifiers is None:
+        identifiers = list(laws.keys())
+
+    # A law changed if the hash of its text differs from the last run
+    keys = {x: lemmatizer.key(law)
+            for x, law in law_cache.stream(laws, [x for x in identifiers if x in laws])}
+    changed = [x for x in keys if state['keys'].get(x) != keys[x]]
+    removed = [x for x in state['identifiers'] if x not in laws]
+    if changed == [] and removed == []:
+        print('Topics are up to date')
+        return
+    print('Updating topics with {} laws, removing {}'.format(
+        len(changed), len(removed)))
+
+    lda_model = state['lda_model']
+    tf = state['tf']
+    W = state['W']
+
+    # Drop the rows of removed laws
+    if removed != []:
+        removed = set(removed)
+        keep = [i for i, x in enumerate(state['identifiers']) if x not in removed]
+        tf = tf[keep]
+        W = W[keep]
+        state['identifiers'] = [state['identifiers'][i] for i in keep]
+        for x in removed:
+            state['keys'].pop(x, None)
+
+    # Replace the rows of modified laws and append new laws
+    if changed != []:
+        data_samples = lemmatize.LemmatizedCorpus(lemmatizer, laws, changed)
+        tf_changed = state['vectorizer'].transform(data_samples)
+        lda_model.partial_fit(tf_changed)
+        W_changed = lda_model.transform(tf_changed)
+
+        rows = {x: i for i, x in enumerate(state['identifiers'])}
+        tf = tf.tolil()
+        new = []
+        for i, x in enumerate(changed):
+            state['keys'][x] = keys[x]
+            if x in rows:
+                tf[rows[x], :] = tf_changed[i].toarray()
+                W[rows[x]] = W_changed[i]
+            else:
+                new.append(i)
+                state['identifiers'].append(x)
+        tf = tf.tocsr()
+        if new != []:
+            tf = scipy.sparse.vstack([tf, tf_changed[new]]).tocsr()
+            W = np.vstack([W, W_changed[new]])
+
+    # Upsert the topics that changed
+    indices = dict(enumerate(state['identifiers']))
+    no_top_data_samples = math.ceil(len(indices) / lda_model.n_components)
+    topics = topic_documents(
+        lda_model.components_,
+        W,
+        feature_names(state['vectorizer']),
+        indices,
+        state['no_top_words'],
+        no_top_data_samples)
+    memberships = topic_memberships(top_documents(W, no_top_data_samples), W.shape[0])
+    updated = 0
+    for topic_idx, s in topics.items():
+        if state['topics'].get(topic_idx) != s:
+            db.topics.save(s)
+            updated += 1
+    print('Updated {} of {} topics'.format(updated, len(topics)))
+
+    state.update(tf=tf, W=W, memberships=memberships, topics=topics, lda_model=lda_model)
+    pickle.dump(lda_model, open('lda_model.pickle', 'wb'))
+    pickle.dump(tf, open('tf.pickle', 'wb'))
+    pickle.dump(state, open(TOPIC_STATE_FILE, 'wb'))
 
 if __name__ == '__main__':
     use_spacy = '--spacy' in sys.argv[1:]
-    build_topics(use_spacy=use_spacy)
+    if '--update' in sys.argv[1:]:
+        update_topics(use_spacy=use_spacy)
+    else:
+        build_topics(use_spacy=use_spacy)
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+'''
+    Hyperparameter sweep for the topic model.
+    The laws are lemmatized and counted once and the count matrix is
+    cached as a sparse .npz file, with the vocabulary, the fingerprint
+    of the laws and the requested vocabulary size in a .json file next
+    to it. LDA and NMF models are then fitted in parallel over a grid of
+    parameters on the cached counts, recording the wall time of every
+    fit and the perplexity of LDA on held out laws (NMF reports
+    its reconstruction error), so that a model that is cheap to refit
+    nightly can be chosen for topic_models.build_topics. Perplexities
+    are only comparable between fits with the same vocabulary size.
+
+    usage: topic_sweep.py counts [--report report.csv] [--processes n]
+        [--models lda nmf] [--n-components 50 100] [--no-features 1000 2000]
+        [--max-iter 5 10] [--spacy]
+    counts is the path of the cached matrix without extension. It is
+    built from the codifier if it does not exist, if any law changed
+    since it was built or if it was built with a different vocabulary
+    size than the largest of --no-features.
+'''
+
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import time
+import numpy as np
+import scipy.sparse
+
+# Default grid
+DEFAULT_GRID = {
+    'model': ['lda', 'nmf'],
+    'n_components': [50, 100],
+    'no_features': [1000, 2000],
+    'max_iter': [5, 10]
+}
+
+# Fraction of laws held out to compute perplexity
+HELD_OUT = 0.1
+
+REPORT_FIELDS = ['model', 'n_components', 'no_features', 'max_iter',
+                 'fit_time', 'perplexity', 'reconstruction_err']
+
+
+def counts_paths(path):
+    return path + '.npz', path + '.json'
+
+
+def cache_counts(data_samples, path, no_features, stop_words=None, fingerprint=None):
+    """Count the words of the data samples and save the matrix
+    :params data_samples : Iterable of lemmatized texts
+    :params path : Path of the cache without extension
+    :params no_features : Size of the vocabulary, the largest of the grid
+    :params stop_words : Words to ignore
+    :params fingerprint : Fingerprint of the laws (see LemmatizedCorpus)
+    """
+    # Import here for performance
+    from sklearn.feature_extraction.text import CountVectorizer
+
+    vectorizer = CountVectorizer(
+        max_df=0.95,
+        min_df=2,
+        max_features=no_features,
+        stop_words=stop_words)
+    tf = vectorizer.fit_transform(data_samples)
+    feature_names = sorted(vectorizer.vocabulary_, key=vectorizer.vocabulary_.get)
+
+    matrix, vocabulary = counts_paths(path)
+    scipy.sparse.save_npz(matrix, tf.tocsr())
+    with open(vocabulary, 'w') as f:
+        json.dump({
+            'fingerprint': fingerprint,
+            'no_features': no_features,
+            'feature_names': feature_names
+        }, f, ensure_ascii=False)
+    return tf, feature_names
+
+
+def load_counts(path):
+    """Return the cached count matrix and vocabulary"""
+    matrix, vocabulary = counts_paths(path)
+    with open(vocabulary) as f:
+        feature_names = json.load(f)['feature_names']
+    return scipy.sparse.load_npz(matrix).tocsr(), feature_names
+
+
+def counts_are_current(path, fingerprint, no_features):
+    """Returns True if the cached counts were built from the laws with
+    this fingerprint and with a vocabulary of no_features words"""
+    matrix, vocabulary = counts_paths(path)
+    if not os.path.exists(matrix):
+        return False
+    try:
+        with open(vocabulary) as f:
+            metadata = json.load(f)
+        return (metadata['fingerprint'], metadata['no_features']) == (fingerprint, no_features)
+    except (OSError, ValueError, TypeError, KeyError):
+        return False
+
+
+def select_features(tf, no_features):
+    """Keep the no_features most frequent words, as CountVectorizer
+    with max_features would"""
+    if no_features >= tf.shape[1]:
+        return tf
+    frequencies = np.asarray(tf.sum(axis=0)).ravel()
+    columns = np.sort(np.argsort(-frequencies, kind='mergesort')[:no_features])
+    return tf[:, columns]
+
+
+def split_counts(tf, held_out=HELD_OUT, seed=0):
+    """Split the rows of the count matrix in train and held out laws"""
+    rows = np.random.RandomState(seed).permutation(tf.shape[0])
+    n = int(round(tf.shape[0] * held_out))
+    return tf[rows[n:]], tf[rows[:n]]
+
+
+def parameter_grid(grid):
+    """Return every combination of the values of a grid as dicts"""
+    combinations = [{}]
+    for key in sorted(grid):
+        combinations = [dict(c, **{key: v}) for c in combinations for v in grid[key]]
+    return combinations
+
+
+# Count matrix of a sweep process, set by init_worker
+_counts = None
+
+
+def init_worker(path, held_out):
+    global _counts
+    tf, _ = load_counts(path)
+    _counts = split_counts(tf, held_out)
+
+
+def fit(params):
+    """Fit a model with a point of the grid on the cached counts
+    :returns params with the wall time and the scores of the fit
+    """
+    # Import here for performance
+    from sklearn.decomposition import NMF, LatentDirichletAllocation
+
+    train, test = (select_features(x, params['no_features']) for x in _counts)
+    if params['model'] == 'lda':
+        model = LatentDirichletAllocation(
+            n_components=params['n_components'],
+            max_iter=params['max_iter'],
+            learning_method='online',
+            learning_offset=50.,
+            n_jobs=1,
+            random_state=0)
+    elif params['model'] == 'nmf':
+        model = NMF(
+            n_components=params['n_components'],
+            max_iter=params['max_iter'],
+            init='nndsvd',
+            random_state=0)
+    else:
+        raise Exception('Unrecognized model')
+
+    start = time.time()
+    model.fit(train)
+    result = dict(params, fit_time=time.time() - start,
+                  perplexity=None, reconstruction_err=None)
+
+    if params['model'] == 'lda':
+        result['perplexity'] = model.perplexity(test if test.shape[0] > 0 else train)
+    else:
+        result['reconstruction_err'] = model.reconstruction_err_
+    return result
+
+
+def sweep(path, grid=None, processes=None, held_out=HELD_OUT):
+    """Fit every point of a grid on the cached counts in parallel
+    :params path : Path of the cached counts (see cache_counts)
+    :params grid : Dict from parameter to list of values (default DEFAULT_GRID)
+    :params processes : Number of processes (default number of cores - 1)
+    :returns List of results sorted by model and fit time
+    """
+    if grid is None:
+        grid = DEFAULT_GRID
+    if processes is None:
+        processes = max(1, multiprocessing.cpu_count() - 1)
+
+    points = parameter_grid(grid)
+    if processes == 1:
+        init_worker(path, held_out)
+        results = [fit(p) for p in points]
+    else:
+        with multiprocessing.Pool(processes, initializer=init_worker,
+                                  initargs=(path, held_out)) as pool:
+            results = pool.map(fit, points, chunksize=1)
+
+    results.sort(key=lambda x: (x['model'], x['fit_time']))
+    return results
+
+
+def write_report(results, report):
+    with open(report, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+        writer.writeheader()
+        writer.writerows(results)
+
+
+def print_report(results):
+    print('{:<6}{:>8}{:>10}{:>6}{:>10}{:>14}{:>14}'.format(
+        'model', 'topics', 'features', 'iter', 'time', 'perplexity', 'error'))
+    for r in results:
+        print('{:<6}{:>8}{:>10}{:>6}{:>9.1f}s{:>14}{:>14}'.format(
+            r['model'], r['n_components'], r['no_features'], r['max_iter'], r['fit_time'],
+            '' if r['perplexity'] is None else '{:.1f}'.format(r['perplexity']),
+            '' if r['reconstruction_err'] is None else '{:.1f}'.format(r['reconstruction_err'])))
+
+
+def build_counts(path, no_features, use_spacy=True):
+    """Lemmatize the laws of the codifier and cache their counts,
+    unless the cached counts are current"""
+    # Import here for performance
+    import topic_models
+
+    data_samples, indices = topic_models.build_data_samples(use_spacy=use_spacy)
+    fingerprint = data_samples.fingerprint()
+    if counts_are_current(path, fingerprint, no_features):
+        return load_counts(path)
+
+    print('Counting words')
+    greek_stopwords = topic_models.build_greek_stoplist()
+    greek_stopwords, counter = topic_models.build_gg_stoplist(data_samples, greek_stopwords)
+    return cache_counts(data_samples, path, no_features, greek_stopwords, fingerprint)
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(description='Topic model hyperparameter sweep')
+    argparser.add_argument('counts', help='Cached count matrix without extension')
+    argparser.add_argument('--report', default='topic_sweep.csv')
+    argparser.add_argument('--processes', type=int)
+    argparser.add_argument('--models', nargs='+', default=DEFAULT_GRID['model'])
+    argparser.add_argument('--n-components', nargs='+', type=int, default=DEFAULT_GRID['n_components'])
+    argparser.add_argument('--no-features', nargs='+', type=int, default=DEFAULT_GRID['no_features'])
+    argparser.add_argument('--max-iter', nargs='+', type=int, default=DEFAULT_GRID['max_iter'])
+    argparser.add_argument('--spacy', action='store_true')
+    args = argparser.parse_args()
+
+    grid = {
+        'model': args.models,
+        'n_components': args.n_components,
+        'no_features': args.no_features,
+        'max_iter': args.max_iter
+    }
+
+    build_counts(args.counts, max(args.no_features), args.spacy)
+
+    results = sweep(args.counts, grid, args.processes)
+    write_report(results, args.report)
+    print_report(results)
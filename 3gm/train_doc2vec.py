@@ -1,23 +1,24 @@
 #!/usr/bin/env python3
-# Train word2vec model and (optioanallly) create document embeddings for the dataset
-# usage: train_doc2vec.py corpus.txt model.bin labels.txt --tokenize
+# Train doc2vec model on a corpus exported with LawCodifier.export_codifier_corpus
+# usage: train_doc2vec.py corpus.txt model.bin labels.txt [--tokenize] [--corpus-file] [--mmap]
+# --tokenize : Tokenize with tokenizer.tokenizer instead of splitting on whitespace
+# --corpus-file : Train in corpus_file mode (gensim >= 3.6), which scales to all cores.
+#   Documents are tagged with their line number and the labels are stored in model.bin.labels
+# --mmap : Read the corpus through a memory map
+# The tokenized corpus is written to model.bin.corpus
 
+import gensim
 import gensim.models as g
+import argparse
 import logging
+import resource
+import shutil
 import sys
+import time
 sys.path.insert(0, '../')
-import tokenizer
-from gensim.models.doc2vec import TaggedDocument
+import corpus
 from multiprocessing import cpu_count
 
-# document cleanup
-def nlp_clean(data):
-	new_data = []
-	for d in data:
-		new_str = d.lower().strip()
-		dlist = tokenizer.tokenizer.split(d, delimiter=' ')
-		yield dlist
-
 #doc2vec parameters
 vector_size = 150
 window_size = 8
@@ -26,38 +27,83 @@ sampling_threshold = 1e-5
 negative_size = 5
 train_epoch = 50
 dm = 0 #0 = dbow; 1 = dmpv
-worker_count = cpu_count() - 1
-tokenize = '--tokenize' in sys.argv
+worker_count = max(1, cpu_count() - 1)
+
+def gensim_version():
+	return tuple(int(x) for x in gensim.__version__.split('.')[:2])
+
+def doc2vec_params(**kwargs):
+	"""Doc2Vec parameters in the naming of the installed gensim"""
+	params = {
+		'size': vector_size,
+		'window': window_size,
+		'min_count': min_count,
+		'sample': sampling_threshold,
+		'workers': worker_count,
+		'hs': 0,
+		'dm': dm,
+		'negative': negative_size,
+		'dbow_words': 1,
+		'dm_concat': 1,
+		'iter': train_epoch
+	}
+	params.update(kwargs)
+
+	if gensim_version() >= (4, 0):
+		params['vector_size'] = params.pop('size')
+		params['epochs'] = params.pop('iter')
 
-#input corpus
-train_corpus = sys.argv[1]
+	return params
 
-#output model
-saved_path = sys.argv[2]
+def train(train_corpus, saved_path, labels_file, tokenize=False, corpus_file=False, use_mmap=False, **kwargs):
+	"""Train and save a doc2vec model
+	:params train_corpus : Corpus with one document per line
+	:params saved_path : Output model
+	:params labels_file : Tag of each document
+	:params tokenize : See corpus.clean
+	:params corpus_file : Train in corpus_file mode
+	:params use_mmap : Read the corpus through a memory map
+	:params kwargs : Override doc2vec parameters
+	"""
+	params = doc2vec_params(**kwargs)
+	tagged = corpus.TaggedCorpus(train_corpus, labels_file, tokenize=tokenize, use_mmap=use_mmap)
 
-#labels
-labels_file = sys.argv[3]
+	if corpus_file and gensim_version() < (3, 6):
+		logging.warning('corpus_file mode requires gensim >= 3.6, streaming the corpus instead')
+		corpus_file = False
 
-with open(labels_file, 'r') as f:
-	labels = f.read().splitlines()
+	start = time.time()
 
-#enable logging
-logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.INFO)
+	# Tokenize once instead of once per epoch
+	tokenized = saved_path + '.corpus'
+	tagged.write_corpus_file(tokenized)
 
-taggeddocs = []
+	if corpus_file:
+		model = g.Doc2Vec(corpus_file=tokenized, **params)
+		shutil.copyfile(labels_file, saved_path + '.labels')
+	else:
+		tagged = corpus.TaggedCorpus(tokenized, labels_file, tokenize=False, use_mmap=use_mmap)
+		model = g.Doc2Vec(tagged, **params)
 
-with open(train_corpus, 'r') as f:
-	docs = f.read().splitlines()
+	logging.info('Training took {:.1f}s, peak memory {:.1f}MiB'.format(
+		time.time() - start,
+		resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
 
-if tokenize:
-	docs = nlp_clean(docs)
+	#save model
+	model.save(saved_path)
+	return model
 
-for label, doc in zip(labels, docs):
-	td = TaggedDocument(words=tokenizer.tokenizer.split(doc.lower(), delimiter=' '), tags=[label])
-	#print(td)
-	taggeddocs.append(td)
+if __name__ == '__main__':
+	argparser = argparse.ArgumentParser(description='Train doc2vec model')
+	argparser.add_argument('corpus', help='Corpus with one document per line')
+	argparser.add_argument('model', help='Output model')
+	argparser.add_argument('labels', help='Labels of the documents')
+	argparser.add_argument('--tokenize', action='store_true')
+	argparser.add_argument('--corpus-file', action='store_true')
+	argparser.add_argument('--mmap', action='store_true')
+	args = argparser.parse_args()
 
-model = g.Doc2Vec(taggeddocs, size=vector_size, window=window_size, min_count=min_count, sample=sampling_threshold, workers=worker_count, hs=0, dm=dm, negative=negative_size, dbow_words=1, dm_concat=1, pretrained_emb=None, iter=train_epoch)
+	#enable logging
+	logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.INFO)
 
-#save model
-model.save(saved_path)
+	train(args.corpus, args.model, args.labels, args.tokenize, args.corpus_file, args.mmap)
@@ -1,12 +1,14 @@
 #!/usr/bin/env python3
-# usage built_pipeline.py laws links topics versions
+# usage built_pipeline.py laws links topics versions indexes search
 import os
 import sys
 pipeline_depth = {
     'laws' : 0,
     'links' : 1,
     'topics' : 2,
-    'versions' : 3
+    'versions' : 3,
+    'indexes' : 4,
+    'search' : 5
 }
 
 # data dir